@@ -0,0 +1,111 @@
+"""
+Throughput of bulk crop recommendation for district-level planning.
+
+Scores synthetic plots (100k by default) four ways:
+  per-request  the original path: one predict_proba + full argsort per plot
+               (timed on a subsample and extrapolated)
+  chunked      recommend_crops over CROP_BATCH_CHUNK_SIZE chunks in-process
+  csv / json   POST /crop/predict/batch end to end (parse, score, NDJSON)
+and compares full argsort with argpartition top-k selection on the
+probability matrix.
+
+Usage (from the Backend directory, with the model file present):
+    python benchmarks/crop_batch.py [--rows 100000] [--top-k 5]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Typical ranges of the crop recommendation training data
+FEATURE_RANGES = {
+    "N": (0, 140), "P": (5, 145), "K": (5, 205), "temperature": (8, 44),
+    "humidity": (14, 100), "ph": (3.5, 9.9), "rainfall": (20, 300)
+}
+
+
+def synthetic_plots(rows: int):
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    return np.column_stack([rng.uniform(low, high, rows) for low, high in FEATURE_RANGES.values()])
+
+
+async def post_batch(app, body: bytes, content_type: str, top_k: int) -> int:
+    import httpx
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+        response = await client.post(f"/crop/predict/batch?top_k={top_k}", content=body,
+                                     headers={"content-type": content_type})
+        response.raise_for_status()
+        return sum(1 for line in response.text.splitlines() if json.loads(line)["status"] == "success")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--legacy-sample", type=int, default=300, help="Plots timed on the per-request path")
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(BACKEND_DIR)
+    import numpy as np
+    from fastapi import FastAPI
+    from routes import crop_recommendation
+    from utils.model_registry import model_registry
+
+    model_registry.load_now("crop_recommendation")
+    model = crop_recommendation.model
+    names = list(crop_recommendation.crop_features.names)
+    X = synthetic_plots(args.rows)
+    results = []
+
+    start = time.perf_counter()
+    for row in X[:args.legacy_sample]:
+        probabilities = model.predict_proba(row[None, :])[0]
+        probabilities.argsort()[-args.top_k:][::-1]
+    per_row = (time.perf_counter() - start) / args.legacy_sample
+    results.append(("per-request (extrapolated)", per_row * args.rows))
+
+    chunk_size = crop_recommendation.CROP_BATCH_CHUNK_SIZE
+    start = time.perf_counter()
+    for offset in range(0, args.rows, chunk_size):
+        crop_recommendation.recommend_crops(X[offset:offset + chunk_size], args.top_k)
+    results.append((f"chunked in-process ({chunk_size}/chunk)", time.perf_counter() - start))
+
+    app = FastAPI()
+    app.include_router(crop_recommendation.router)
+    csv_body = (",".join(names) + "\n" + "\n".join(",".join(f"{v:.3f}" for v in row) for row in X)).encode()
+    json_body = json.dumps([dict(zip(names, row)) for row in X.tolist()]).encode()
+    for label, body, content_type in (("POST batch, CSV body", csv_body, "text/csv"),
+                                      ("POST batch, JSON body", json_body, "application/json")):
+        start = time.perf_counter()
+        scored = asyncio.run(post_batch(app, body, content_type, args.top_k))
+        assert scored == args.rows, f"{label}: only {scored} of {args.rows} rows scored"
+        results.append((label, time.perf_counter() - start))
+
+    probabilities = np.concatenate([
+        model.predict_proba(X[offset:offset + chunk_size]) for offset in range(0, min(args.rows, 20000), chunk_size)
+    ])
+    start = time.perf_counter()
+    np.argsort(probabilities, axis=1)[:, -args.top_k:][:, ::-1]
+    full_sort = time.perf_counter() - start
+    start = time.perf_counter()
+    crop_recommendation.top_k_classes(probabilities, args.top_k)
+    partial_sort = time.perf_counter() - start
+
+    print(f"{args.rows} plots, top_k={args.top_k}, model backend: {crop_recommendation.model_backend(model)}")
+    print(f"{'path':<34} {'seconds':>9} {'rows/s':>10}")
+    for label, seconds in results:
+        print(f"{label:<34} {seconds:>9.2f} {args.rows / seconds:>10.0f}")
+    print(f"\ntop-k selection on {len(probabilities)} x {probabilities.shape[1]} probabilities: "
+          f"argsort {full_sort * 1000:.1f} ms, argpartition {partial_sort * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Peak RSS and latency of plant image ingestion paths for large phone photos.
+
+Compares the original base64 JSON path (base64 decode -> full-resolution PIL
+decode -> np.array -> A.Resize -> predict_image) with the raw binary path
+(/plant/predict/raw: body bytes -> JPEG draft decode -> preprocess -> forward).
+
+Each path runs in a fresh subprocess so peak RSS is not shared between them.
+
+Usage (from the Backend directory, with the model files present):
+    python benchmarks/plant_ingest.py [--image photo.jpg] [--iterations 20]
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_phone_photo(width: int = 4000, height: int = 3000) -> bytes:
+    """Synthesize a ~12 MP JPEG with enough texture to be a realistic decode workload"""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([
+        (x * 255 // width),
+        (y * 255 // height),
+        ((x + y) * 255 // (width + height))
+    ], axis=-1).astype(np.uint8)
+    noise = rng.integers(0, 40, size=base.shape, dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(base + noise).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_child(mode: str, image_path: str, iterations: int):
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(BACKEND_DIR)
+    from PIL import Image
+    from routes import plant_disease
+    from utils.model_registry import model_registry
+
+    model_registry.load_now("plant_disease")
+
+    with open(image_path, "rb") as f:
+        payload = f.read()
+    encoded = base64.b64encode(payload).decode("ascii")
+
+    # Warm up the model on a small image so the baseline excludes one-off allocations
+    plant_disease.predict_image(Image.new("RGB", (plant_disease.INPUT_SIZE, plant_disease.INPUT_SIZE)))
+    baseline_rss = max_rss_mb()
+
+    def legacy():
+        image = Image.open(io.BytesIO(base64.b64decode(encoded))).convert("RGB")
+        return plant_disease.predict_image(image)
+
+    def raw():
+        tensor = plant_disease.decode_image_tensor(payload, draft=True)
+        return plant_disease.predict_batch([tensor])[0]
+
+    run = legacy if mode == "legacy" else raw
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        run()
+        latencies.append((time.perf_counter() - start) * 1000.0)
+
+    latencies.sort()
+    print(json.dumps({
+        "mode": mode,
+        "iterations": iterations,
+        "latency_ms_median": statistics.median(latencies),
+        "latency_ms_p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "peak_rss_mb": max_rss_mb(),
+        "peak_rss_over_baseline_mb": max_rss_mb() - baseline_rss
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", help="JPEG to use instead of a synthetic 12 MP photo")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--child", choices=["legacy", "raw"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.image, args.iterations)
+        return
+
+    image_path = args.image
+    if image_path is None:
+        image_path = os.path.join(tempfile.gettempdir(), "krishimitra_phone_photo_12mp.jpg")
+        if not os.path.exists(image_path):
+            with open(image_path, "wb") as f:
+                f.write(make_phone_photo())
+    image_path = os.path.abspath(image_path)
+
+    print(f"Image: {image_path} ({os.path.getsize(image_path) / 1e6:.1f} MB)")
+    print(f"{'path':<8} {'median ms':>10} {'p95 ms':>10} {'peak RSS MB':>12} {'over base MB':>13}")
+    for mode in ("legacy", "raw"):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", mode,
+             "--image", image_path, "--iterations", str(args.iterations)],
+            check=True, capture_output=True, text=True
+        ).stdout.strip().splitlines()[-1]
+        result = json.loads(output)
+        print(f"{mode:<8} {result['latency_ms_median']:>10.1f} {result['latency_ms_p95']:>10.1f} "
+              f"{result['peak_rss_mb']:>12.1f} {result['peak_rss_over_baseline_mb']:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Per-request latency of single-sample soil health and crop recommendation
+scoring: the original pandas path vs the NumPy fast path.
+
+legacy: dict -> pd.DataFrame([...]) -> column select -> models fitted with
+        feature names (names re-validated on every call)
+fast:   validated pydantic input -> preallocated (1, n) float64 row ->
+        models whose feature names were checked and dropped at load time
+
+Also reports the one-off cost of importing pandas, which the fast path keeps
+out of server cold start.
+
+Usage (from the Backend directory, with the model files present):
+    python benchmarks/tabular_single_sample.py [--iterations 2000]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(fn, iterations: int):
+    for _ in range(min(50, iterations)):
+        fn()
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1e6)
+    latencies.sort()
+    return statistics.median(latencies), latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+
+def pandas_import_ms() -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", "import time; s = time.perf_counter(); import pandas; print(time.perf_counter() - s)"],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return float(output) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    import_ms = pandas_import_ms()
+
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(BACKEND_DIR)
+    import joblib
+    import pandas as pd
+    from routes import crop_recommendation, soil_health
+    from utils.model_registry import model_registry
+
+    model_registry.load_now("soil_health")
+    model_registry.load_now("crop_recommendation")
+
+    # Untouched copies of the fitted models for the original DataFrame path
+    legacy_scaler = joblib.load(os.path.join(soil_health.SHI_MODEL_DIR, "feature_scaler.joblib"))
+    legacy_crop_model = joblib.load(crop_recommendation.MODEL_PATH)
+
+    soil_input = soil_health.SoilDataInput(**{
+        name: field.json_schema_extra["example"] for name, field in soil_health.SoilDataInput.model_fields.items()
+    })
+    crop_input = crop_recommendation.CropInput(N=90, P=42, K=43, temperature=20.9, humidity=82.0, ph=6.5, rainfall=202.9)
+
+    def soil_legacy():
+        frame = pd.DataFrame([soil_input.model_dump()])[soil_health.feature_cols]
+        scaled = legacy_scaler.transform(frame)
+        soil_health.health_model.predict(scaled)
+        soil_health.issues_model.predict(scaled)
+
+    def soil_fast():
+        scaled = soil_health.scaler.transform(soil_health.soil_features.pack(soil_input))
+        soil_health.health_model.predict(scaled)
+        soil_health.issues_model.predict(scaled)
+
+    def crop_legacy():
+        legacy_crop_model.predict_proba(pd.DataFrame([crop_input.model_dump()]))
+
+    def crop_fast():
+        crop_recommendation.model.predict_proba(crop_recommendation.crop_features.pack(crop_input))
+
+    def pack_legacy():
+        pd.DataFrame([soil_input.model_dump()])[soil_health.feature_cols]
+
+    def pack_fast():
+        soil_health.soil_features.pack(soil_input)
+
+    print(f"pandas import (cold start cost avoided): {import_ms:.0f} ms")
+    print(f"{'case':<22} {'legacy med us':>14} {'fast med us':>12} {'legacy p95':>11} {'fast p95':>9} {'speedup':>8}")
+    cases = [
+        ("input packing only", pack_legacy, pack_fast),
+        ("soil health request", soil_legacy, soil_fast),
+        ("crop request", crop_legacy, crop_fast)
+    ]
+    for name, legacy, fast in cases:
+        legacy_median, legacy_p95 = measure(legacy, args.iterations)
+        fast_median, fast_p95 = measure(fast, args.iterations)
+        print(f"{name:<22} {legacy_median:>14.1f} {fast_median:>12.1f} {legacy_p95:>11.1f} {fast_p95:>9.1f} "
+              f"{legacy_median / fast_median:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
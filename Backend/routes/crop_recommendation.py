@@ -1,11 +1,21 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from pydantic import BaseModel, Field
 import joblib
-import pandas as pd
+import numpy as np
 import os
-from typing import List
+import threading
+import uuid
+from typing import Dict, List
 from datetime import datetime
 
+from utils.features import FeatureVector, verify_feature_names
+from utils.model_registry import model_registry
+from utils.metrics import registry
+from utils.tree_compiler import compile_model, model_backend
+from utils.streaming import ndjson_response
+from utils.tabular_upload import read_tabular_chunks, stream_scored_rows
+from utils.suitability import SUITABILITY_TILE_SIZE, SuitabilityError, check_inputs, run_suitability_job
+
 router = APIRouter(
     prefix="/crop",
     tags=["crop_recommendation"]
@@ -20,32 +30,29 @@ model = None
 def load_model():
     """Load the crop recommendation model."""
     global model
-    try:
-        if not os.path.exists(MODEL_PATH):
-            raise FileNotFoundError(f"Model file not found: {MODEL_PATH}")
-            
-        model = joblib.load(MODEL_PATH)
-        print("Successfully loaded crop recommendation model")
-        return True
-    except Exception as e:
-        print(f"Error loading crop recommendation model: {str(e)}")
-        return False
+    if not os.path.exists(MODEL_PATH):
+        raise FileNotFoundError(f"Model file not found: {MODEL_PATH}")
+        
+    loaded = joblib.load(MODEL_PATH)
+    # Check column order once so predictions can pass plain arrays
+    verify_feature_names(loaded, crop_features.names, "Crop recommendation model")
+    # Swap in flat-array tree evaluation where it matches sklearn exactly
+    model = compile_model(loaded, "Crop recommendation model")
+    print("Successfully loaded crop recommendation model")
+
+def warmup_model():
+    """Score one neutral sample so first-request setup costs are paid up front."""
+    model.predict_proba(crop_features.pack({name: 0.0 for name in crop_features.names}))
 
-# Try to load model at startup
-model_loaded = load_model()
+# Model is loaded in the background at startup
+model_registry.register("crop_recommendation", load_model, warmup=warmup_model)
 
 def ensure_model_loaded():
     """Ensure model is loaded before making predictions."""
-    global model_loaded
-    if not model_loaded or model is None:
-        if load_model():
-            model_loaded = True
-            return True
-        raise HTTPException(
-            status_code=503,
-            detail="Crop recommendation model not loaded. Please ensure model file is present and try again."
-        )
-    return True
+    return model_registry.ensure_ready(
+        "crop_recommendation",
+        detail="Crop recommendation model not loaded. Please ensure model file is present and try again."
+    )
 
 # Define input data model
 class CropInput(BaseModel):
@@ -57,6 +64,11 @@ class CropInput(BaseModel):
     ph: float = Field(..., description="pH value of soil")
     rainfall: float = Field(..., description="Annual rainfall in mm")
 
+# Model input columns, in CropInput field order
+crop_features = FeatureVector(CropInput.model_fields)
+
+crop_predict_latency = registry.timer("crop_predict_seconds", "Crop recommendation latency per request")
+
 # Define output model
 class CropRecommendation(BaseModel):
     crop: str
@@ -66,27 +78,51 @@ class CropResponse(BaseModel):
     recommendations: List[CropRecommendation]
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
+def top_k_classes(probabilities: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k most probable classes per row, most probable first (partial sort)."""
+    n_classes = probabilities.shape[1]
+    k = min(k, n_classes)
+    candidates = np.argpartition(probabilities, n_classes - k, axis=1)[:, n_classes - k:]
+    order = np.argsort(np.take_along_axis(probabilities, candidates, axis=1), axis=1)[:, ::-1]
+    return np.take_along_axis(candidates, order, axis=1)
+
+def recommend_crops(features: np.ndarray, top_k: int) -> List[dict]:
+    """CropResponse-shaped results for every row of a (n, len(CropInput fields)) array."""
+    probabilities = model.predict_proba(features)
+    indices = top_k_classes(probabilities, top_k)
+    crops = model.classes_[indices].tolist()
+    scores = np.take_along_axis(probabilities, indices, axis=1).tolist()
+    timestamp = datetime.utcnow().isoformat()
+    return [
+        {
+            "recommendations": [
+                {"crop": crop, "confidence_score": score}
+                for crop, score in zip(row_crops, row_scores)
+            ],
+            "timestamp": timestamp
+        }
+        for row_crops, row_scores in zip(crops, scores)
+    ]
+
 @router.post("/predict", response_model=CropResponse)
-async def predict_crop(data: CropInput):
+async def predict_crop(data: CropInput, top_k: int = Query(5, ge=1)):
     ensure_model_loaded()
     try:
-        # Convert input to DataFrame
-        input_data = pd.DataFrame([data.dict()])
-        
-        # Get prediction probabilities for all crops
-        probabilities = model.predict_proba(input_data)[0]
-        
-        # Get indices of top 5 predictions
-        top_5_indices = probabilities.argsort()[-5:][::-1]
-        
-        # Create recommendations list
-        recommendations = [
-            CropRecommendation(
-                crop=model.classes_[idx],
-                confidence_score=float(probabilities[idx])
-            )
-            for idx in top_5_indices
-        ]
+        with crop_predict_latency.timer():
+            # Pack input straight into the model's column order
+            input_data = crop_features.pack(data)
+            
+            # Get prediction probabilities for all crops
+            probabilities = model.predict_proba(input_data)
+            
+            # Create recommendations list from the top-k predictions
+            recommendations = [
+                CropRecommendation(
+                    crop=model.classes_[idx],
+                    confidence_score=float(probabilities[0, idx])
+                )
+                for idx in top_k_classes(probabilities, top_k)[0]
+            ]
         
         return CropResponse(recommendations=recommendations)
     except ValueError as e:
@@ -94,13 +130,143 @@ async def predict_crop(data: CropInput):
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error during prediction")
 
+# Bulk scoring for district-level planning, streamed back one NDJSON line per plot
+CROP_BATCH_CHUNK_SIZE = int(os.getenv("CROP_BATCH_CHUNK_SIZE", "1000"))
+
+@router.post("/predict/batch")
+async def predict_crop_batch(request: Request, top_k: int = Query(5, ge=1)):
+    """
+    Recommend crops for many plots at once. Accepts a JSON array of CropInput
+    objects, a CSV body, or a multipart CSV upload in a "file" field. Streams
+    one CropResponse-shaped NDJSON line per plot with the top_k crops.
+    """
+    ensure_model_loaded()
+    try:
+        chunks = await read_tabular_chunks(request, crop_features.names, CROP_BATCH_CHUNK_SIZE)
+        return ndjson_response(stream_scored_rows(
+            chunks, crop_features.names, lambda features: recommend_crops(features, top_k)
+        ))
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal server error during batch prediction")
+
+# Raster suitability maps run as background jobs over grids under SUITABILITY_DATA_DIR
+SUITABILITY_DATA_DIR = os.getenv("SUITABILITY_DATA_DIR", "./data/suitability")
+
+class SuitabilityJobRequest(BaseModel):
+    input_dir: str = Field(..., description="Directory of per-feature .npy grids, relative to SUITABILITY_DATA_DIR")
+    output_dir: str = Field(..., description="Directory for the map outputs, relative to SUITABILITY_DATA_DIR")
+    tile_size: int = Field(SUITABILITY_TILE_SIZE, ge=16, le=8192, description="Tile edge in pixels")
+    resume: bool = Field(True, description="Continue a previous run into the same output directory")
+
+# Finished (completed or failed) jobs kept for polling; the oldest are dropped beyond this
+SUITABILITY_MAX_FINISHED_JOBS = int(os.getenv("SUITABILITY_MAX_FINISHED_JOBS", "100"))
+
+suitability_jobs: Dict[str, dict] = {}
+suitability_jobs_lock = threading.Lock()
+
+def prune_finished_jobs():
+    """Drop the oldest finished jobs beyond SUITABILITY_MAX_FINISHED_JOBS; call with suitability_jobs_lock held."""
+    finished = [job for job in suitability_jobs.values() if job["finished_at"] is not None]
+    finished.sort(key=lambda job: job["finished_at"])
+    for job in finished[:max(0, len(finished) - SUITABILITY_MAX_FINISHED_JOBS)]:
+        del suitability_jobs[job["job_id"]]
+
+def resolve_data_path(relative_path: str) -> str:
+    """Resolve a client-supplied path, refusing anything outside SUITABILITY_DATA_DIR."""
+    root = os.path.realpath(SUITABILITY_DATA_DIR)
+    path = os.path.realpath(os.path.join(root, relative_path))
+    if os.path.commonpath([root, path]) != root:
+        raise HTTPException(status_code=400, detail=f"Path must stay inside the suitability data directory: {relative_path}")
+    return path
+
+def run_suitability_in_background(job: dict, input_dir: str, output_dir: str, tile_size: int, resume: bool):
+    def report(state):
+        job["progress"] = state
+    
+    job["status"] = "running"
+    try:
+        job["summary"] = run_suitability_job(
+            input_dir, output_dir, MODEL_PATH, crop_features.names, model.classes_.tolist(),
+            tile_size=tile_size, resume=resume, progress=report
+        )
+        job["status"] = "completed"
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        with suitability_jobs_lock:
+            job["finished_at"] = datetime.utcnow().isoformat()
+            prune_finished_jobs()
+
+@router.post("/suitability/jobs", status_code=202)
+async def start_suitability_job(request: SuitabilityJobRequest):
+    """
+    Start a crop suitability map over memory-mapped input grids. Returns a
+    job id to poll; resubmitting after a crash resumes from the last tile.
+    """
+    ensure_model_loaded()
+    input_dir = resolve_data_path(request.input_dir)
+    output_dir = resolve_data_path(request.output_dir)
+    try:
+        shape = check_inputs(input_dir, crop_features.names)
+    except SuitabilityError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    with suitability_jobs_lock:
+        for job in suitability_jobs.values():
+            if job["output_dir"] == output_dir and job["status"] in ("queued", "running"):
+                raise HTTPException(status_code=409, detail=f"Job {job['job_id']} is already writing to {request.output_dir}")
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "input_dir": input_dir,
+            "output_dir": output_dir,
+            "shape": list(shape),
+            "tile_size": request.tile_size,
+            "progress": None,
+            "summary": None,
+            "error": None,
+            "submitted_at": datetime.utcnow().isoformat(),
+            "finished_at": None
+        }
+        suitability_jobs[job_id] = job
+    
+    threading.Thread(
+        target=run_suitability_in_background,
+        args=(job, input_dir, output_dir, request.tile_size, request.resume),
+        name=f"suitability-{job_id[:8]}",
+        daemon=True
+    ).start()
+    return {"status": "success", "data": {"job_id": job_id, "status_url": f"/crop/suitability/jobs/{job_id}"}}
+
+@router.get("/suitability/jobs")
+async def list_suitability_jobs():
+    """Running jobs and the most recently finished ones, oldest first."""
+    with suitability_jobs_lock:
+        jobs = list(suitability_jobs.values())
+    return {"status": "success", "data": jobs}
+
+@router.get("/suitability/jobs/{job_id}")
+async def get_suitability_job(job_id: str):
+    """Job state, tile progress and, once completed, the map summary."""
+    job = suitability_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Suitability job not found")
+    return {"status": "success", "data": job}
+
 @router.get("/health")
 async def health():
     try:
         ensure_model_loaded()
         return {
             "status": "healthy",
-            "model_loaded": True
+            "model_loaded": True,
+            "model_backend": model_backend(model)
         }
     except Exception as e:
         return {
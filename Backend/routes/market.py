@@ -1,6 +1,11 @@
-from fastapi import APIRouter, HTTPException
-import requests
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional
+from datetime import date
+
+from utils.conditional import conditional_json
+from utils.market_api import CACHE_STALE, MARKET_CACHE_TTL_S, MarketAPI, get_market_cache_stats
+from utils.market_warehouse import TREND_PERIODS, MarketIngestor, MarketWarehouse, create_source, load_watchlist
 
 router = APIRouter(
     prefix="/api/market",
@@ -8,29 +13,130 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+# Scheduled pulls of the watched commodities/markets into a local indexed store, for cross-market queries
+market_warehouse = MarketWarehouse()
+market_ingestor = MarketIngestor(market_warehouse, create_source(), load_watchlist())
+
+def cache_headers(meta: dict) -> dict:
+    """
+    X-Cache and Age for every answer; a Warning when the answer is stale (RFC 7234)
+    """
+    headers = {
+        "X-Cache": meta["cache"],
+        "Age": str(meta["age"]),
+        "Cache-Control": f"public, max-age={max(0, int(MARKET_CACHE_TTL_S) - meta['age'])}"
+    }
+    if meta["cache"] == CACHE_STALE:
+        if meta["revalidation_failed"]:
+            headers["Warning"] = '111 - "Revalidation Failed"'
+        else:
+            headers["Warning"] = '110 - "Response is Stale"'
+    return headers
+
 @router.get("/insights")
 async def get_market_insights(
-    commodity: str, 
-    state: str, 
-    market: str
+    commodity: str,
+    state: str,
+    market: str,
+    request: Request
 ):
     """
     Proxy endpoint to fetch market insights from AgMarknet API
     """
+    # A fresh cache entry's fetch time versions the response, so polls get 304 without touching upstream
+    cached = MarketAPI.peek(commodity, state, market)
+    headers = cache_headers(cached) if cached else {}
+
+    async def build():
+        data, meta = await MarketAPI.get_prices(commodity, state, market)
+        headers.update(cache_headers(meta))
+        return data, meta["fetched_at"]
+
     try:
-        url = f"https://agmarket-api.onrender.com/request?commodity={commodity}&state={state}&market={market}"
-        response = requests.get(url)
-        
-        # Check if the request was successful
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Failed to fetch market data: {response.text}"
-            )
+        return await conditional_json(request, cached["fetched_at"] if cached else None, build, headers)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error fetching market data: {str(e)}"
         )
+
+@router.get("/stats")
+async def get_market_stats():
+    """
+    Market cache hit/miss/stale counters, upstream call volume and circuit breaker state
+    """
+    return {"status": "success", "data": get_market_cache_stats()}
+
+@router.get("/prices")
+async def get_prices(
+    commodity: str,
+    state: Optional[str] = None,
+    market: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: int = Query(500, ge=1, le=5000)
+):
+    """
+    Stored price rows for a commodity (optionally one state/market and date range) with min/max/average
+    """
+    try:
+        data = await run_in_threadpool(market_warehouse.prices, commodity, state, market, start, end, limit)
+        return {"status": "success", "data": data}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error querying market data: {str(e)}")
+
+@router.get("/trends")
+async def get_price_trends(
+    commodity: str,
+    state: Optional[str] = None,
+    market: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    interval: str = Query("day", description=f"One of: {', '.join(TREND_PERIODS)}")
+):
+    """
+    Average modal price per day, week or month from stored prices
+    """
+    try:
+        data = await run_in_threadpool(market_warehouse.trend, commodity, state, market, start, end, interval)
+        return {"status": "success", "data": data}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error querying market data: {str(e)}")
+
+@router.get("/best")
+async def get_best_markets(
+    commodity: str,
+    state: str,
+    days: int = Query(7, ge=1, le=365),
+    limit: int = Query(10, ge=1, le=100)
+):
+    """
+    Markets in a state ranked by average modal price over the most recent days of stored data
+    """
+    try:
+        data = await run_in_threadpool(market_warehouse.best_markets, commodity, state, days, limit)
+        return {"status": "success", "data": data}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error querying market data: {str(e)}")
+
+@router.post("/warehouse/ingest")
+async def run_market_ingestion(force: bool = False):
+    """
+    Pull due watched combinations now (all of them with force=true) instead of waiting for the schedule
+    """
+    try:
+        return {"status": "success", "data": await market_ingestor.run_once(force=force)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error ingesting market data: {str(e)}")
+
+@router.get("/warehouse/stats")
+async def get_warehouse_stats():
+    """
+    Stored rows and date range, watched series, ingestion runs and failures
+    """
+    data = await run_in_threadpool(market_warehouse.stats)
+    return {"status": "success", "data": {**data, "ingestion": market_ingestor.stats()}}
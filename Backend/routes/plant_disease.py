@@ -1,14 +1,28 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Body
+from fastapi import APIRouter, UploadFile, File, HTTPException, Body, Request
 from fastapi.responses import JSONResponse
 import torch
-from torchvision import models
 import albumentations as A
 from PIL import Image
 import io
 import numpy as np
 import os
 import base64
+import asyncio
+import zipfile
+import hashlib
+import threading
+import time
 from pydantic import BaseModel
+from typing import List, Tuple, Iterator, Callable
+
+from utils.streaming import ndjson_line, ndjson_response
+
+from utils.batching import MicroBatcher
+from utils.cache import TTLCache
+from utils.inference_pool import InferenceExecutor, ExecutorSaturated
+from utils.plant_backends import BACKEND_EAGER, file_digest, load_plant_model
+from utils.model_registry import model_registry
+from utils.metrics import registry
 
 router = APIRouter(
     prefix="/plant",
@@ -24,12 +38,42 @@ device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 # Load the plant disease detection model
 model_path = "./models/Plant Disease/best_tuned_model.pth"
-model = models.efficientnet_b0(weights=None)
 num_classes = 38
-model.classifier[1] = torch.nn.Linear(model.classifier[1].in_features, num_classes)
-model.load_state_dict(torch.load(model_path, map_location=device))
-model = model.to(device)
-model.eval()
+
+# Inference backend: eager (fp32), torchscript (frozen graph) or int8 (quantized)
+PLANT_MODEL_BACKEND = os.getenv("PLANT_MODEL_BACKEND", BACKEND_EAGER).lower()
+
+def build_model(path: str) -> Tuple[torch.nn.Module, str]:
+    """Load the configured backend for the weights at path, returning (model, version)."""
+    digest = file_digest(path)
+    net, backend = load_plant_model(PLANT_MODEL_BACKEND, path, num_classes, device, source_digest=digest)
+    print(f"Loaded plant disease model ({backend} backend)")
+    return net, f"{digest}-{backend}"
+
+def file_fingerprint(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+# Populated in the background by load_plant_disease_model
+model = None
+model_fingerprint = None
+model_version = None
+_model_reload_lock = threading.Lock()
+
+def load_plant_disease_model():
+    """Load the plant disease model and record the weights it came from."""
+    global model, model_fingerprint, model_version
+    fingerprint = file_fingerprint(model_path)
+    net, version = build_model(model_path)
+    with _model_reload_lock:
+        model, model_fingerprint, model_version = net, fingerprint, version
+
+def ensure_plant_model_loaded():
+    """Answer 503 for plant routes until the model is ready."""
+    return model_registry.ensure_ready(
+        "plant_disease",
+        detail="Plant disease model not loaded. Please ensure model file is present and try again."
+    )
 
 # Define class names
 classes = [
@@ -49,45 +93,204 @@ classes = [
 ]
 
 # Define preprocessing
+INPUT_SIZE = 224
+
+# Where prediction time goes: image decoding, resize/normalize, and the batched forward pass
+stage_latency = {
+    stage: registry.timer("plant_predict_stage_seconds", "Plant disease prediction time by stage", {"stage": stage})
+    for stage in ("decode", "preprocess", "forward")
+}
+
 preprocess = A.Compose([
-    A.Resize(224, 224),
+    A.Resize(INPUT_SIZE, INPUT_SIZE),
     A.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
     A.ToTensorV2()
 ])
 
+def preprocess_image(image: Image.Image) -> torch.Tensor:
+    """Convert a PIL image into a normalized (3, 224, 224) tensor."""
+    with stage_latency["preprocess"].timer():
+        augmented = preprocess(image=np.array(image))
+    return augmented['image']
+
+def predict_batch(image_tensors: List[torch.Tensor]) -> List[Tuple[str, float]]:
+    """Run one forward pass over a list of preprocessed image tensors."""
+    with stage_latency["forward"].timer():
+        batch = torch.stack(image_tensors).to(device).contiguous(memory_format=torch.channels_last)
+        
+        with torch.inference_mode():
+            outputs = model(batch)
+            probabilities = torch.softmax(outputs, dim=1)
+            confidences, predicted = torch.max(probabilities, 1)
+    
+    return [
+        (classes[class_idx], confidence)
+        for class_idx, confidence in zip(predicted.tolist(), confidences.tolist())
+    ]
+
 def predict_image(image: Image.Image):
     """Predict plant disease from image."""
-    image = np.array(image)
-    augmented = preprocess(image=image)
-    image_tensor = augmented['image'].unsqueeze(0)
-    image_tensor = image_tensor.to(device)
+    return predict_batch([preprocess_image(image)])[0]
+
+def decode_image_tensor(image_data: bytes, draft: bool = False) -> torch.Tensor:
+    """Decode raw image bytes and preprocess them into a model-ready tensor.
+    
+    With ``draft`` set, JPEGs are scaled down by the decoder itself (1/2, 1/4
+    or 1/8) to the smallest size still covering the model input, so a 12 MP
+    photo never materializes at full resolution.
+    """
+    with stage_latency["decode"].timer():
+        image = Image.open(io.BytesIO(image_data))
+        if draft:
+            image.draft("RGB", (INPUT_SIZE, INPUT_SIZE))
+        image = image.convert("RGB")
+    return preprocess_image(image)
+
+def warmup_plant_model():
+    """Run a dummy batch so the first real request doesn't pay one-off setup costs."""
+    predict_batch([torch.zeros(3, INPUT_SIZE, INPUT_SIZE)] * 2)
+
+model_registry.register("plant_disease", load_plant_disease_model, warmup=warmup_plant_model)
+
+# Dedicated worker pool so decoding and forward passes never block the event loop
+PLANT_INFERENCE_WORKERS = int(os.getenv("PLANT_INFERENCE_WORKERS", "2"))
+PLANT_INFERENCE_MAX_PENDING = int(os.getenv("PLANT_INFERENCE_MAX_PENDING", "32"))
+PLANT_INFERENCE_QUEUE_TIMEOUT_S = float(os.getenv("PLANT_INFERENCE_QUEUE_TIMEOUT_S", "2"))
+PLANT_TORCH_THREADS = int(os.getenv(
+    "PLANT_TORCH_THREADS",
+    str(max(1, (os.cpu_count() or 1) // PLANT_INFERENCE_WORKERS))
+))
+
+def _init_inference_worker():
+    """Pin torch intra-op parallelism so workers don't oversubscribe the CPU."""
+    torch.set_num_threads(PLANT_TORCH_THREADS)
+
+inference_executor = InferenceExecutor(
+    max_workers=PLANT_INFERENCE_WORKERS,
+    max_pending=PLANT_INFERENCE_MAX_PENDING,
+    admission_timeout=PLANT_INFERENCE_QUEUE_TIMEOUT_S,
+    initializer=_init_inference_worker,
+    name="plant_executor"
+)
+
+# Group concurrent requests into a single forward pass
+PLANT_BATCH_MAX_SIZE = int(os.getenv("PLANT_BATCH_MAX_SIZE", "16"))
+PLANT_BATCH_MAX_WAIT_MS = float(os.getenv("PLANT_BATCH_MAX_WAIT_MS", "5"))
+
+batcher = MicroBatcher(
+    predict_batch,
+    max_batch_size=PLANT_BATCH_MAX_SIZE,
+    max_wait_ms=PLANT_BATCH_MAX_WAIT_MS,
+    name="plant_inference",
+    executor=inference_executor,
+    max_concurrent_batches=PLANT_INFERENCE_WORKERS
+)
+
+# Content-addressed cache of predictions, keyed by image bytes and model version
+PLANT_CACHE_MAX_BYTES = int(os.getenv("PLANT_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+PLANT_CACHE_TTL_S = float(os.getenv("PLANT_CACHE_TTL_S", str(24 * 3600)))
+PLANT_MODEL_CHECK_INTERVAL_S = float(os.getenv("PLANT_MODEL_CHECK_INTERVAL_S", "10"))
+
+prediction_cache = TTLCache(
+    ttl_seconds=PLANT_CACHE_TTL_S,
+    max_bytes=PLANT_CACHE_MAX_BYTES,
+    name="plant_prediction_cache"
+)
+
+_last_model_check = 0.0
+
+def reload_model_if_changed() -> bool:
+    """Reload the weights and drop cached predictions if the model file changed on disk."""
+    global model, model_fingerprint, model_version
+    with _model_reload_lock:
+        if model is None:
+            return False
+        try:
+            fingerprint = file_fingerprint(model_path)
+            if fingerprint == model_fingerprint:
+                return False
+            new_model, new_version = build_model(model_path)
+        except Exception as e:
+            # Keep serving the current model; the file may still be mid-write
+            print(f"Error reloading plant disease model: {str(e)}")
+            return False
+        model, model_fingerprint, model_version = new_model, fingerprint, new_version
+    prediction_cache.clear()
+    print(f"Reloaded plant disease model (version {model_version})")
+    return True
+
+async def ensure_current_model():
+    """Check the weights file for changes at most once per check interval."""
+    global _last_model_check
+    now = time.monotonic()
+    if now - _last_model_check < PLANT_MODEL_CHECK_INTERVAL_S:
+        return
+    _last_model_check = now
+    await inference_executor.run(reload_model_if_changed)
+
+def image_cache_key(image_data: bytes, draft: bool = False) -> Tuple[str, bool, str]:
+    return model_version, draft, hashlib.blake2b(image_data, digest_size=16).hexdigest()
+
+class InvalidImageError(ValueError):
+    pass
+
+async def diagnose_image(image_data: bytes, draft: bool = False) -> Tuple[str, float]:
+    """Cached, batched prediction for one encoded image."""
+    await ensure_current_model()
+    key = await inference_executor.run(image_cache_key, image_data, draft)
+    cached = prediction_cache.get(key)
+    if cached is not None:
+        return cached
     
-    with torch.no_grad():
-        outputs = model(image_tensor)
-        probabilities = torch.softmax(outputs, dim=1)
-        confidence, predicted = torch.max(probabilities, 1)
-        predicted_class = classes[predicted.item()]
-        confidence_score = confidence.item()
+    try:
+        image_tensor = await inference_executor.run(decode_image_tensor, image_data, draft)
+    except Exception as e:
+        raise InvalidImageError(str(e))
+    
+    result = await batcher.submit(image_tensor)
+    prediction_cache.set(key, result)
+    return result
+
+def saturated_error(e: ExecutorSaturated) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+# Upper bound for raw image bodies, enforced while the body is streamed in
+PLANT_MAX_UPLOAD_BYTES = int(os.getenv("PLANT_MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+
+async def read_capped_body(request: Request, limit: int) -> bytes:
+    """Read the request body, aborting with 413 as soon as it exceeds the limit."""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > limit:
+        raise HTTPException(status_code=413, detail=f"Image exceeds {limit} bytes")
     
-    return predicted_class, confidence_score
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise HTTPException(status_code=413, detail=f"Image exceeds {limit} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
 
 # Original endpoint for file upload
 @router.post("/predict/file")
 async def predict_plant_disease_file(file: UploadFile = File(...)):
     try:
+        ensure_plant_model_loaded()
+        
         if not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
             
         contents = await file.read()
         if not contents:
             raise HTTPException(status_code=400, detail="Empty file")
-            
-        try:
-            image = Image.open(io.BytesIO(contents)).convert("RGB")
-        except Exception as e:
-            raise HTTPException(status_code=400, detail="Invalid image file")
-            
-        predicted_class, confidence = predict_image(image)
+        
+        async with inference_executor.admit():
+            try:
+                predicted_class, confidence = await diagnose_image(contents)
+            except InvalidImageError:
+                raise HTTPException(status_code=400, detail="Invalid image file")
+        
         return JSONResponse(content={
             "status": "success",
             "data": {
@@ -97,6 +300,8 @@ async def predict_plant_disease_file(file: UploadFile = File(...)):
         })
     except HTTPException:
         raise
+    except ExecutorSaturated as e:
+        raise saturated_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
@@ -104,15 +309,20 @@ async def predict_plant_disease_file(file: UploadFile = File(...)):
 @router.post("/predict")
 async def predict_plant_disease(request: PlantImageRequest):
     try:
-        # Decode base64 image
-        try:
-            image_data = base64.b64decode(request.image)
-            image = Image.open(io.BytesIO(image_data)).convert("RGB")
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid base64 image: {str(e)}")
+        ensure_plant_model_loaded()
         
-        # Predict disease
-        predicted_class, confidence = predict_image(image)
+        async with inference_executor.admit():
+            # Decode base64 image
+            try:
+                image_data = await inference_executor.run(base64.b64decode, request.image)
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=f"Invalid base64 image: {str(e)}")
+            
+            # Predict disease
+            try:
+                predicted_class, confidence = await diagnose_image(image_data)
+            except InvalidImageError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid base64 image: {str(e)}")
         
         # Return prediction
         return JSONResponse(content={
@@ -124,5 +334,194 @@ async def predict_plant_disease(request: PlantImageRequest):
         })
     except HTTPException:
         raise
+    except ExecutorSaturated as e:
+        raise saturated_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
+
+# Raw binary endpoint: the request body is the image itself
+@router.post("/predict/raw")
+async def predict_plant_disease_raw(request: Request):
+    try:
+        ensure_plant_model_loaded()
+        
+        content_type = request.headers.get("content-type", "")
+        if not content_type.startswith('image/'):
+            raise HTTPException(status_code=415, detail="Request body must be an image/* payload")
+        
+        contents = await read_capped_body(request, PLANT_MAX_UPLOAD_BYTES)
+        if not contents:
+            raise HTTPException(status_code=400, detail="Empty file")
+        
+        async with inference_executor.admit():
+            try:
+                predicted_class, confidence = await diagnose_image(contents, draft=True)
+            except InvalidImageError:
+                raise HTTPException(status_code=400, detail="Invalid image file")
+        
+        return JSONResponse(content={
+            "status": "success",
+            "data": {
+                "predicted_class": predicted_class,
+                "confidence": confidence
+            }
+        })
+    except HTTPException:
+        raise
+    except ExecutorSaturated as e:
+        raise saturated_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
+
+# Bulk endpoint for many images (multipart files or a single zip archive)
+PLANT_BULK_CHUNK_SIZE = int(os.getenv("PLANT_BULK_CHUNK_SIZE", str(PLANT_BATCH_MAX_SIZE)))
+
+def is_zip_upload(file: UploadFile) -> bool:
+    return (
+        file.content_type in ("application/zip", "application/x-zip-compressed")
+        or (file.filename or "").lower().endswith(".zip")
+    )
+
+def iter_upload_sources(files: List[UploadFile]) -> Iterator[Tuple[str, Callable[[], bytes]]]:
+    """Yield (name, reader) pairs lazily so no more than one chunk is held in memory."""
+    for file in files:
+        if is_zip_upload(file):
+            archive = zipfile.ZipFile(file.file)
+            for info in archive.infolist():
+                basename = os.path.basename(info.filename)
+                if info.is_dir() or info.filename.startswith("__MACOSX/") or basename.startswith("."):
+                    continue
+                yield info.filename, (lambda archive=archive, info=info: archive.read(info))
+        else:
+            yield file.filename or "", file.file.read
+
+def read_sources(sources: List[Tuple[str, Callable[[], bytes]]]) -> List[Tuple[str, object]]:
+    """Read a chunk of uploads sequentially (archive members share one file handle)."""
+    chunk = []
+    for name, read in sources:
+        try:
+            chunk.append((name, read()))
+        except Exception as e:
+            chunk.append((name, e))
+    return chunk
+
+def try_decode_image_tensor(contents):
+    """Decode one upload, returning the exception instead of raising it."""
+    if isinstance(contents, Exception):
+        return contents
+    if not contents:
+        return ValueError("Empty file")
+    try:
+        return decode_image_tensor(contents, draft=True)
+    except Exception as e:
+        return ValueError("Invalid image file")
+
+def chunk_cache_keys(chunk: List[Tuple[str, object]]) -> List[object]:
+    return [
+        image_cache_key(contents, draft=True) if isinstance(contents, bytes) and contents else None
+        for _, contents in chunk
+    ]
+
+async def predict_chunk(sources: List[Tuple[str, Callable[[], bytes]]]) -> List[dict]:
+    """Read, decode in parallel and run one batched forward pass for a chunk of uploads."""
+    await ensure_current_model()
+    while True:
+        try:
+            async with inference_executor.admit():
+                chunk = await inference_executor.run(read_sources, sources)
+                keys = await inference_executor.run(chunk_cache_keys, chunk)
+                outcomes = [prediction_cache.get(key) if key is not None else None for key in keys]
+                
+                misses = [i for i, outcome in enumerate(outcomes) if outcome is None]
+                tensors = await asyncio.gather(*[
+                    inference_executor.run(try_decode_image_tensor, chunk[i][1]) for i in misses
+                ])
+                valid = [(i, tensor) for i, tensor in zip(misses, tensors) if not isinstance(tensor, Exception)]
+                predictions = await inference_executor.run(
+                    predict_batch, [tensor for _, tensor in valid]
+                ) if valid else []
+            break
+        except ExecutorSaturated:
+            # Bulk jobs yield to interactive requests instead of failing
+            await asyncio.sleep(PLANT_INFERENCE_QUEUE_TIMEOUT_S)
+
+    for i, tensor in zip(misses, tensors):
+        if isinstance(tensor, Exception):
+            outcomes[i] = tensor
+    for (i, _), prediction in zip(valid, predictions):
+        outcomes[i] = prediction
+        prediction_cache.set(keys[i], prediction)
+
+    results = []
+    for (name, _), outcome in zip(chunk, outcomes):
+        if isinstance(outcome, Exception):
+            results.append({"filename": name, "status": "error", "error": str(outcome)})
+        else:
+            predicted_class, confidence = outcome
+            results.append({
+                "filename": name,
+                "status": "success",
+                "data": {
+                    "predicted_class": predicted_class,
+                    "confidence": confidence
+                }
+            })
+    return results
+
+async def stream_bulk_predictions(files: List[UploadFile]):
+    """Yield one NDJSON line per image, decoding the next chunk while the current one runs."""
+    sources = iter_upload_sources(files)
+    index = 0
+    next_chunk = None
+    while True:
+        chunk_sources = [source for _, source in zip(range(PLANT_BULK_CHUNK_SIZE), sources)]
+        chunk = asyncio.ensure_future(predict_chunk(chunk_sources)) if chunk_sources else None
+        if next_chunk is not None:
+            for result in await next_chunk:
+                yield ndjson_line({"index": index, **result})
+                index += 1
+        if chunk is None:
+            break
+        next_chunk = chunk
+
+@router.post("/predict/batch")
+async def predict_plant_disease_batch(files: List[UploadFile] = File(...)):
+    """Diagnose many leaf photos at once, streaming one NDJSON line per image"""
+    try:
+        ensure_plant_model_loaded()
+        
+        for file in files:
+            if is_zip_upload(file):
+                if not zipfile.is_zipfile(file.file):
+                    raise HTTPException(status_code=400, detail=f"Invalid zip archive: {file.filename}")
+                file.file.seek(0)
+            elif not (file.content_type or "").startswith('image/'):
+                raise HTTPException(status_code=400, detail=f"File must be an image or zip archive: {file.filename}")
+        
+        return ndjson_response(stream_bulk_predictions(files))
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error processing images: {str(e)}")
+
+@router.get("/batching/stats")
+async def batching_stats():
+    """Batch size distribution, queue wait times and worker pool usage"""
+    return {
+        "status": "success",
+        "data": {
+            **batcher.stats(),
+            "executor": inference_executor.stats()
+        }
+    }
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters and occupancy of the prediction cache"""
+    return {
+        "status": "success",
+        "data": {
+            **prediction_cache.stats(),
+            "model_version": model_version
+        }
+    }
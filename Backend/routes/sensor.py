@@ -1,11 +1,16 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Body, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
+import numpy as np
 import firebase_admin
-from firebase_admin import credentials, db
-from typing import Optional, Dict, Any
+from firebase_admin import credentials
+from typing import Optional, Dict, Any, List, Tuple
+import asyncio
+import json
+import math
 import os
 import sys
-import pandas as pd
+import time
 from datetime import datetime
 
 # Add the parent directory to sys.path to import from other modules
@@ -15,9 +20,19 @@ if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
 # Import soil health prediction functions
-from routes.soil_health import predict_soil_health, ensure_models_loaded
+from routes.soil_health import predict_soil_health, ensure_models_loaded, feature_cols, score_soil_array
 # Import weather API utilities
-from utils.weather_api import get_weather_data, get_air_quality_data, get_combined_data
+from utils.weather_api import get_weather_data, get_cache_stats
+from utils.weather_tiles import weather_tiles
+from utils.model_registry import model_registry
+from utils.conditional import conditional_json
+from utils.deadband import DeadbandMemo
+from utils.fanout import FanoutHub
+from utils.fleet import DeviceRejected, SensorFleet, parse_timestamp
+from utils.streaming import sse_event, sse_response
+from utils.write_batcher import WriteBatcher
+from utils.timeseries import SENSOR_HISTORY_MAX_POINTS, TimeSeriesStore, valid_name
+from utils.sensor_snapshot import SENSOR_BACKEND, SENSOR_SNAPSHOT_PATH, SensorSnapshot, create_backend
 
 router = APIRouter(
     prefix="/api/sensor",
@@ -36,19 +51,124 @@ FIREBASE_CONFIG = {
     "measurementId": "G-7TYWSKYZRW"
 }
 
-# Initialize Firebase Admin SDK with default credentials
-try:
-    firebase_admin.get_app()
-except ValueError:
-    # Get the path to the service account key file
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    service_account_path = os.path.join(os.path.dirname(current_dir), 'serviceAccountKey.json')
-    
-    # Initialize Firebase with the service account key file
-    cred = credentials.Certificate(service_account_path)
-    firebase_admin.initialize_app(cred, {
-        'databaseURL': FIREBASE_CONFIG['databaseURL']
-    })
+def init_firebase():
+    """Initialize Firebase Admin SDK with the service account key file."""
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        # Get the path to the service account key file
+        service_account_path = os.path.join(parent_dir, 'serviceAccountKey.json')
+        
+        # Initialize Firebase with the service account key file
+        cred = credentials.Certificate(service_account_path)
+        firebase_admin.initialize_app(cred, {
+            'databaseURL': FIREBASE_CONFIG['databaseURL']
+        })
+
+# Firebase is initialized in the background at startup (not needed with the local stand-in backend)
+if SENSOR_BACKEND == "firebase":
+    model_registry.register("firebase", init_firebase)
+
+# In-memory copy of the device node, kept current by a background listener (started with the server)
+sensor_snapshot = SensorSnapshot(create_backend())
+
+# Threshold and irrigation writes are debounced per key and sent as one multi-path update per flush
+SENSOR_WRITE_ACK_TIMEOUT_S = float(os.getenv("SENSOR_WRITE_ACK_TIMEOUT_S", "10"))
+# Fleet devices' nodes live under this prefix; ?device= writes never reach other parts of the database
+SENSOR_DEVICES_PATH = os.getenv("SENSOR_DEVICES_PATH", "devices").strip("/")
+sensor_writes = WriteBatcher(sensor_snapshot.backend)
+
+# Every observed reading is appended to a per-device, per-metric history under SENSOR_HISTORY_DIR
+SENSOR_HISTORY_DIR = os.getenv("SENSOR_HISTORY_DIR", "./data/history")
+HISTORY_DEVICE = SENSOR_SNAPSHOT_PATH.strip("/").replace("/", ".")
+sensor_history = TimeSeriesStore(SENSOR_HISTORY_DIR)
+
+# Fields the soil health mapping and weather lookup read; they must be numeric when present
+NUMERIC_READING_FIELDS = ("ph", "salinity", "moisture", "temperature", "latitude", "longitude")
+FLEET_BULK_MAX_READINGS = int(os.getenv("FLEET_BULK_MAX_READINGS", "10000"))
+
+def validate_reading(reading: Any) -> Dict[str, Any]:
+    if not isinstance(reading, dict):
+        raise ValueError("Reading must be a JSON object")
+    for field in NUMERIC_READING_FIELDS:
+        value = reading.get(field)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            raise ValueError(f"{field} must be a number")
+    return reading
+
+async def score_fleet_readings(devices: List[Tuple[str, Dict[str, Any]]]) -> List[dict]:
+    """Score many devices with one call per soil model, each with the weather of its own tile;
+    devices whose inputs stayed within deadband reuse their last result"""
+    ensure_models_loaded()
+    # One weather lookup per tile, not per device
+    weather_by_tile = {}
+    tile_keys = []
+    for _, reading in devices:
+        lat, lon = resolve_location(reading, None, None)
+        key = location_key(lat, lon)
+        if key not in weather_by_tile:
+            weather_by_tile[key] = weather_tiles.get_weather(lat, lon)
+        tile_keys.append(key)
+    weather = dict(zip(weather_by_tile, await asyncio.gather(*weather_by_tile.values())))
+
+    memo_keys = [(device_id, key) for (device_id, _), key in zip(devices, tile_keys)]
+    inputs = [sensor_soil_inputs(reading, weather[key]) for (_, reading), key in zip(devices, tile_keys)]
+    results = [soil_health_memo.lookup(memo_key, row) for memo_key, row in zip(memo_keys, inputs)]
+    stale = [i for i, result in enumerate(results) if result is None]
+    if stale:
+        features = np.array([[inputs[i][col] for col in feature_cols] for i in stale], dtype=np.float64)
+        for i, result in zip(stale, await run_in_threadpool(score_soil_array, features)):
+            soil_health_memo.store(memo_keys[i], inputs[i], result)
+            results[i] = result
+    return results
+
+# Latest reading and precomputed soil health for every device; the Firebase device is one of them
+sensor_fleet = SensorFleet(score_fleet_readings, history=sensor_history)
+sensor_fleet.register(HISTORY_DEVICE)
+
+def ingest_snapshot(revision: int):
+    """Snapshot change listener: feed the Firebase device into the fleet (and its history)"""
+    try:
+        snapshot = sensor_snapshot.get()
+        if isinstance(snapshot, dict):
+            sensor_fleet.ingest(HISTORY_DEVICE, validate_reading(snapshot))
+    except Exception as e:
+        print(f"Error ingesting sensor snapshot: {str(e)}")
+
+sensor_snapshot.add_change_listener(ingest_snapshot)
+
+def air_quality_bucket(hours: int = 18, points: int = 6) -> int:
+    """Index of the current air quality chart bucket; the chart can only change when it moves on"""
+    return int(time.time() // (hours * 3600 / points))
+
+def air_quality_history(hours: int = 18, points: int = 6) -> Optional[list]:
+    """Recorded air quality as chart points for the last ``hours``, or None until there are at least two"""
+    resolution = hours * 3600 / points
+    end = (time.time() // resolution + 1) * resolution
+    history = sensor_history.query(HISTORY_DEVICE, "airQuality", end - hours * 3600, end, resolution)
+    if history is None or len(history["t"]) < 2:
+        return None
+    chart = []
+    for t, value in zip(history["t"], history["avg"]):
+        moment = datetime.fromtimestamp(t)
+        minutes = f":{moment.minute:02d}" if moment.minute else ""
+        chart.append({"time": f"{moment.hour % 12 or 12}{minutes}{'AM' if moment.hour < 12 else 'PM'}",
+                      "value": round(value)})
+    return chart
+
+# Idle streams get a keep-alive this often so proxies and clients don't time them out
+SENSOR_STREAM_KEEPALIVE_S = float(os.getenv("SENSOR_STREAM_KEEPALIVE_S", "15"))
+
+def resolve_location(sensor_data: Optional[Dict[str, Any]], lat: Optional[float], lon: Optional[float]):
+    """Query coordinates win, then the device's own latitude/longitude, then the default location"""
+    if (lat is None or lon is None) and sensor_data:
+        lat = sensor_data.get("latitude", lat) if lat is None else lat
+        lon = sensor_data.get("longitude", lon) if lon is None else lon
+    return lat, lon
+
+def location_key(lat: Optional[float], lon: Optional[float]):
+    """Weather tile of a location (None for the default one); callers in the same tile share streams and soil scores"""
+    return weather_tiles.tile_key(lat, lon) if lat is not None and lon is not None else None
 
 class ThresholdUpdate(BaseModel):
     threshold: float
@@ -56,166 +176,465 @@ class ThresholdUpdate(BaseModel):
 class IrrigationUpdate(BaseModel):
     irrigation: bool
 
+async def build_sensor_payload(snapshot: Dict[str, Any], lat: Optional[float] = None,
+                               lon: Optional[float] = None, refresh: bool = False) -> Dict[str, Any]:
+    """
+    Add soil health, air quality and weather alerts for the device's location to a sensor snapshot
+    """
+    # Weather and air quality come from the shared tile table for this location
+    location = resolve_location(snapshot, lat, lon)
+    tile = await weather_tiles.get_tile(*location)
+    weather_data, air_quality_data = tile.weather, tile.air_quality
+    
+    # Get soil health prediction with weather data
+    soil_health = predict_soil_health_from_sensors(snapshot, weather_data,
+                                                   memo_key=(HISTORY_DEVICE, location_key(*location)), refresh=refresh)
+    snapshot["soilHealth"] = soil_health
+    
+    # Add weather and air quality data to response without changing existing structure
+    if "airQuality" not in snapshot:
+        snapshot["airQuality"] = air_quality_data.get("aqi", 0) * 20  # Convert 1-5 scale to 0-100
+        if lat is None and lon is None:
+            # Observed at the device's own location: keep it for the air quality chart
+            sensor_history.record(HISTORY_DEVICE, {"airQuality": snapshot["airQuality"]})
+    
+    if "airQualityData" not in snapshot:
+        # History is kept for the device's own location only
+        snapshot["airQualityData"] = air_quality_history() if lat is None and lon is None else None
+    
+    if snapshot["airQualityData"] is None:
+        # Not enough history yet: create mock time series data for air quality
+        snapshot["airQualityData"] = [
+            {"time": "6AM", "value": max(0, air_quality_data.get("aqi", 2) * 20 - 5)},
+            {"time": "9AM", "value": max(0, air_quality_data.get("aqi", 2) * 20 - 10)},
+            {"time": "12PM", "value": max(0, air_quality_data.get("aqi", 2) * 20 - 2)},
+            {"time": "3PM", "value": air_quality_data.get("aqi", 2) * 20},
+            {"time": "6PM", "value": max(0, air_quality_data.get("aqi", 2) * 20 - 3)},
+            {"time": "9PM", "value": max(0, air_quality_data.get("aqi", 2) * 20 + 2)}
+        ]
+    
+    # Add weather alerts based on current weather conditions
+    if "weatherAlerts" not in snapshot:
+        weather_condition = weather_data.get("weather_condition", "")
+        alerts = []
+    
+        if weather_condition in ["Rain", "Drizzle", "Thunderstorm"]:
+            alerts.append({
+                "id": "w1",
+                "title": f"{weather_condition} Expected",
+                "message": f"Prepare for {weather_data.get('weather_description', 'wet conditions')}. Consider postponing outdoor activities."
+            })
+        elif weather_condition in ["Snow", "Mist", "Fog"]:
+            alerts.append({
+                "id": "w2",
+                "title": f"{weather_condition} Alert",
+                "message": f"Reduced visibility due to {weather_data.get('weather_description', 'conditions')}. Take precautions."
+            })
+        elif weather_data.get("temperature", 25) > 35:
+            alerts.append({
+                "id": "w3",
+                "title": "High Temperature Alert",
+                "message": f"Temperature is {weather_data.get('temperature', 0)}°C. Ensure plants have adequate water."
+            })
+    
+        if air_quality_data.get("aqi", 2) >= 4:
+            alerts.append({
+                "id": "a1",
+                "title": "Poor Air Quality",
+                "message": "Air quality is poor. This may affect sensitive crops."
+            })
+    
+        snapshot["weatherAlerts"] = alerts if alerts else [
+            {
+                "id": "w0",
+                "title": "No Weather Alerts",
+                "message": "Weather conditions are favorable for farming activities."
+            }
+        ]
+    
+    return snapshot
+
+async def compute_stream_view(key) -> Dict[str, Any]:
+    """Sensor payload for one stream topic: a weather tile key, or None for the device's own location"""
+    snapshot = await sensor_snapshot.read()
+    if not snapshot:
+        raise LookupError("No sensor data found")
+    lat, lon = weather_tiles.tile_center(key) if key is not None else (None, None)
+    return await build_sensor_payload(snapshot, lat, lon)
+
+# Each view is computed once per change and pushed to every client streaming it
+sensor_stream = FanoutHub("sensor_stream", compute_stream_view)
+sensor_snapshot.add_change_listener(lambda revision: sensor_stream.notify_threadsafe())
+
+def sensor_payload_version(snapshot: Optional[Dict[str, Any]], revision: int,
+                           lat: Optional[float], lon: Optional[float]):
+    """
+    Version of the sensor payload: snapshot revision, weather tile and air quality chart bucket (None if unknown)
+    """
+    if not snapshot or not revision:
+        return None
+    tile_version = weather_tiles.version(*resolve_location(snapshot, lat, lon))
+    if tile_version is None:
+        return None
+    return revision, tile_version, air_quality_bucket()
+
 @router.get("")
-async def get_sensor_data():
-    try:
-        ref = db.reference('wirelessDevice')
-        snapshot = ref.get()
+async def get_sensor_data(request: Request,
+                          lat: Optional[float] = Query(None, ge=-90, le=90),
+                          lon: Optional[float] = Query(None, ge=-180, le=180),
+                          refresh: bool = Query(False, description="Re-score soil health even if inputs are within deadband")):
+    async def build():
+        # Read the revision first: the snapshot is at least that new
+        revision = sensor_snapshot.revision if sensor_snapshot.is_fresh() else 0
+        snapshot = await sensor_snapshot.read()
         if snapshot:
-            # Get soil health prediction with weather data
-            soil_health = predict_soil_health_from_sensors(snapshot)
-            snapshot["soilHealth"] = soil_health
-            
-            # Add weather data for frontend (without changing existing structure)
-            weather_data = get_weather_data()
-            air_quality_data = get_air_quality_data()
+            snapshot = await build_sensor_payload(snapshot, lat, lon, refresh=refresh)
+            version = sensor_payload_version(snapshot, revision, lat, lon)
             
             # Add timestamp for last updated
             snapshot["lastUpdated"] = datetime.now().isoformat()
             
-            # Add weather and air quality data to response without changing existing structure
-            if "airQuality" not in snapshot:
-                snapshot["airQuality"] = air_quality_data.get("aqi", 0) * 20  # Convert 1-5 scale to 0-100
-            
-            if "airQualityData" not in snapshot:
-                # Create mock time series data for air quality
-                snapshot["airQualityData"] = [
-                    {"time": "6AM", "value": max(0, air_quality_data.get("aqi", 2) * 20 - 5)},
-                    {"time": "9AM", "value": max(0, air_quality_data.get("aqi", 2) * 20 - 10)},
-                    {"time": "12PM", "value": max(0, air_quality_data.get("aqi", 2) * 20 - 2)},
-                    {"time": "3PM", "value": air_quality_data.get("aqi", 2) * 20},
-                    {"time": "6PM", "value": max(0, air_quality_data.get("aqi", 2) * 20 - 3)},
-                    {"time": "9PM", "value": max(0, air_quality_data.get("aqi", 2) * 20 + 2)}
-                ]
-            
-            # Add weather alerts based on current weather conditions
-            if "weatherAlerts" not in snapshot:
-                weather_condition = weather_data.get("weather_condition", "")
-                alerts = []
-                
-                if weather_condition in ["Rain", "Drizzle", "Thunderstorm"]:
-                    alerts.append({
-                        "id": "w1",
-                        "title": f"{weather_condition} Expected",
-                        "message": f"Prepare for {weather_data.get('weather_description', 'wet conditions')}. Consider postponing outdoor activities."
-                    })
-                elif weather_condition in ["Snow", "Mist", "Fog"]:
-                    alerts.append({
-                        "id": "w2",
-                        "title": f"{weather_condition} Alert",
-                        "message": f"Reduced visibility due to {weather_data.get('weather_description', 'conditions')}. Take precautions."
-                    })
-                elif weather_data.get("temperature", 25) > 35:
-                    alerts.append({
-                        "id": "w3",
-                        "title": "High Temperature Alert",
-                        "message": f"Temperature is {weather_data.get('temperature', 0)}°C. Ensure plants have adequate water."
-                    })
-                
-                if air_quality_data.get("aqi", 2) >= 4:
-                    alerts.append({
-                        "id": "a1",
-                        "title": "Poor Air Quality",
-                        "message": "Air quality is poor. This may affect sensitive crops."
-                    })
-                
-                snapshot["weatherAlerts"] = alerts if alerts else [
-                    {
-                        "id": "w0",
-                        "title": "No Weather Alerts",
-                        "message": "Weather conditions are favorable for farming activities."
-                    }
-                ]
-            
-            return {"status": "success", "data": snapshot}
+            return {"status": "success", "data": snapshot}, version
         else:
             raise HTTPException(status_code=404, detail="No sensor data found")
+
+    try:
+        current = None
+        if not refresh and sensor_snapshot.is_fresh():
+            current = sensor_payload_version(sensor_snapshot.get(), sensor_snapshot.revision, lat, lon)
+        # Polls answer 304 while neither the device, its weather tile nor the chart changed
+        return await conditional_json(request, current, build)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-def predict_soil_health_from_sensors(sensor_data):
+def sensor_soil_inputs(sensor_data: Dict[str, Any], weather_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Map sensor data and weather API data to the soil health model input format
+    """
+    return {
+        # Use sensor data where available
+        "pH": sensor_data.get("ph", 6.5),
+        "Nitrogen_ppm": 1500,  # Default value
+        "Phosphorus_ppm": 15,  # Default value
+        "Potassium_ppm": 200,  # Default value
+        "Organic_Carbon_percent": 1.5,  # Default value
+        "Salinity_dS_m": sensor_data.get("salinity", 0.8),
+        # Use real weather data from API
+        "Temperature_C": weather_data.get("temperature", sensor_data.get("temperature", 25.0)),
+        "Rainfall_mm": weather_data.get("rainfall_mm", 750),  # Use API data or default
+        "Clay_Content_percent": 25.0,  # Default value
+        "Soil_Moisture_percent": sensor_data.get("moisture", 50.0)
+    }
+
+# Soil health is re-scored only when a sensor input moves past its deadband; weather inputs on any change
+SOIL_DEADBANDS = {
+    "pH": float(os.getenv("SOIL_DEADBAND_PH", "0.05")),
+    "Salinity_dS_m": float(os.getenv("SOIL_DEADBAND_SALINITY", "0.05")),
+    "Soil_Moisture_percent": float(os.getenv("SOIL_DEADBAND_MOISTURE", "1.0"))
+}
+soil_health_memo = DeadbandMemo("soil_health", SOIL_DEADBANDS)
+
+def predict_soil_health_from_sensors(sensor_data, weather_data: Optional[Dict[str, Any]] = None,
+                                     memo_key=None, refresh: bool = False):
     """
-    Predict soil health based on sensor data and weather API data
+    Predict soil health based on sensor data and weather API data.
+    With a memo_key the last result for that key is reused while inputs stay within deadband
+    (refresh=True always re-scores).
     """
     try:
         # Ensure soil health models are loaded
         ensure_models_loaded()
         
-        # Get weather data from OpenWeatherMap API
-        weather_data = get_weather_data()
-        
-        # Map sensor data to soil health model input format
-        soil_data = {
-            # Use sensor data where available
-            "pH": sensor_data.get("ph", 6.5),
-            "Nitrogen_ppm": 1500,  # Default value
-            "Phosphorus_ppm": 15,  # Default value
-            "Potassium_ppm": 200,  # Default value
-            "Organic_Carbon_percent": 1.5,  # Default value
-            "Salinity_dS_m": sensor_data.get("salinity", 0.8),
-            # Use real weather data from API
-            "Temperature_C": weather_data.get("temperature", sensor_data.get("temperature", 25.0)),
-            "Rainfall_mm": weather_data.get("rainfall_mm", 750),  # Use API data or default
-            "Clay_Content_percent": 25.0,  # Default value
-            "Soil_Moisture_percent": sensor_data.get("moisture", 50.0)
-        }
+        # Get weather data from OpenWeatherMap API unless the caller already has it
+        if weather_data is None:
+            weather_data = get_weather_data()
         
         # Predict soil health
-        result = predict_soil_health(soil_data, return_probabilities=False)
+        inputs = sensor_soil_inputs(sensor_data, weather_data)
+        if memo_key is None:
+            return predict_soil_health(inputs, return_probabilities=False)
+        result = soil_health_memo.get_or_compute(
+            memo_key, inputs, lambda: predict_soil_health(inputs, return_probabilities=False), force=refresh
+        )
         return result
     except Exception as e:
         print(f"Error in soil health prediction: {str(e)}")
         raise
 
 @router.get("/soil-health")
-async def get_soil_health():
+async def get_soil_health(lat: Optional[float] = Query(None, ge=-90, le=90),
+                          lon: Optional[float] = Query(None, ge=-180, le=180),
+                          refresh: bool = Query(False, description="Re-score even if inputs are within deadband")):
     """
     Get soil health prediction based on current sensor data
     """
     try:
-        ref = db.reference('wirelessDevice')
-        snapshot = ref.get()
+        snapshot = await sensor_snapshot.read()
         
         if snapshot:
-            soil_health = predict_soil_health_from_sensors(snapshot)
+            location = resolve_location(snapshot, lat, lon)
+            weather_data = await weather_tiles.get_weather(*location)
+            soil_health = predict_soil_health_from_sensors(snapshot, weather_data,
+                                                           memo_key=(HISTORY_DEVICE, location_key(*location)),
+                                                           refresh=refresh)
             return {"status": "success", "data": soil_health}
         else:
             raise HTTPException(status_code=404, detail="No sensor data found")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/soil-health/stats")
+async def get_soil_health_stats():
+    """
+    Soil health memoization: deadbands, cached devices, recomputes done and avoided
+    """
+    return {"status": "success", "data": soil_health_memo.stats()}
+
 @router.get("/weather")
-async def get_weather():
+async def get_weather(request: Request,
+                      lat: Optional[float] = Query(None, ge=-90, le=90),
+                      lon: Optional[float] = Query(None, ge=-180, le=180)):
     """
-    Get current weather data from OpenWeatherMap API
+    Get current weather data for a location (defaults to the configured farm location)
     """
+    async def build():
+        weather_data = await weather_tiles.get_combined(lat, lon)
+        return {"status": "success", "data": weather_data}, weather_tiles.version(lat, lon)
+
     try:
-        weather_data = get_combined_data()
-        return {"status": "success", "data": weather_data}
+        # The tile's update time versions the response
+        return await conditional_json(request, weather_tiles.version(lat, lon), build)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/weather/stats")
+async def get_weather_cache_stats():
+    """
+    Weather cache hit/miss/refresh counters and upstream call volume
+    """
+    return {"status": "success", "data": {**get_cache_stats(), "tiles": weather_tiles.stats()}}
+
+@router.get("/stream")
+async def stream_sensor_data(lat: Optional[float] = Query(None, ge=-90, le=90),
+                             lon: Optional[float] = Query(None, ge=-180, le=180)):
+    """
+    Server-Sent Events: the full sensor payload on connect, then only the fields that changed
+    """
+    subscription = sensor_stream.subscribe(location_key(lat, lon))
+
+    async def events():
+        try:
+            while True:
+                message = await subscription.get(timeout=SENSOR_STREAM_KEEPALIVE_S)
+                if message is None:
+                    yield b": keep-alive\n\n"
+                else:
+                    yield sse_event(message["type"], message, message.get("version"))
+        finally:
+            subscription.close()
+
+    return sse_response(events())
+
+@router.websocket("/stream/ws")
+async def stream_sensor_data_ws(websocket: WebSocket, lat: Optional[float] = Query(None, ge=-90, le=90),
+                                lon: Optional[float] = Query(None, ge=-180, le=180)):
+    """
+    WebSocket variant of /stream; messages are the same JSON objects, plus {"type": "ping"} when idle
+    """
+    await websocket.accept()
+    subscription = sensor_stream.subscribe(location_key(lat, lon))
+
+    async def wait_for_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    disconnected = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        while True:
+            getter = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait({getter, disconnected}, timeout=SENSOR_STREAM_KEEPALIVE_S,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if getter not in done:
+                getter.cancel()
+            if disconnected in done:
+                break
+            message = getter.result() if getter in done else {"type": "ping"}
+            await websocket.send_text(json.dumps(message, default=str))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        disconnected.cancel()
+        subscription.close()
+
+@router.get("/history")
+async def get_sensor_history(metric: str = Query(..., description="Reading field, e.g. moisture"),
+                             start: Optional[datetime] = Query(None, description="Defaults to 24 hours before end"),
+                             end: Optional[datetime] = Query(None, description="Defaults to now"),
+                             resolution: Optional[float] = Query(None, gt=0, description="Bucket size in seconds"),
+                             points: int = Query(200, ge=1, le=SENSOR_HISTORY_MAX_POINTS,
+                                                 description="Target bucket count when resolution is not given"),
+                             device: Optional[str] = Query(None)):
+    """
+    Downsampled history of one metric: min/max/avg/count per time bucket as parallel arrays
+    (t is the bucket start in epoch seconds; empty buckets are omitted)
+    """
+    try:
+        end_ts = end.timestamp() if end is not None else time.time()
+        start_ts = start.timestamp() if start is not None else end_ts - 24 * 3600
+        if resolution is None:
+            resolution = max(1.0, math.ceil((end_ts - start_ts) / points))
+        history = await run_in_threadpool(
+            sensor_history.query, device or HISTORY_DEVICE, metric, start_ts, end_ts, resolution
+        )
+        if history is None:
+            raise HTTPException(status_code=404, detail=f"No history recorded for {metric}")
+        return {"status": "success", "data": history}
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/history/metrics")
+async def get_sensor_history_metrics(device: Optional[str] = Query(None)):
+    """
+    Recorded metrics for a device with their reading counts and time ranges
+    """
+    try:
+        device = device or HISTORY_DEVICE
+        metrics = await run_in_threadpool(sensor_history.metrics, device)
+        return {"status": "success", "data": {"device": device, "devices": sensor_history.devices(), "metrics": metrics}}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/devices/{device_id}/readings", status_code=202)
+async def ingest_device_reading(device_id: str, reading: Dict[str, Any] = Body(...)):
+    """
+    Ingest one reading for a device; soil health is scored in the next batched tick
+    """
+    try:
+        validate_reading(reading)
+        # History appends touch memory-mapped files; keep them off the event loop
+        state = await run_in_threadpool(sensor_fleet.ingest, device_id, reading, parse_timestamp(reading.get("timestamp")))
+        sensor_fleet.wake()
+        return {"status": "success", "data": {"device_id": device_id, "readings": state.readings}}
+    except DeviceRejected as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/readings/bulk", status_code=202)
+async def ingest_bulk_readings(readings: List[Any] = Body(...)):
+    """
+    Ingest buffered readings from a gateway: a JSON array of objects with device_id, an optional
+    timestamp (epoch seconds or ISO 8601) and the reading fields. Invalid entries are rejected individually.
+    """
+    if len(readings) > FLEET_BULK_MAX_READINGS:
+        raise HTTPException(status_code=413, detail=f"At most {FLEET_BULK_MAX_READINGS} readings per request")
+    accepted, rejected = [], []
+    for index, reading in enumerate(readings):
+        try:
+            validate_reading(reading)
+            device_id = reading.get("device_id")
+            if not isinstance(device_id, str) or not valid_name(device_id):
+                raise ValueError("device_id is required (letters, digits, '_', '-' and '.')")
+            sensor_fleet.check_device(device_id)
+            accepted.append((device_id, reading, parse_timestamp(reading.get("timestamp"))))
+        except ValueError as e:
+            rejected.append({"index": index, "error": str(e)})
+
+    # History appends touch memory-mapped files; keep them off the event loop
+    # Devices admitted above can still be turned away if the fleet fills up meanwhile; only ingested ones count
+    ingested = await run_in_threadpool(sensor_fleet.ingest_many, accepted)
+    sensor_fleet.wake()
+    return {"status": "success", "data": {"accepted": ingested, "rejected": rejected}}
+
+@router.get("/devices")
+async def list_devices(category: Optional[str] = Query(None, description="Health category, e.g. Poor"),
+                       issue: Optional[str] = Query(None, description="Active issue, e.g. Low Soil Moisture"),
+                       offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    """
+    Devices with their latest reading and precomputed soil health
+    """
+    total, devices = sensor_fleet.devices(category, issue, offset, limit)
+    return {"status": "success", "data": {"total": total, "devices": devices}}
+
+@router.get("/devices/summary")
+async def get_fleet_summary():
+    """
+    Fleet-wide soil health: category and issue counts, pending/stale devices and scoring statistics
+    """
+    return {"status": "success", "data": sensor_fleet.summary()}
+
+@router.get("/devices/{device_id}")
+async def get_device(device_id: str):
+    """
+    Latest reading and precomputed soil health for one device
+    """
+    device = sensor_fleet.device(device_id)
+    if device is None:
+        raise HTTPException(status_code=404, detail=f"Unknown device: {device_id}")
+    return {"status": "success", "data": device}
+
+@router.get("/snapshot/stats")
+async def get_snapshot_stats():
+    """
+    Sensor snapshot listener state (connection, staleness, revision, reads), stream fan-out, write batching
+    counters and open history series
+    """
+    return {"status": "success", "data": {**sensor_snapshot.stats(), "stream": sensor_stream.stats(),
+                                          "writes": sensor_writes.stats(), "history": sensor_history.stats()}}
+
+async def write_device(device: Optional[str], values: Dict[str, Any]) -> dict:
+    """
+    Queue a write to a device node (the mirrored one by default) and wait until Firebase has stored it.
+    Other devices must be known to the fleet; their nodes are under SENSOR_DEVICES_PATH
+    """
+    sensor_snapshot.backend.ensure_ready()
+    if device is None or device == HISTORY_DEVICE:
+        path = SENSOR_SNAPSHOT_PATH
+    else:
+        if not valid_name(device):
+            raise ValueError(f"Invalid device: {device!r}")
+        if sensor_fleet.device(device) is None:
+            raise HTTPException(status_code=404, detail=f"Unknown device: {device}")
+        path = f"{SENSOR_DEVICES_PATH}/{device}"
+    try:
+        # Shielded: a client that gives up doesn't cancel the write for the others in its batch
+        return await asyncio.wait_for(asyncio.shield(sensor_writes.write(path, values)), SENSOR_WRITE_ACK_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Write was queued but not confirmed in time")
+
 @router.post("/update")
-async def update_threshold(update: ThresholdUpdate):
+async def update_threshold(update: ThresholdUpdate,
+                           device: Optional[str] = Query(None, description="Fleet device id (defaults to the mirrored device)")):
     try:
-        # Update the threshold in Firebase
-        ref = db.reference('wirelessDevice')
-        ref.update({
-            'threshold': update.threshold
-        })
-        return {"status": "success", "message": "Threshold updated successfully"}
+        # Update the threshold in Firebase; the listener applies the change to the snapshot
+        ack = await write_device(device, {'threshold': update.threshold})
+        return {"status": "success", "message": "Threshold updated successfully", "ack": ack}
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/irrigate")
-async def update_irrigation(update: IrrigationUpdate):
+async def update_irrigation(update: IrrigationUpdate,
+                            device: Optional[str] = Query(None, description="Fleet device id (defaults to the mirrored device)")):
     try:
-        # Update the irrigation status in Firebase
-        ref = db.reference('wirelessDevice')
-        ref.update({
-            'irrigation': update.irrigation
-        })
-        return {"status": "success", "message": "Irrigation status updated successfully"}
+        # Update the irrigation status in Firebase; the listener applies the change to the snapshot
+        ack = await write_device(device, {'irrigation': update.irrigation})
+        return {"status": "success", "message": "Irrigation status updated successfully", "ack": ack}
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -224,15 +643,15 @@ async def update_irrigation(update: IrrigationUpdate):
 async def health_check():
     try:
         # Check Firebase connection
-        ref = db.reference('wirelessDevice')
-        snapshot = ref.get()
+        snapshot = await sensor_snapshot.read()
         
         # Check weather API
-        weather_data = get_weather_data()
+        weather_data = await weather_tiles.get_weather()
         
         return {
             "status": "healthy",
             "firebase": "connected" if snapshot is not None else "error",
+            "sensor_snapshot": sensor_snapshot.stats(),
             "weather_api": "connected" if weather_data.get("timestamp", 0) > 0 else "using fallback data",
             "timestamp": datetime.now().isoformat()
         }
@@ -1,9 +1,20 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel, Field
 import joblib
-import pandas as pd
+import numpy as np
 import os
-from typing import Dict, List
+from typing import TYPE_CHECKING, Dict, List, Mapping, Union
+
+from utils.features import FeatureVector, verify_feature_names
+from utils.model_registry import model_registry
+from utils.metrics import registry, timed
+from utils.tree_compiler import compile_model, model_backend
+from utils.streaming import ndjson_response
+from utils.tabular_upload import read_tabular_chunks, stream_scored_rows
+
+# Type hints only; pandas is imported lazily by the bulk upload helpers
+if TYPE_CHECKING:
+    import pandas as pd
 
 router = APIRouter(
     prefix="/soil",
@@ -52,95 +63,109 @@ issue_cols = [
 def load_soil_models():
     """Load ML models and scaler."""
     global health_model, issues_model, scaler
-    try:
-        if not os.path.exists(SHI_MODEL_DIR):
-            raise FileNotFoundError(f"Model directory not found: {SHI_MODEL_DIR}")
-            
-        health_model_path = os.path.join(SHI_MODEL_DIR, 'soil_health_index_model.joblib')
-        issues_model_path = os.path.join(SHI_MODEL_DIR, 'soil_issues_model.joblib')
-        scaler_path = os.path.join(SHI_MODEL_DIR, 'feature_scaler.joblib')
+    if not os.path.exists(SHI_MODEL_DIR):
+        raise FileNotFoundError(f"Model directory not found: {SHI_MODEL_DIR}")
         
-        if not all(os.path.exists(p) for p in [health_model_path, issues_model_path, scaler_path]):
-            raise FileNotFoundError("One or more model files are missing")
-            
-        health_model = joblib.load(health_model_path)
-        issues_model = joblib.load(issues_model_path)
-        scaler = joblib.load(scaler_path)
+    health_model_path = os.path.join(SHI_MODEL_DIR, 'soil_health_index_model.joblib')
+    issues_model_path = os.path.join(SHI_MODEL_DIR, 'soil_issues_model.joblib')
+    scaler_path = os.path.join(SHI_MODEL_DIR, 'feature_scaler.joblib')
+    
+    if not all(os.path.exists(p) for p in [health_model_path, issues_model_path, scaler_path]):
+        raise FileNotFoundError("One or more model files are missing")
         
-        print("Successfully loaded soil health models")
-        return True
-    except Exception as e:
-        print(f"Error loading soil health models: {str(e)}")
-        return False
+    health_model = joblib.load(health_model_path)
+    issues_model = joblib.load(issues_model_path)
+    scaler = joblib.load(scaler_path)
+    
+    # Check column order once so predictions can pass plain arrays
+    verify_feature_names(scaler, feature_cols, "Soil feature scaler")
+    verify_feature_names(health_model, feature_cols, "Soil health index model")
+    verify_feature_names(issues_model, feature_cols, "Soil issues model")
+    
+    # Swap in flat-array tree evaluation where it matches sklearn exactly
+    scaler = compile_model(scaler, "Soil feature scaler")
+    health_model = compile_model(health_model, "Soil health index model")
+    issues_model = compile_model(issues_model, "Soil issues model")
+    
+    print("Successfully loaded soil health models")
+
+def warmup_soil_models():
+    """Score one typical sample so first-request setup costs are paid up front."""
+    sample = {
+        name: field.json_schema_extra["example"]
+        for name, field in SoilDataInput.model_fields.items()
+    }
+    predict_soil_health(sample, return_probabilities=True)
 
-# Try to load models at startup
-models_loaded = load_soil_models()
+# Models are loaded in the background at startup
+model_registry.register("soil_health", load_soil_models, warmup=warmup_soil_models)
 
 def ensure_models_loaded():
     """Ensure models are loaded before making predictions."""
-    if not models_loaded or not all([health_model, issues_model, scaler]):
-        if load_soil_models():
-            return True
-        raise HTTPException(
-            status_code=503,
-            detail="Soil health models not loaded. Please ensure model files are present and try again."
-        )
-    return True
-
-def predict_soil_health(soil_data: dict, return_probabilities: bool = False) -> dict:
-    """Predict soil health index and issues from input data."""
-    if isinstance(soil_data, dict):
-        soil_data = pd.DataFrame([soil_data])
-    
-    for col in feature_cols:
-        if col not in soil_data.columns:
-            raise ValueError(f"Missing required feature: {col}")
-    
-    soil_data = soil_data[feature_cols]
-    scaled_data = scaler.transform(soil_data)
+    return model_registry.ensure_ready(
+        "soil_health",
+        detail="Soil health models not loaded. Please ensure model files are present and try again."
+    )
+
+# Health index thresholds: < 20 Very Poor, < 40 Poor, < 60 Moderate, < 80 Good, else Excellent
+HEALTH_CATEGORY_BINS = np.array([20, 40, 60, 80])
+HEALTH_CATEGORIES = np.array(['Very Poor', 'Poor', 'Moderate', 'Good', 'Excellent'])
+ISSUE_LABELS = [issue.replace('_', ' ') for issue in issue_cols]
+
+soil_features = FeatureVector(feature_cols)
+
+# Single-sample inference latency (API and sensor-derived predictions)
+soil_predict_latency = registry.timer("soil_predict_seconds", "Soil health prediction latency per sample")
+
+def health_categories(health_index: np.ndarray) -> np.ndarray:
+    """Map health index values to categories in one vectorized lookup."""
+    return HEALTH_CATEGORIES[np.digitize(health_index, HEALTH_CATEGORY_BINS)]
+
+def score_soil_array(features: np.ndarray, return_probabilities: bool = False) -> List[dict]:
+    """Score every row of a (n, len(feature_cols)) array with one call per model."""
+    scaled_data = scaler.transform(features)
     
-    health_index = health_model.predict(scaled_data)
-    if hasattr(health_index, "ndim") and health_index.ndim > 1:
-        health_index = health_index.flatten()
+    health_index = np.asarray(health_model.predict(scaled_data), dtype=np.float64).reshape(len(features), -1)[:, 0]
+    categories = health_categories(health_index)
     
     if return_probabilities:
         issue_probs = issues_model.predict_proba(scaled_data)
-        issues = {issue: issue_probs[i][0][1] for i, issue in enumerate(issue_cols)}
-    else:
-        issues_pred = issues_model.predict(scaled_data)
-        issues = {issue: bool(issues_pred[0][i]) for i, issue in enumerate(issue_cols)}
-    
-    result = {
-        'health_index': float(health_index[0]),
-        'issues': issues
-    }
-    
-    hi = result['health_index']
-    if hi >= 80:
-        result['health_category'] = 'Excellent'
-    elif hi >= 60:
-        result['health_category'] = 'Good'
-    elif hi >= 40:
-        result['health_category'] = 'Moderate'
-    elif hi >= 20:
-        result['health_category'] = 'Poor'
+        issue_values = np.column_stack([probs[:, 1] for probs in issue_probs])
+        active = issue_values > 0.5
     else:
-        result['health_category'] = 'Very Poor'
+        issue_values = np.asarray(issues_model.predict(scaled_data)).astype(bool)
+        active = issue_values
     
-    result['active_issues'] = [
-        issue.replace('_', ' ') 
-        for issue, active in issues.items() 
-        if (active if isinstance(active, bool) else active > 0.5)
-    ]
-    
-    return result
+    results = []
+    for hi, category, values, flags in zip(health_index.tolist(), categories.tolist(),
+                                           issue_values.tolist(), active.tolist()):
+        results.append({
+            'health_index': hi,
+            'issues': dict(zip(issue_cols, values)),
+            'health_category': category,
+            'active_issues': [label for label, flag in zip(ISSUE_LABELS, flags) if flag]
+        })
+    return results
+
+def score_soil_frame(soil_data: "pd.DataFrame", return_probabilities: bool = False) -> List[dict]:
+    """Score every row of a DataFrame with one call per model."""
+    for col in feature_cols:
+        if col not in soil_data.columns:
+            raise ValueError(f"Missing required feature: {col}")
+    return score_soil_array(soil_data[feature_cols].to_numpy(dtype=np.float64), return_probabilities)
+
+@timed(soil_predict_latency)
+def predict_soil_health(soil_data: Union[Mapping, BaseModel, "pd.DataFrame"], return_probabilities: bool = False) -> dict:
+    """Predict soil health index and issues from input data."""
+    if isinstance(soil_data, (Mapping, BaseModel)):
+        return score_soil_array(soil_features.pack(soil_data), return_probabilities)[0]
+    return score_soil_frame(soil_data, return_probabilities)[0]
 
 @router.post("/predict", response_model=SoilHealthResponse)
 def predict_soil(soil_data: SoilDataInput):
     ensure_models_loaded()
     try:
-        data = soil_data.dict()
-        return predict_soil_health(data, return_probabilities=False)
+        return predict_soil_health(soil_data, return_probabilities=False)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -150,20 +175,47 @@ def predict_soil(soil_data: SoilDataInput):
 def predict_soil_detailed(soil_data: SoilDataInput):
     ensure_models_loaded()
     try:
-        data = soil_data.dict()
-        return predict_soil_health(data, return_probabilities=True)
+        return predict_soil_health(soil_data, return_probabilities=True)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error during prediction")
 
+# Bulk scoring for lab uploads (JSON array or CSV), streamed back one NDJSON line per sample
+SOIL_BATCH_CHUNK_SIZE = int(os.getenv("SOIL_BATCH_CHUNK_SIZE", "1000"))
+
+@router.post("/predict/batch")
+async def predict_soil_batch(request: Request, detailed: bool = False):
+    """
+    Score many soil samples at once. Accepts a JSON array of samples, a CSV
+    body, or a multipart CSV upload in a "file" field. Streams one NDJSON
+    line per sample; pass ?detailed=true for issue probabilities.
+    """
+    ensure_models_loaded()
+    try:
+        chunks = await read_tabular_chunks(request, feature_cols, SOIL_BATCH_CHUNK_SIZE)
+        return ndjson_response(stream_scored_rows(
+            chunks, feature_cols, lambda features: score_soil_array(features, detailed)
+        ))
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal server error during batch prediction")
+
 @router.get("/health")
 def health_check():
     try:
         ensure_models_loaded()
         return {
             "status": "healthy",
-            "models_loaded": True
+            "models_loaded": True,
+            "model_backends": {
+                "scaler": model_backend(scaler),
+                "health_model": model_backend(health_model),
+                "issues_model": model_backend(issues_model)
+            }
         }
     except Exception as e:
         return {
@@ -1,12 +1,20 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 import uvicorn
 import os
 from dotenv import load_dotenv
 
 # Import routers
 from routes import plant_disease, soil_health, crop_recommendation, sensor, market
+from utils.model_registry import model_registry
+from utils.conditional import get_response_stats
+from utils.http_metrics import MetricsMiddleware
+from utils.metrics import METRICS_ENABLED, registry
+from utils.weather_api import AsyncWeatherAPI
+from utils.market_api import MarketAPI
+from utils.weather_tiles import weather_tiles
 
 # Load environment variables
 load_dotenv()
@@ -14,7 +22,9 @@ load_dotenv()
 app = FastAPI(
     title="KrishiMitra API",
     description="Backend API for KrishiMitra - A Smart Agriculture Platform",
-    version="2.0.0"
+    version="2.0.0",
+    # orjson encodes responses several times faster than the stdlib encoder
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -26,6 +36,10 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Per-route latency, status counts and in-flight gauges for /metrics; outermost, so CORS time counts too
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(plant_disease.router)
 app.include_router(soil_health.router)
@@ -33,19 +47,97 @@ app.include_router(crop_recommendation.router)
 app.include_router(sensor.router)
 app.include_router(market.router)
 
+@app.on_event("startup")
+async def start_model_loading():
+    # Models load in parallel in the background so the port binds immediately
+    model_registry.start_background_loading()
+    # Keep weather for every active geo-tile fresh without per-request upstream calls
+    weather_tiles.start()
+    # Mirror the sensor node in memory so sensor reads don't round-trip to Firebase
+    sensor.sensor_snapshot.start()
+    # Score pending fleet devices in batches off the request path
+    sensor.sensor_fleet.start()
+    # Pull watched mandi prices into the local warehouse on a schedule
+    market.market_ingestor.start()
+
+@app.on_event("shutdown")
+async def close_upstream_clients():
+    await weather_tiles.stop()
+    await sensor.sensor_fleet.stop()
+    await market.market_ingestor.stop()
+    # Pending threshold/irrigation writes go out before the connection closes
+    await sensor.sensor_writes.close()
+    await run_in_threadpool(sensor.sensor_snapshot.stop)
+    sensor.sensor_history.close()
+    await AsyncWeatherAPI.close()
+    await MarketAPI.close()
+    market.market_warehouse.close()
+
+@app.get("/live")
+async def live():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "alive"}
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: per-model load state; 503 until every component is ready"""
+    report = model_registry.report()
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
+
+@app.get("/responses/stats")
+async def response_stats():
+    """304 ratio and bytes saved by conditional GETs and compression on polled endpoints"""
+    return {"status": "success", "data": get_response_stats()}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint: request, hot-path latency, cache and upstream metrics"""
+    if not METRICS_ENABLED:
+        return PlainTextResponse("Metrics are disabled (METRICS_ENABLED=0)\n", status_code=404)
+    return PlainTextResponse(registry.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def root():
     return {
         "message": "Welcome to KrishiMitra API",
         "endpoints": {
             "/plant/predict": "Plant disease detection",
+            "/plant/predict/raw": "Plant disease detection from a raw image/* request body",
+            "/plant/predict/batch": "Bulk plant disease detection (multipart images or zip, NDJSON results)",
+            "/plant/batching/stats": "Plant inference batching statistics",
+            "/plant/cache/stats": "Plant prediction cache statistics",
             "/soil/predict": "Soil health prediction",
             "/soil/predict/detailed": "Detailed soil health prediction",
+            "/soil/predict/batch": "Bulk soil health scoring (JSON array or CSV, NDJSON results)",
             "/crop/predict": "Crop recommendation",
+            "/crop/predict/batch": "Bulk crop recommendation with per-request top_k (JSON array or CSV, NDJSON results)",
+            "/crop/suitability/jobs": "Start (POST) or list background crop suitability map jobs over raster grids",
             "/crop/health": "Crop recommendation health check",
-            "/api/sensor": "Get sensor data",
-            "/api/sensor/update": "Update sensor threshold",
-            "/api/sensor/irrigate": "Update irrigation status"
+            "/api/sensor": "Get sensor data (ETag/If-None-Match, gzip)",
+            "/api/sensor/update": "Update sensor threshold (?device=; batched, returns once stored)",
+            "/api/sensor/irrigate": "Update irrigation status (?device=; batched, returns once stored)",
+            "/api/sensor/stream": "Server-Sent Events: sensor snapshot on connect, then deltas (WebSocket at /api/sensor/stream/ws)",
+            "/api/sensor/weather": "Weather for a location (?lat=&lon=), served from the geo-tile table (ETag/If-None-Match)",
+            "/api/sensor/weather/stats": "Weather cache, circuit breaker and tile refresh statistics",
+            "/api/sensor/history": "Downsampled sensor history (?metric=&start=&end=&resolution=), min/max/avg per bucket",
+            "/api/sensor/history/metrics": "Recorded sensor metrics with reading counts and time ranges",
+            "/api/sensor/devices": "Fleet devices with latest reading and precomputed soil health (?category=&issue=)",
+            "/api/sensor/devices/summary": "Fleet-wide soil health summary and batched scoring statistics",
+            "/api/sensor/devices/{device_id}/readings": "Ingest one device reading (POST)",
+            "/api/sensor/readings/bulk": "Ingest buffered readings from many devices (POST, JSON array)",
+            "/api/sensor/snapshot/stats": "Sensor snapshot listener, stream fan-out and write batching statistics",
+            "/api/sensor/soil-health/stats": "Soil health deadband memo: cached devices, recomputes done and avoided",
+            "/api/market/insights": "Mandi prices (?commodity=&state=&market=), cached with stale-while-revalidate (ETag/If-None-Match)",
+            "/api/market/stats": "Market cache, upstream call and circuit breaker statistics",
+            "/api/market/prices": "Stored prices (?commodity=&state=&market=&start=&end=) with min/max/average",
+            "/api/market/trends": "Modal price trend from stored prices (?interval=day|week|month)",
+            "/api/market/best": "Best-paying markets in a state (?commodity=&state=&days=)",
+            "/api/market/warehouse/ingest": "Run market ingestion now (POST, ?force=true pulls everything)",
+            "/api/market/warehouse/stats": "Market warehouse size, watched series and ingestion runs",
+            "/live": "Liveness probe",
+            "/ready": "Readiness probe with per-model load state",
+            "/responses/stats": "Conditional GET (304) ratio and bytes saved by 304s and compression",
+            "/metrics": "Prometheus metrics: per-route latency, hot-path timers, in-flight requests, upstream errors"
         }
     }
 
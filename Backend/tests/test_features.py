@@ -0,0 +1,54 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.multioutput import MultiOutputClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+from utils.features import verify_feature_names
+
+NAMES = ["ph", "moisture", "salinity"]
+
+
+def training_data():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.random((60, len(NAMES))), columns=NAMES)
+    Y = rng.integers(0, 2, (60, 2))
+    return X, Y
+
+
+def predict_without_warnings(model, X):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        return model.predict(X)
+
+
+def test_multi_output_model_fitted_on_a_dataframe_accepts_ndarrays():
+    X, Y = training_data()
+    model = MultiOutputClassifier(RandomForestClassifier(n_estimators=5, random_state=0)).fit(X, Y)
+    expected = model.predict(X)
+
+    verify_feature_names(model, NAMES, "Soil issues model")
+
+    assert all(not hasattr(inner, "feature_names_in_") for inner in model.estimators_)
+    np.testing.assert_array_equal(predict_without_warnings(model, X.to_numpy()), expected)
+
+
+def test_pipeline_steps_drop_their_names():
+    X, Y = training_data()
+    model = make_pipeline(StandardScaler(), RandomForestClassifier(n_estimators=5, random_state=0)).fit(X, Y[:, 0])
+
+    verify_feature_names(model, NAMES, "Pipeline")
+
+    predict_without_warnings(model, X.to_numpy())
+
+
+def test_mismatched_columns_are_rejected():
+    X, Y = training_data()
+    model = MultiOutputClassifier(RandomForestClassifier(n_estimators=5)).fit(X[NAMES[::-1]], Y)
+
+    with pytest.raises(ValueError, match="fitted on features"):
+        verify_feature_names(model, NAMES, "Soil issues model")
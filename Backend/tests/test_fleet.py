@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from utils.fleet import DeviceRejected, SensorFleet
+from utils.timeseries import TimeSeriesStore
+
+
+async def score(devices):
+    return [{"health_index": reading.get("moisture", 0), "health_category": "Good", "active_issues": []}
+            for _, reading in devices]
+
+
+@pytest.fixture
+def history(tmp_path):
+    store = TimeSeriesStore(str(tmp_path), capacity=16, min_interval=0)
+    yield store
+    store.close()
+
+
+def test_history_keeps_only_listed_fields(history):
+    fleet = SensorFleet(score, history=history, history_fields=["moisture", "ph"])
+    fleet.ingest("dev1", {"moisture": 30, "ph": 6.5, "junk1": 1, "junk2": 2}, t=1000)
+    assert [m["metric"] for m in history.metrics("dev1")] == ["moisture", "ph"]
+    # Unlisted fields still update the latest reading
+    assert fleet.device("dev1")["reading"]["junk1"] == 1
+
+
+def test_new_devices_beyond_the_limit_are_rejected(history):
+    fleet = SensorFleet(score, history=history, max_devices=2)
+    fleet.ingest("dev1", {"moisture": 1})
+    fleet.ingest("dev2", {"moisture": 2})
+    with pytest.raises(DeviceRejected):
+        fleet.ingest("dev3", {"moisture": 3})
+    # Known devices keep reporting
+    assert fleet.ingest("dev1", {"moisture": 4}).readings == 2
+    assert history.devices() == ["dev1", "dev2"]
+    assert fleet.summary()["devices"] == 2
+
+
+def test_only_registered_devices_are_accepted_when_listed(history):
+    fleet = SensorFleet(score, history=history, allowed_devices=["dev1"])
+    fleet.register("gateway")
+    fleet.ingest("dev1", {"moisture": 1})
+    fleet.ingest("gateway", {"moisture": 1})
+    with pytest.raises(DeviceRejected):
+        fleet.check_device("users")
+    assert fleet.ingest_many([("dev1", {"moisture": 2}, 1.0), ("other", {"moisture": 3}, 2.0)]) == 1
+
+
+def test_pending_devices_are_scored_in_one_batch():
+    fleet = SensorFleet(score)
+    for i in range(5):
+        fleet.ingest(f"dev{i}", {"moisture": i})
+    assert asyncio.run(fleet.score_pending()) == 5
+    assert fleet.summary()["pending"] == 0
+    assert fleet.device("dev3")["soil_health"]["health_index"] == 3
+    assert fleet.score_batches.value >= 1
@@ -0,0 +1,126 @@
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+
+from utils import market_warehouse
+from utils.market_warehouse import LocalMarketSource, MarketIngestor, MarketWarehouse
+
+START = date(2024, 1, 1)
+
+
+def price_row(day: int, modal: float, market: str = "Pune", commodity: str = "Onion", state: str = "Maharashtra"):
+    when = START + timedelta(days=day)
+    return {"Date": when.strftime("%d %b %Y"), "Commodity": commodity, "State": state, "Market": market,
+            "Variety": "Red", "Min Price": str(modal - 100), "Max Price": f"{modal + 100:,.0f}",
+            "Modal Price": str(modal)}
+
+
+class FailingSource:
+    name = "failing"
+
+    async def fetch(self, commodity, state, market):
+        raise ConnectionError("upstream down")
+
+
+@pytest.fixture
+def warehouse(tmp_path, monkeypatch):
+    path = str(tmp_path / "market.db")
+    monkeypatch.setenv("MARKET_DB_PATH", path)
+    warehouse = MarketWarehouse(path)
+    yield warehouse
+    warehouse.close()
+
+
+def pull(warehouse, source, series=("Onion", "Maharashtra", "Pune")):
+    return asyncio.run(MarketIngestor(warehouse, source, [series]).ingest(*series))
+
+
+def test_pulls_are_incremental_from_the_watermark(warehouse, monkeypatch):
+    monkeypatch.setattr(market_warehouse, "MARKET_INGEST_OVERLAP_DAYS", 3)
+    source = LocalMarketSource([price_row(day, 1500 + day) for day in range(10)])
+
+    first = pull(warehouse, source)
+    assert first["stored"] == 10
+    assert first["last_date"] == (START + timedelta(days=9)).isoformat()
+
+    # Same rows again: nothing changed, so nothing counts as stored
+    assert pull(warehouse, source)["stored"] == 0
+
+    # A correction inside the overlap window is applied; one before it is ignored
+    source.rows[8] = price_row(8, 9999)
+    source.rows[2] = price_row(2, 9999)
+    source.add([price_row(10, 1600)])
+    third = pull(warehouse, source)
+    assert third["stored"] == 2
+    assert third["last_date"] == (START + timedelta(days=10)).isoformat()
+
+    rows = {row["date"]: row["modal_price"] for row in warehouse.prices("onion", "maharashtra", "PUNE")["rows"]}
+    assert rows[(START + timedelta(days=8)).isoformat()] == 9999
+    assert rows[(START + timedelta(days=2)).isoformat()] == 1502
+
+
+def test_unparseable_rows_are_skipped(warehouse):
+    source = LocalMarketSource([price_row(0, 1500), {**price_row(1, 1500), "Date": "soon"},
+                                {**price_row(2, 1500), "Modal Price": "NR"}])
+    result = pull(warehouse, source)
+    assert result["received"] == 3 and result["stored"] == 1
+
+
+def test_only_due_series_are_pulled_unless_forced(warehouse):
+    source = LocalMarketSource([price_row(0, 1500), price_row(0, 1700, market="Nashik")])
+    watchlist = [("Onion", "Maharashtra", "Pune"), ("Onion", "Maharashtra", "Nashik")]
+    ingestor = MarketIngestor(warehouse, source, watchlist, interval=3600)
+
+    assert asyncio.run(ingestor.run_once())["pulled"] == 2
+    assert asyncio.run(ingestor.run_once())["pulled"] == 0
+    assert source.calls == 2
+
+    forced = asyncio.run(ingestor.run_once(force=True))
+    assert forced["pulled"] == 2 and forced["rows_stored"] == 0
+    assert source.calls == 4
+
+    ingestor.interval = 0
+    assert asyncio.run(ingestor.run_once())["pulled"] == 2
+
+
+def test_failures_are_recorded_and_retried(warehouse):
+    series = ("Onion", "Maharashtra", "Pune")
+    failing = MarketIngestor(warehouse, FailingSource(), [series], interval=3600)
+    run = asyncio.run(failing.run_once())
+    assert run["failed"][0]["error"] == "upstream down"
+    assert warehouse.stats()["failing_series"] == 1
+    # A failed pull leaves the series due
+    assert asyncio.run(failing.run_once())["pulled"] == 1
+
+    pull(warehouse, LocalMarketSource([price_row(0, 1500)]), series)
+    assert warehouse.stats()["failing_series"] == 0
+
+
+def test_prices_trend_and_best_markets(warehouse):
+    rows = [price_row(day, 1000 + 10 * day) for day in range(40)]
+    rows += [price_row(day, 2000, market="Nashik") for day in range(33, 40)]
+    rows += [price_row(day, 500, market="Solapur") for day in range(33, 40)]
+    source = LocalMarketSource(rows)
+    for market in ("Pune", "Nashik", "Solapur"):
+        pull(warehouse, source, ("Onion", "Maharashtra", market))
+
+    prices = warehouse.prices("Onion", "Maharashtra", "Pune", start=START, end=START + timedelta(days=9), limit=3)
+    assert prices["summary"]["rows"] == 10
+    assert prices["summary"]["min_price"] == 900
+    assert prices["summary"]["max_price"] == 1190
+    assert [row["date"] for row in prices["rows"]] == [(START + timedelta(days=d)).isoformat() for d in (9, 8, 7)]
+
+    months = warehouse.trend("Onion", "Maharashtra", "Pune", interval="month")
+    assert [row["period"] for row in months] == ["2024-01", "2024-02"]
+    assert months[0]["samples"] == 31
+    assert months[0]["avg_modal_price"] == pytest.approx(1150)
+    with pytest.raises(ValueError):
+        warehouse.trend("Onion", interval="year")
+
+    best = warehouse.best_markets("onion", "Maharashtra", days=7)
+    assert best["window"] == {"start": (START + timedelta(days=33)).isoformat(),
+                              "end": (START + timedelta(days=39)).isoformat()}
+    assert [(row["market"], row["rank"]) for row in best["markets"]] == [("Nashik", 1), ("Pune", 2), ("Solapur", 3)]
+    assert best["markets"][1]["latest_modal_price"] == 1390
+    assert warehouse.best_markets("Wheat", "Maharashtra") == {"window": None, "markets": []}
@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+import pytest
+
+from utils import sensor_snapshot
+from utils.sensor_snapshot import LocalBackend, SensorSnapshot, set_path
+
+
+def wait_until(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for condition")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def fast_reconnect(monkeypatch):
+    monkeypatch.setattr(sensor_snapshot, "SENSOR_RECONNECT_MIN_S", 0.01)
+    monkeypatch.setattr(sensor_snapshot, "SENSOR_LISTENER_CHECK_S", 0.01)
+
+
+@pytest.fixture
+def backend():
+    return LocalBackend({"wirelessDevice": {"moisture": 40, "threshold": 30, "irrigation": False}})
+
+
+def test_set_path_copies_only_the_changed_branch():
+    before = {"a": {"x": 1}, "b": {"y": 2}}
+    after = set_path(before, ["a", "x"], 5)
+    assert before == {"a": {"x": 1}, "b": {"y": 2}}
+    assert after == {"a": {"x": 5}, "b": {"y": 2}}
+    assert after["b"] is before["b"]
+
+
+def test_set_path_none_deletes_and_prunes_empty_parents():
+    assert set_path({"a": {"x": 1}, "b": 2}, ["a", "x"], None) == {"b": 2}
+    assert set_path({"a": {"x": 1}}, ["a", "x"], None) is None
+
+
+def test_local_backend_reads_and_writes_paths(backend):
+    backend.update("wirelessDevice", {"threshold": 35, "pump/state": "on"})
+    assert backend.get("wirelessDevice/threshold") == 35
+    assert backend.get("wirelessDevice/pump") == {"state": "on"}
+    assert backend.get("missing/node") is None
+    assert backend.updates == 1
+
+    backend.set("wirelessDevice/moisture", None)
+    assert "moisture" not in backend.get("wirelessDevice")
+
+
+def test_local_backend_returns_copies(backend):
+    node = backend.get("wirelessDevice")
+    node["moisture"] = 0
+    assert backend.get("wirelessDevice/moisture") == 40
+
+
+def test_local_listener_events_are_relative_to_the_listened_path(backend):
+    events = []
+    listener = backend.listen("wirelessDevice", lambda event: events.append((event.event_type, event.path, event.data)))
+    backend.update("wirelessDevice", {"moisture": 41})
+    backend.set("wirelessDevice/threshold", 25)
+    backend.set("/", {"wirelessDevice": {"moisture": 1}})
+    listener.close()
+    backend.update("wirelessDevice", {"moisture": 2})
+
+    assert events == [
+        ("put", "/", {"moisture": 40, "threshold": 30, "irrigation": False}),
+        ("patch", "/", {"moisture": 41}),
+        ("put", "/threshold", 25),
+        # A write above the listened node resends the node in full
+        ("put", "/", {"moisture": 1}),
+    ]
+
+
+def test_snapshot_mirrors_backend_changes(backend, fast_reconnect):
+    snapshot = SensorSnapshot(backend, "wirelessDevice")
+    revisions = []
+    snapshot.add_change_listener(revisions.append)
+    snapshot.start()
+    try:
+        wait_until(lambda: snapshot.synced)
+        assert snapshot.get()["moisture"] == 40
+
+        backend.update("wirelessDevice", {"moisture": 42})
+        assert snapshot.get()["moisture"] == 42
+        assert revisions == [1, 2]
+        assert snapshot.staleness() == 0.0
+    finally:
+        snapshot.stop()
+
+
+def test_snapshot_reconnects_and_resyncs_after_disconnect(backend, fast_reconnect):
+    snapshot = SensorSnapshot(backend, "wirelessDevice")
+    snapshot.start()
+    try:
+        wait_until(lambda: snapshot.synced)
+        backend.disconnect_all()
+        # Changes made while disconnected arrive with the full resend on reconnect
+        backend.update("wirelessDevice", {"moisture": 10})
+        wait_until(lambda: snapshot.reconnects == 1 and snapshot.synced)
+        assert snapshot.get()["moisture"] == 10
+    finally:
+        snapshot.stop()
+
+
+def test_snapshot_reads_backend_until_synced(backend):
+    snapshot = SensorSnapshot(backend, "wirelessDevice")
+    assert not snapshot.is_fresh()
+    assert asyncio.run(snapshot.read())["moisture"] == 40
+    assert snapshot.direct_reads.value >= 1
+
+    snapshot.start()
+    try:
+        wait_until(lambda: snapshot.synced)
+        local_reads = snapshot.local_reads.value
+        assert asyncio.run(snapshot.read())["threshold"] == 30
+        assert snapshot.local_reads.value == local_reads + 1
+    finally:
+        snapshot.stop()
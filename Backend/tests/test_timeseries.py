@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from utils.timeseries import TimeSeriesStore
+
+
+def open_fds() -> int:
+    return len(os.listdir("/proc/self/fd"))
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = TimeSeriesStore(str(tmp_path), capacity=16, min_interval=0, max_open=4)
+    yield store
+    store.close()
+
+
+def test_record_and_query_downsamples(store):
+    for i in range(6):
+        store.record("dev1", {"moisture": 10 + i, "label": "x", "flag": True}, t=1020 + i * 10)
+    result = store.query("dev1", "moisture", 1020, 1080, 30)
+    assert result["readings"] == 6
+    assert result["min"] == [10, 13]
+    assert result["max"] == [12, 15]
+    assert store.query("dev1", "label", 1020, 1080, 30) is None
+
+
+def test_open_series_are_bounded_and_reopened_with_their_data(store):
+    for device in range(20):
+        store.record(f"dev{device}", {"ph": 6.0 + device / 10, "moisture": device}, t=1000)
+    assert store.stats()["open_series"] == 4
+    assert store.stats()["evicted"] == 36
+
+    # The first series were evicted; reading them reopens their files
+    result = store.query("dev0", "moisture", 900, 1100, 100)
+    assert result["readings"] == 1 and result["avg"] == [0]
+    store.record("dev0", {"moisture": 5}, t=1010)
+    assert store.query("dev0", "moisture", 900, 1100, 100)["readings"] == 2
+    assert [m["metric"] for m in store.metrics("dev1")] == ["moisture", "ph"]
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc")
+def test_file_descriptors_stay_flat_as_devices_grow(store):
+    store.record("warmup", {"moisture": 1}, t=1000)
+    baseline = open_fds()
+    for device in range(200):
+        store.record(f"dev{device}", {"ph": 6.5, "moisture": 30, "salinity": 1, "temperature": 25}, t=1000)
+    # At most max_open series, three memory maps each
+    assert open_fds() - baseline <= 3 * store.max_open
+
+    store.close()
+    assert open_fds() < baseline
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+from utils.weather_tiles import WeatherTileService
+
+
+class CountingTiles(WeatherTileService):
+    """Tile service whose upstream is a counter instead of OpenWeatherMap"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.fetched = []
+
+    async def _refresh_tile(self, tile):
+        self.fetched.append(tile.key)
+        tile.weather = {"temperature": 25.0}
+        tile.air_quality = {"airQuality": 2}
+        tile.updated_at = time.monotonic()
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_tile_table_is_capped_by_least_recent_read():
+    tiles = CountingTiles(tile_deg=1.0, max_tiles=3, tiles_per_s=0)
+
+    async def scenario():
+        for lat in range(3):
+            await tiles.get_tile(lat + 0.5, 0.5)
+        await tiles.get_tile(0.5, 0.5)
+        await tiles.get_tile(10.5, 0.5)
+
+    run(scenario())
+    assert set(tiles._tiles) == {(0, 0), (2, 0), (10, 0)}
+    assert tiles.stats()["tile_evictions"] == 1
+    assert tiles.stats()["active_tiles"] == 3
+
+
+def test_first_fetches_share_the_rate_limit():
+    tiles = CountingTiles(tile_deg=1.0, concurrency=1, tiles_per_s=20)
+
+    async def scenario():
+        start = time.monotonic()
+        await asyncio.gather(*[tiles.get_tile(lat + 0.5, 0.5) for lat in range(5)])
+        return time.monotonic() - start
+
+    # One token up front, then one every 50 ms
+    assert run(scenario()) >= 0.18
+    assert len(tiles.fetched) == 5
+
+
+def test_stale_tiles_have_no_version_even_with_the_refresher_running():
+    tiles = CountingTiles(tile_deg=1.0, refresh_interval=60, tiles_per_s=0)
+
+    async def scenario():
+        tile = await tiles.get_tile(0.5, 0.5)
+        assert tiles.version(0.5, 0.5) == tile.updated_at
+        tiles.start()
+        tile.updated_at -= 120
+        assert tiles.version(0.5, 0.5) is None
+        assert tiles.stats()["refresh_backlog"] == 1
+        # A read serves the old data and schedules a refresh
+        await tiles.get_tile(0.5, 0.5)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        await tiles.stop()
+        return tiles.version(0.5, 0.5)
+
+    assert run(scenario()) is not None
+    assert tiles.stats()["refresh_backlog"] == 0
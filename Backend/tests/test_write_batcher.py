@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from utils.sensor_snapshot import LocalBackend
+from utils.write_batcher import WriteBatcher, _Batch
+
+
+class FailingBackend(LocalBackend):
+    def update(self, path, values):
+        raise ConnectionError("database unavailable")
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_concurrent_writes_coalesce_into_one_update():
+    backend = LocalBackend({"wirelessDevice": {"threshold": 30, "irrigation": False}})
+
+    async def scenario():
+        batcher = WriteBatcher(backend, debounce=0.02, flush_interval=0.5)
+        acks = [batcher.write("wirelessDevice", {"threshold": value}) for value in range(40, 90)]
+        acks.append(batcher.write("devices/dev1", {"irrigation": True}))
+        results = await asyncio.gather(*acks)
+        await batcher.close()
+        return results
+
+    results = run(scenario())
+    assert backend.updates == 1
+    # Last write to a path wins
+    assert backend.get("wirelessDevice/threshold") == 89
+    assert backend.get("devices/dev1/irrigation") is True
+    assert all(result["writes_in_batch"] == 51 for result in results)
+
+
+def test_acks_report_only_the_callers_paths():
+    backend = LocalBackend()
+
+    async def scenario():
+        batcher = WriteBatcher(backend, debounce=0.02)
+        first = batcher.write("devices/a", {"threshold": 1})
+        second = batcher.write("devices/b", {"threshold": 2, "irrigation": True})
+        results = await asyncio.gather(first, second)
+        await batcher.close()
+        return results
+
+    first, second = run(scenario())
+    assert first["paths"] == ["devices/a/threshold"]
+    assert second["paths"] == ["devices/b/irrigation", "devices/b/threshold"]
+
+
+def test_backend_errors_reach_every_writer():
+    async def scenario():
+        batcher = WriteBatcher(FailingBackend(), debounce=0.01)
+        acks = [batcher.write("wirelessDevice", {"threshold": value}) for value in range(3)]
+        results = await asyncio.gather(*acks, return_exceptions=True)
+        await batcher.close()
+        return batcher, results
+
+    batcher, results = run(scenario())
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert batcher.failures.value >= 1
+
+
+def test_close_flushes_pending_writes():
+    backend = LocalBackend()
+
+    async def scenario():
+        # Debounce longer than the test: only close() can write this batch
+        batcher = WriteBatcher(backend, debounce=60, flush_interval=60)
+        ack = batcher.write("wirelessDevice", {"irrigation": True})
+        await asyncio.sleep(0)
+        await batcher.close()
+        return await ack
+
+    assert run(scenario())["paths"] == ["wirelessDevice/irrigation"]
+    assert backend.get("wirelessDevice/irrigation") is True
+
+
+@pytest.mark.parametrize("writes, expected", [
+    # A write below a pending ancestor is folded into it
+    ([("a", {"x": 1}), ("a/x", 2)], {"a": {"x": 2}}),
+    # A write to an ancestor replaces pending writes below it
+    ([("a/x", 1), ("a/y", 2), ("a", {"z": 3})], {"a": {"z": 3}}),
+    ([("a/x", 1), ("b", 2)], {"a/x": 1, "b": 2}),
+])
+def test_batch_paths_never_overlap(writes, expected):
+    batch = _Batch()
+    for path, value in writes:
+        batch.merge(path, value)
+    assert batch.values == expected
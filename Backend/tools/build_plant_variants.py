@@ -0,0 +1,134 @@
+"""
+Build optimized CPU inference variants of the plant disease model and check
+their accuracy parity against the fp32 eager model.
+
+Variants are written next to the fp32 weights (best_tuned_model.torchscript.pt,
+best_tuned_model.int8.pt) and selected at serving time with
+PLANT_MODEL_BACKEND=eager|torchscript|int8.
+
+Usage (from the Backend directory):
+    python tools/build_plant_variants.py --samples path/to/leaf/images
+        [--backends torchscript int8] [--calibration 128] [--batch-size 16]
+
+The sample directory is searched recursively for images. The first
+--calibration images calibrate int8 activation ranges; all samples are used
+for the parity report (top-1 agreement and probability deltas vs fp32) and
+a throughput comparison.
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Iterator, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import torch
+from PIL import Image
+
+from utils.plant_backends import (
+    BACKEND_INT8, BACKEND_TORCHSCRIPT, build_eager_model, quantize_model, save_variant, script_model
+)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def find_images(root: str) -> List[str]:
+    paths = []
+    for directory, _, filenames in os.walk(root):
+        paths.extend(
+            os.path.join(directory, name) for name in sorted(filenames)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+    return sorted(paths)
+
+
+def load_batches(paths: List[str], batch_size: int) -> Iterator[torch.Tensor]:
+    from routes.plant_disease import preprocess_image
+
+    for start in range(0, len(paths), batch_size):
+        tensors = [preprocess_image(Image.open(path).convert("RGB")) for path in paths[start:start + batch_size]]
+        yield torch.stack(tensors).contiguous(memory_format=torch.channels_last)
+
+
+def run_model(net, batches: List[torch.Tensor]):
+    """Return (softmax probabilities for all samples, images per second)"""
+    outputs = []
+    with torch.inference_mode():
+        net(batches[0])  # warm-up (graph optimization on first call for TorchScript)
+        start = time.perf_counter()
+        for batch in batches:
+            outputs.append(torch.softmax(net(batch), dim=1))
+        elapsed = time.perf_counter() - start
+    probabilities = torch.cat(outputs)
+    return probabilities, probabilities.shape[0] / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", required=True, help="Directory of sample leaf images")
+    parser.add_argument("--weights", help="fp32 weights (defaults to the served model)")
+    parser.add_argument("--backends", nargs="+", default=[BACKEND_TORCHSCRIPT, BACKEND_INT8],
+                        choices=[BACKEND_TORCHSCRIPT, BACKEND_INT8])
+    parser.add_argument("--calibration", type=int, default=128, help="Number of images used for int8 calibration")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--max-top1-drop", type=float, default=0.02,
+                        help="Fail if a variant's top-1 agreement with fp32 is below 1 - this value")
+    args = parser.parse_args()
+
+    os.chdir(BACKEND_DIR)
+    from routes.plant_disease import model_path, num_classes
+
+    weights_path = args.weights or model_path
+    device = torch.device("cpu")
+    paths = find_images(args.samples)
+    if not paths:
+        parser.error(f"No images found under {args.samples}")
+    print(f"Found {len(paths)} sample images")
+
+    eager = build_eager_model(weights_path, num_classes, device)
+    batches = list(load_batches(paths, args.batch_size))
+    reference, reference_throughput = run_model(eager, batches)
+    reference_top1 = reference.argmax(dim=1)
+
+    report = [("eager fp32", 1.0, 0.0, 0.0, reference_throughput)]
+    failed = False
+    for backend in args.backends:
+        if backend == BACKEND_TORCHSCRIPT:
+            variant = script_model(eager)
+            metadata = {}
+        else:
+            calibration_paths = paths[:args.calibration]
+            variant = quantize_model(eager, load_batches(calibration_paths, args.batch_size))
+            metadata = {"calibration_images": len(calibration_paths)}
+
+        probabilities, throughput = run_model(variant, batches)
+        agreement = (probabilities.argmax(dim=1) == reference_top1).float().mean().item()
+        delta = (probabilities - reference).abs()
+        metadata.update({
+            "top1_agreement": agreement,
+            "mean_abs_prob_delta": delta.mean().item(),
+            "max_abs_prob_delta": delta.max().item(),
+            "parity_samples": len(paths)
+        })
+        path = save_variant(variant, weights_path, backend, **metadata)
+        print(f"Saved {backend} variant to {path}")
+
+        report.append((backend, agreement, metadata["mean_abs_prob_delta"], metadata["max_abs_prob_delta"], throughput))
+        if agreement < 1.0 - args.max_top1_drop:
+            failed = True
+
+    print()
+    print(f"{'backend':<12} {'top-1 agree':>12} {'mean |dp|':>10} {'max |dp|':>10} {'img/s':>8} {'speedup':>8}")
+    for name, agreement, mean_delta, max_delta, throughput in report:
+        print(f"{name:<12} {agreement:>12.2%} {mean_delta:>10.5f} {max_delta:>10.5f} "
+              f"{throughput:>8.1f} {throughput / reference_throughput:>7.2f}x")
+
+    if failed:
+        print(f"\nParity check failed: top-1 agreement below {1.0 - args.max_top1_drop:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Check the compiled tree-ensemble engine against scikit-learn for the soil
+health and crop recommendation models, and compare their speed.
+
+The servers compile these models at load time (TABULAR_MODEL_BACKEND=compiled)
+and fall back to sklearn per model if the parity check fails; this tool runs
+the same check on a larger sample set and reports single-row latency and
+batch throughput (batches above TABULAR_COMPILED_MAX_ROWS are served by
+sklearn, so "served" throughput reflects what the API actually does).
+
+Usage (from the Backend directory):
+    python tools/check_tree_compiler.py [--samples 20000] [--batch-size 1000]
+        [--soil-csv lab_samples.csv] [--tolerance 1e-9] [--single-rows 500]
+
+Besides the exact parity check, every model's outputs are compared with
+sklearn's within --tolerance, scoring the first --single-rows samples one
+row at a time (as single API requests are) and the rest in served-size
+blocks; the largest absolute difference is reported.
+
+--soil-csv adds real soil rows (feature_cols columns, raw units) to the
+parity set for the scaler and, after scaling, the soil models.
+"""
+import argparse
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import joblib
+import numpy as np
+
+from utils.features import verify_feature_names
+from utils.tree_compiler import (
+    TABULAR_COMPILED_MAX_ROWS, UnsupportedEstimator, build_compiled, check_parity, parity_samples
+)
+
+
+def score_fn(model):
+    if hasattr(model, "predict_proba"):
+        return model.predict_proba
+    if hasattr(model, "transform"):
+        return model.transform
+    return model.predict
+
+
+def as_outputs(result) -> list:
+    """Model output(s) as a list of float arrays; multi-output predict_proba returns one per output"""
+    return [np.asarray(output, dtype=np.float64) for output in (result if isinstance(result, list) else [result])]
+
+
+def max_difference(estimator, compiled, X: np.ndarray, single_rows: int) -> float:
+    """Largest absolute difference from sklearn, single rows first, then blocks the compiled path serves"""
+    single = min(single_rows, len(X))
+    starts = list(range(single)) + list(range(single, len(X), max(1, TABULAR_COMPILED_MAX_ROWS)))
+    ends = starts[1:] + [len(X)]
+    blocks = [as_outputs(score_fn(compiled)(X[start:end])) for start, end in zip(starts, ends)]
+    actual = [np.concatenate(parts) for parts in zip(*blocks)]
+    expected = as_outputs(score_fn(estimator)(X))
+    return max(float(np.abs(got - want).max()) for got, want in zip(actual, expected))
+
+
+def time_calls(fn, X: np.ndarray, repeats: int) -> float:
+    fn(X)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(X)
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=20000, help="Synthetic parity samples per model")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--soil-csv", help="CSV of real soil samples to add to the parity set")
+    parser.add_argument("--tolerance", type=float, default=1e-9, help="Largest allowed absolute difference")
+    parser.add_argument("--single-rows", type=int, default=500, help="Parity samples scored one row at a time")
+    args = parser.parse_args()
+
+    os.chdir(BACKEND_DIR)
+    from routes.crop_recommendation import MODEL_PATH, crop_features
+    from routes.soil_health import SHI_MODEL_DIR, feature_cols
+
+    scaler = joblib.load(os.path.join(SHI_MODEL_DIR, "feature_scaler.joblib"))
+    models = [
+        ("soil scaler", scaler, feature_cols),
+        ("soil health index", joblib.load(os.path.join(SHI_MODEL_DIR, "soil_health_index_model.joblib")), feature_cols),
+        ("soil issues", joblib.load(os.path.join(SHI_MODEL_DIR, "soil_issues_model.joblib")), feature_cols),
+        ("crop recommendation", joblib.load(MODEL_PATH), crop_features.names)
+    ]
+
+    real_soil = None
+    if args.soil_csv:
+        import pandas as pd
+        real_soil = pd.read_csv(args.soil_csv, usecols=feature_cols)[feature_cols].dropna().to_numpy(dtype=np.float64)
+        print(f"Loaded {len(real_soil)} real soil samples")
+
+    failed = False
+    print(f"{'model':<20} {'backend':<9} {'parity':<28} {'max |diff|':>11} {'sk 1-row us':>12} {'cmp 1-row us':>13} "
+          f"{'sk rows/s':>11} {'served rows/s':>14}")
+    for label, estimator, names in models:
+        verify_feature_names(estimator, names, label)
+        try:
+            compiled = build_compiled(estimator)
+        except UnsupportedEstimator as e:
+            print(f"{label:<20} {'sklearn':<9} unsupported ({str(e)})")
+            continue
+
+        X = parity_samples(estimator, args.samples, seed=1)
+        if real_soil is not None and names is feature_cols:
+            X = np.vstack([X, real_soil if label == "soil scaler" else scaler.transform(real_soil)])
+        mismatch = check_parity(estimator, compiled, X)
+        difference = max_difference(estimator, compiled, X, args.single_rows)
+        if mismatch is None and difference > args.tolerance:
+            mismatch = f"differs by more than {args.tolerance:g}"
+        failed = failed or mismatch is not None
+
+        single, batch = X[:1], X[:args.batch_size]
+        sk_single = time_calls(score_fn(estimator), single, 50)
+        cmp_single = time_calls(score_fn(compiled), single, 50)
+        sk_batch = time_calls(score_fn(estimator), batch, 3)
+        cmp_batch = time_calls(score_fn(compiled), batch, 3)
+        print(f"{label:<20} {'compiled':<9} {mismatch or f'ok ({len(X)} samples)':<28} {difference:>11.3g} "
+              f"{sk_single * 1e6:>12.0f} "
+              f"{cmp_single * 1e6:>13.0f} {len(batch) / sk_batch:>11.0f} {len(batch) / cmp_batch:>14.0f}")
+
+    if failed:
+        print("\nParity check failed: the server will fall back to sklearn for the failing models")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Build a crop suitability map for a whole taluka from per-pixel input grids.
+
+The input directory holds one 2-D .npy grid per crop model feature, all the
+same shape: N.npy, P.npy, K.npy, temperature.npy, humidity.npy, ph.npy,
+rainfall.npy (NaN marks nodata). Grids are memory-mapped and scored in tiles
+across a process pool; outputs (crop_index.npy, confidence.npy,
+summary.json) are written to the output directory.
+
+Rerunning with the same arguments after a crash or Ctrl-C resumes from the
+last completed tile; pass --restart to discard previous progress.
+
+Usage (from the Backend directory):
+    python tools/crop_suitability.py INPUT_DIR OUTPUT_DIR
+        [--tile-size 512] [--workers 4] [--restart]
+    python tools/crop_suitability.py INPUT_DIR OUTPUT_DIR --synthesize 4000x4000
+"""
+import argparse
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import numpy as np
+
+from utils.suitability import (
+    SUITABILITY_TILE_SIZE, SUITABILITY_WORKERS, SuitabilityError, input_paths, run_suitability_job
+)
+
+# Typical ranges of the crop recommendation training data
+FEATURE_RANGES = {
+    "N": (0, 140), "P": (5, 145), "K": (5, 205), "temperature": (8, 44),
+    "humidity": (14, 100), "ph": (3.5, 9.9), "rainfall": (20, 300)
+}
+
+
+def synthesize_inputs(input_dir: str, features, shape):
+    """Write smooth random float32 grids (with a nodata corner) for trying the pipeline"""
+    os.makedirs(input_dir, exist_ok=True)
+    rng = np.random.default_rng(0)
+    rows, cols = shape
+    y = np.linspace(0, 1, rows, dtype=np.float32)[:, None]
+    x = np.linspace(0, 1, cols, dtype=np.float32)[None, :]
+    for feature, path in zip(features, input_paths(input_dir, features)):
+        low, high = FEATURE_RANGES[feature]
+        grid = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=shape)
+        phase = rng.uniform(0, 2 * np.pi, 2)
+        for row0 in range(0, rows, 1024):
+            block = 0.5 + 0.25 * (np.sin(6 * y[row0:row0 + 1024] + phase[0]) + np.cos(5 * x + phase[1]))
+            grid[row0:row0 + 1024] = low + (high - low) * block
+        grid[:rows // 20, :cols // 20] = np.nan
+        grid.flush()
+    print(f"Wrote synthetic {rows}x{cols} input grids to {input_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--tile-size", type=int, default=SUITABILITY_TILE_SIZE)
+    parser.add_argument("--workers", type=int, default=SUITABILITY_WORKERS)
+    parser.add_argument("--restart", action="store_true", help="Ignore previous progress in OUTPUT_DIR")
+    parser.add_argument("--synthesize", metavar="ROWSxCOLS", help="Write synthetic input grids first")
+    args = parser.parse_args()
+
+    input_dir, output_dir = os.path.abspath(args.input_dir), os.path.abspath(args.output_dir)
+    os.chdir(BACKEND_DIR)
+    import joblib
+    from routes.crop_recommendation import MODEL_PATH, crop_features
+
+    features = list(crop_features.names)
+    if args.synthesize:
+        synthesize_inputs(input_dir, features, tuple(int(n) for n in args.synthesize.lower().split("x")))
+    classes = joblib.load(MODEL_PATH).classes_.tolist()
+
+    def report(state):
+        rate = state["pixels_scored"] / state["elapsed_s"] if state["elapsed_s"] else 0.0
+        print(f"\rtiles {state['tiles_done']}/{state['tiles_total']} "
+              f"({state['tiles_resumed']} resumed), {rate:,.0f} px/s", end="", flush=True)
+
+    try:
+        summary = run_suitability_job(
+            input_dir, output_dir, MODEL_PATH, features, classes,
+            tile_size=args.tile_size, workers=args.workers, resume=not args.restart, progress=report
+        )
+    except SuitabilityError as e:
+        print(f"\n{str(e)}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("\nInterrupted; rerun the same command to resume")
+        sys.exit(130)
+
+    print(f"\nDone in {summary['elapsed_s']:.1f}s: {summary['valid_pixels']:,} pixels, "
+          f"{summary['nodata_pixels']:,} nodata, mean confidence {summary['mean_confidence'] or 0:.3f}")
+    for crop, stats in list(summary["crops"].items())[:10]:
+        print(f"  {crop:<14} {stats['share']:>7.1%}  confidence {stats['mean_confidence']:.3f}")
+    print(f"Outputs in {output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, List, Optional
+
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64]
+QUEUE_WAIT_MS_BUCKETS = [0.5, 1, 2, 5, 10, 20, 50, 100, 250, 500]
+
+
+class _PendingItem:
+    __slots__ = ("item", "future", "enqueued_at")
+
+    def __init__(self, item: Any, future: asyncio.Future):
+        self.item = item
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """Groups concurrent submissions into batches for a single handler call.
+
+    The handler receives a list of items and must return a list of results
+    in the same order. A batch is dispatched as soon as it reaches
+    ``max_batch_size`` or when the oldest queued item has waited ``max_wait_ms``.
+    When an ``executor`` is given the handler runs on it instead of the event
+    loop, with up to ``max_concurrent_batches`` batches in flight.
+    """
+
+    def __init__(self, handler: Callable[[List[Any]], List[Any]], max_batch_size: int = 16,
+                 max_wait_ms: float = 5.0, name: str = "batcher", executor=None,
+                 max_concurrent_batches: int = 1):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        self.executor = executor
+        self.max_concurrent_batches = max(1, max_concurrent_batches)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._batch_slots: Optional[asyncio.Semaphore] = None
+        self._batch_tasks = set()
+
+        self.batch_sizes = registry.histogram(f"{name}_batch_size", BATCH_SIZE_BUCKETS,
+                                              "Number of items per dispatched batch")
+        self.queue_wait_ms = registry.histogram(f"{name}_queue_wait_ms", QUEUE_WAIT_MS_BUCKETS,
+                                                "Time an item spent queued before dispatch (ms)")
+        self.batch_errors = registry.counter(f"{name}_batch_errors_total",
+                                             "Batches whose handler raised an exception")
+
+    def _ensure_started(self):
+        """Start the dispatch task on the running loop (restarting it if the loop changed)"""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._batch_slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, item: Any) -> Any:
+        """Queue an item and wait for its individual result"""
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait(_PendingItem(item, future))
+        return await future
+
+    async def _collect(self) -> List[_PendingItem]:
+        first = await self._queue.get()
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                # Take whatever is already waiting without blocking
+                while len(batch) < self.max_batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            # Wait for a free batch slot before collecting, so items keep
+            # accumulating into the next batch while all slots are busy
+            await self._batch_slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._batch_slots.release()
+                raise
+
+            batch = [pending for pending in batch if not pending.future.cancelled()]
+            if not batch:
+                self._batch_slots.release()
+                continue
+
+            task = self._loop.create_task(self._complete(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _complete(self, batch: List[_PendingItem]):
+        try:
+            dispatched_at = time.perf_counter()
+            self.batch_sizes.observe(len(batch))
+            for pending in batch:
+                self.queue_wait_ms.observe((dispatched_at - pending.enqueued_at) * 1000.0)
+
+            try:
+                results = await self._dispatch([pending.item for pending in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name} handler returned {len(results)} results for {len(batch)} items")
+            except Exception as e:
+                self.batch_errors.inc()
+                logger.error(f"Error running {self.name} batch of {len(batch)}: {str(e)}")
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+                return
+
+            for pending, result in zip(batch, results):
+                if not pending.future.done():
+                    pending.future.set_result(result)
+        finally:
+            self._batch_slots.release()
+
+    async def _dispatch(self, items: List[Any]) -> List[Any]:
+        if self.executor is not None:
+            return await self.executor.run(self.handler, items)
+        return self.handler(items)
+
+    def stats(self) -> dict:
+        """Batch size distribution and queue wait times for tuning"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_concurrent_batches": self.max_concurrent_batches,
+            "batches_in_flight": len(self._batch_tasks),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+            "batch_errors": self.batch_errors.value
+        }
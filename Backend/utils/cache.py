@@ -0,0 +1,200 @@
+import asyncio
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from utils.metrics import registry
+
+_MISSING = object()
+
+
+def default_sizeof(key: Any, value: Any) -> int:
+    """Rough per-entry footprint: shallow sizes plus dict/OrderedDict slot overhead"""
+    return sys.getsizeof(key) + sys.getsizeof(value) + 100
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry TTL and a memory budget.
+
+    Entries are evicted least-recently-used first once either ``max_bytes``
+    (as estimated by ``sizeof``) or ``max_entries`` is exceeded. Expired
+    entries are dropped lazily on access.
+    """
+
+    def __init__(self, ttl_seconds: float, max_bytes: Optional[int] = None, max_entries: Optional[int] = None,
+                 sizeof: Callable[[Any, Any], int] = default_sizeof, name: str = "cache"):
+        self.ttl = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.sizeof = sizeof
+        self.name = name
+
+        # key -> (value, stored_at, expires_at, size)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.generation = 0
+
+        self.hits = registry.counter(f"{name}_hits_total", "Cache lookups served from cache")
+        self.misses = registry.counter(f"{name}_misses_total", "Cache lookups that missed or had expired")
+        self.evictions = registry.counter(f"{name}_evictions_total", "Entries evicted to stay within budget")
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses.inc()
+                return default
+            if entry[2] <= time.monotonic():
+                self._remove(key)
+                self.misses.inc()
+                return default
+            self._entries.move_to_end(key)
+        self.hits.inc()
+        return entry[0]
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Like get, without counting a lookup or refreshing the entry's recency"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] <= time.monotonic():
+                return default
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        size = self.sizeof(key, value)
+        now = time.monotonic()
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, now, now + (self.ttl if ttl is None else ttl), size)
+            self._bytes += size
+            self._evict()
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        """Drop every entry and bump the generation so callers can detect invalidation"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.generation += 1
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[3]
+
+    def _evict(self):
+        while self._entries and (
+            (self.max_bytes is not None and self._bytes > self.max_bytes)
+            or (self.max_entries is not None and len(self._entries) > self.max_entries)
+        ):
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions.inc()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits.value + self.misses.value
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "generation": self.generation,
+            "hits": self.hits.value,
+            "misses": self.misses.value,
+            "evictions": self.evictions.value,
+            "hit_ratio": self.hits.value / lookups if lookups else 0.0
+        }
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one execution.
+
+    The first caller runs the function; callers arriving while it is in
+    flight block until it finishes and receive the same result or exception.
+    """
+
+    def __init__(self, name: str = "singleflight"):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.shared = registry.counter(f"{name}_shared_total", "Calls that joined an in-flight execution")
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            self.shared.inc()
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result
+
+
+class AsyncSingleFlight:
+    """asyncio counterpart of SingleFlight: concurrent awaiters share one task.
+
+    The shared task is shielded, so a caller being cancelled does not cancel
+    the work other callers are waiting on.
+    """
+
+    def __init__(self, name: str = "async_singleflight"):
+        self._tasks = {}
+        self.shared = registry.counter(f"{name}_shared_total", "Awaits that joined an in-flight task")
+
+    def in_flight(self, key: Hashable) -> bool:
+        task = self._tasks.get(key)
+        return task is not None and not task.done()
+
+    async def do(self, key: Hashable, coroutine_fn: Callable[[], Any]) -> Any:
+        task = self._tasks.get(key)
+        if task is not None and not task.done():
+            self.shared.inc()
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(coroutine_fn())
+        self._tasks[key] = task
+
+        def forget(done_task, key=key):
+            if self._tasks.get(key) is done_task:
+                del self._tasks[key]
+
+        task.add_done_callback(forget)
+        return await asyncio.shield(task)
@@ -0,0 +1,69 @@
+import threading
+import time
+
+from utils.metrics import registry
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Stops calling a failing upstream for a cool-down period.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    ``allow()`` returns False, so callers can go straight to their fallback.
+    Once ``reset_timeout`` seconds have passed a single trial call is let
+    through (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+        self.opens = registry.counter(f"{name}_circuit_opens_total", "Times the circuit breaker opened")
+        self.short_circuits = registry.counter(f"{name}_circuit_short_circuits_total",
+                                               "Calls rejected while the circuit was open")
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = STATE_HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == STATE_HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+        self.short_circuits.inc()
+        return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = STATE_CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == STATE_HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != STATE_OPEN:
+                    self.opens.inc()
+                self.state = STATE_OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "opens": self.opens.value,
+            "short_circuits": self.short_circuits.value
+        }
@@ -0,0 +1,147 @@
+import gzip
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+from utils.metrics import registry
+
+# Bodies smaller than this go out uncompressed; gzip framing would eat most of the gain
+RESPONSE_GZIP_MIN_BYTES = int(os.getenv("RESPONSE_GZIP_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+
+# Versions restart with the process, so every ETag carries a per-process token
+_PROCESS_TOKEN = uuid.uuid4().hex
+
+# Clients must revalidate every time, which costs them only a 304 while nothing changed
+REVALIDATE_HEADERS = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+
+conditional_requests = registry.counter("http_conditional_requests_total", "Requests to versioned endpoints")
+not_modified = registry.counter("http_not_modified_total", "304 Not Modified responses")
+bytes_saved_not_modified = registry.counter("http_bytes_saved_not_modified_total",
+                                            "Body bytes not sent because the client's copy was current")
+bytes_saved_compression = registry.counter("http_bytes_saved_compression_total",
+                                           "Body bytes saved by gzip on versioned endpoints")
+bytes_sent = registry.counter("http_body_bytes_sent_total", "Body bytes sent by versioned endpoints")
+compressed = registry.counter("http_responses_compressed_total", "Versioned responses sent gzip-encoded")
+encode_latency = registry.timer("http_response_encode_seconds", "JSON encoding plus gzip of versioned responses")
+
+# Content = (body, version); the version may be None when it isn't known
+Build = Callable[[], Awaitable[Tuple[Any, Optional[Hashable]]]]
+
+
+class _SizeMemo:
+    """Bytes last sent per ETag, so a 304 can count what it saved"""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._sizes: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, etag: str) -> int:
+        with self._lock:
+            return self._sizes.get(etag, 0)
+
+    def set(self, etag: str, size: int):
+        with self._lock:
+            self._sizes[etag] = size
+            self._sizes.move_to_end(etag)
+            while len(self._sizes) > self.max_entries:
+                self._sizes.popitem(last=False)
+
+
+_sent_sizes = _SizeMemo()
+
+
+def make_etag(request: Request, version: Hashable) -> str:
+    """Weak ETag from the request's path and query plus a content version; nothing is serialized"""
+    key = repr((_PROCESS_TOKEN, request.url.path, str(request.url.query), version)).encode("utf-8")
+    return f'W/"{hashlib.blake2b(key, digest_size=12).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison: W/"x" and "x" name the same representation
+    return "*" in candidates or etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in candidates)
+
+
+def accepts_gzip(request: Request) -> bool:
+    for coding in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*") and params.replace(" ", "") not in ("q=0", "q=0.0"):
+            return True
+    return False
+
+
+def json_response(request: Request, content: Any, status_code: int = 200,
+                  headers: Optional[Dict[str, str]] = None) -> Response:
+    """orjson-encoded response, gzipped when the client accepts it and the body is large enough"""
+    headers = dict(headers or {})
+    with encode_latency.timer():
+        body = orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        if len(body) >= RESPONSE_GZIP_MIN_BYTES and accepts_gzip(request):
+            packed = gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL)
+            if len(packed) < len(body):
+                bytes_saved_compression.inc(len(body) - len(packed))
+                compressed.inc()
+                body = packed
+                headers["Content-Encoding"] = "gzip"
+    bytes_sent.inc(len(body))
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+async def conditional_json(request: Request, version: Optional[Hashable], build: Build,
+                           headers: Optional[Dict[str, str]] = None) -> Response:
+    """Answer 304 if the client already holds the content's version, else encode and tag the content.
+
+    ``version`` is the cheap current content version (None if unknown, e.g.
+    nothing cached yet). ``build`` returns the content with the version it
+    was built from, which becomes the ETag. ``headers`` are sent with both
+    outcomes and may be filled in by ``build``.
+    """
+    headers = headers if headers is not None else {}
+    conditional_requests.inc()
+    if version is not None:
+        etag = make_etag(request, version)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            not_modified.inc()
+            bytes_saved_not_modified.inc(_sent_sizes.get(etag))
+            return Response(status_code=304, headers={**REVALIDATE_HEADERS, **headers, "ETag": etag})
+
+    content, built_version = await build()
+    response_headers = {**REVALIDATE_HEADERS, **headers}
+    etag = make_etag(request, built_version) if built_version is not None else None
+    if etag is not None:
+        response_headers["ETag"] = etag
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            # Had to build to learn the version, but the client's copy is still current
+            not_modified.inc()
+            bytes_saved_not_modified.inc(_sent_sizes.get(etag))
+            return Response(status_code=304, headers=response_headers)
+    response = json_response(request, content, headers=response_headers)
+    if etag is not None:
+        _sent_sizes.set(etag, len(response.body))
+    return response
+
+
+def get_response_stats() -> Dict[str, Any]:
+    """304 ratio and bytes saved on versioned endpoints"""
+    requests = conditional_requests.value
+    return {
+        "conditional_requests": requests,
+        "not_modified": not_modified.value,
+        "not_modified_ratio": not_modified.value / requests if requests else 0.0,
+        "bytes_sent": bytes_sent.value,
+        "bytes_saved_not_modified": bytes_saved_not_modified.value,
+        "bytes_saved_compression": bytes_saved_compression.value,
+        "responses_compressed": compressed.value,
+        "gzip_min_bytes": RESPONSE_GZIP_MIN_BYTES
+    }
@@ -0,0 +1,81 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Mapping, Optional
+
+from utils.metrics import registry
+
+# Entries kept before the least recently used key is dropped
+DEADBAND_MEMO_MAX_ENTRIES = int(os.getenv("DEADBAND_MEMO_MAX_ENTRIES", "10000"))
+
+
+class DeadbandMemo:
+    """Reuse a result while its numeric inputs stay within per-field deadbands.
+
+    Each key (e.g. a device) keeps the inputs its cached result was computed
+    from. A lookup is a hit only if every input is within its deadband of
+    those inputs; fields without a deadband must match exactly. Comparing
+    against the computed inputs, not the previous lookup, keeps slow drift
+    from hiding behind many small steps.
+    """
+
+    def __init__(self, name: str, deadbands: Mapping[str, float], max_entries: int = DEADBAND_MEMO_MAX_ENTRIES):
+        self.name = name
+        self.deadbands = dict(deadbands)
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = registry.counter(f"{name}_memo_hits_total", "Recomputes avoided because inputs stayed within deadband")
+        self.misses = registry.counter(f"{name}_memo_recomputes_total", "Recomputes because an input moved or nothing was cached")
+        self.forced = registry.counter(f"{name}_memo_forced_total", "Recomputes forced by the caller")
+
+    def _within(self, previous: Mapping[str, Any], inputs: Mapping[str, Any]) -> bool:
+        if previous.keys() != inputs.keys():
+            return False
+        for field, value in inputs.items():
+            if abs(value - previous[field]) > self.deadbands.get(field, 0.0):
+                return False
+        return True
+
+    def lookup(self, key: Hashable, inputs: Mapping[str, Any]) -> Optional[Any]:
+        """Cached result if ``inputs`` are within deadband of the ones it was computed from; counts the outcome"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._within(entry[0], inputs):
+                self._entries.move_to_end(key)
+                self.hits.inc()
+                return entry[1]
+        self.misses.inc()
+        return None
+
+    def store(self, key: Hashable, inputs: Mapping[str, Any], result: Any):
+        with self._lock:
+            self._entries[key] = (dict(inputs), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key: Hashable, inputs: Mapping[str, Any], compute: Callable[[], Any],
+                       force: bool = False) -> Any:
+        if force:
+            self.forced.inc()
+        else:
+            cached = self.lookup(key, inputs)
+            if cached is not None:
+                return cached
+        result = compute()
+        self.store(key, inputs, result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        hits, misses, forced = self.hits.value, self.misses.value, self.forced.value
+        lookups = hits + misses
+        return {
+            "entries": len(self._entries),
+            "deadbands": self.deadbands,
+            "recomputes_avoided": hits,
+            "recomputes": misses + forced,
+            "forced_refreshes": forced,
+            "hit_rate": hits / lookups if lookups else None
+        }
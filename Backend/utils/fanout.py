@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Views are recomputed at least this often even without a change notification (e.g. for weather)
+STREAM_RECHECK_S = float(os.getenv("STREAM_RECHECK_S", "60"))
+# Change notifications arriving within this window are folded into one recompute
+STREAM_DEBOUNCE_S = float(os.getenv("STREAM_DEBOUNCE_S", "0.2"))
+# Messages buffered per subscriber; a subscriber that falls further behind is resent a full snapshot
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "32"))
+# A view that failed to compute (e.g. models still loading) is retried this soon
+STREAM_RETRY_S = float(os.getenv("STREAM_RETRY_S", "5"))
+
+
+def diff_payload(previous: Dict[str, Any], current: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """Top-level keys whose value changed or appeared, and keys that disappeared"""
+    changed = {key: value for key, value in current.items() if key not in previous or previous[key] != value}
+    removed = [key for key in previous if key not in current]
+    return changed, removed
+
+
+class Subscription:
+    def __init__(self, hub: "FanoutHub", topic: "_Topic", queue_size: int):
+        self.hub = hub
+        self.topic = topic
+        self.queue: asyncio.Queue = asyncio.Queue(max(1, queue_size))
+
+    def offer(self, message: dict):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Too far behind for deltas to be useful: drop the backlog and start over from the current state
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(self.topic.snapshot_message())
+            self.hub.resyncs.inc()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Next message, or None if nothing arrived within ``timeout``"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class _Topic:
+    def __init__(self, key: Hashable):
+        self.key = key
+        self.subscribers: Set[Subscription] = set()
+        self.payload: Optional[Dict[str, Any]] = None
+        self.version = 0
+        self.dirty = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def snapshot_message(self) -> dict:
+        return {"type": "snapshot", "version": self.version, "data": self.payload}
+
+
+class FanoutHub:
+    """Computes each topic's view once per change and pushes it to all its subscribers.
+
+    A topic (e.g. a device at a location) exists while it has subscribers.
+    Its task recomputes the view when notified of a change, or every
+    ``recheck_interval`` otherwise, and sends only the top-level keys that
+    changed. New subscribers get the current view as a snapshot first.
+
+    Messages: ``{"type": "snapshot", "version", "data"}``,
+    ``{"type": "delta", "version", "changed", "removed"}`` and
+    ``{"type": "error", "detail"}`` while no view could be computed yet.
+    """
+
+    def __init__(self, name: str, compute: Callable[[Hashable], Awaitable[Dict[str, Any]]],
+                 recheck_interval: float = STREAM_RECHECK_S, debounce: float = STREAM_DEBOUNCE_S,
+                 queue_size: int = STREAM_QUEUE_SIZE):
+        self.name = name
+        self.compute = compute
+        self.recheck_interval = recheck_interval
+        self.debounce = debounce
+        self.queue_size = queue_size
+        self._topics: Dict[Hashable, _Topic] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.computes = registry.counter(f"{name}_computes_total", "Views computed for stream topics")
+        self.unchanged = registry.counter(f"{name}_unchanged_total", "Recomputes that produced no change")
+        self.messages = registry.counter(f"{name}_messages_total", "Messages queued to subscribers")
+        self.resyncs = registry.counter(f"{name}_resyncs_total", "Slow subscribers reset to a full snapshot")
+
+    def subscribe(self, key: Hashable) -> Subscription:
+        self._loop = asyncio.get_running_loop()
+        topic = self._topics.get(key)
+        if topic is None:
+            topic = _Topic(key)
+            self._topics[key] = topic
+            topic.task = asyncio.ensure_future(self._run(topic))
+        subscription = Subscription(self, topic, self.queue_size)
+        topic.subscribers.add(subscription)
+        if topic.payload is not None:
+            subscription.offer(topic.snapshot_message())
+            self.messages.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        topic = subscription.topic
+        topic.subscribers.discard(subscription)
+        if not topic.subscribers and self._topics.get(topic.key) is topic:
+            del self._topics[topic.key]
+            topic.task.cancel()
+
+    def notify(self, keys: Optional[Iterable[Hashable]] = None):
+        """Mark topics (all of them by default) as changed; must run on the event loop"""
+        topics = self._topics.values() if keys is None else [self._topics[k] for k in keys if k in self._topics]
+        for topic in topics:
+            topic.dirty.set()
+
+    def notify_threadsafe(self, keys: Optional[Iterable[Hashable]] = None):
+        """``notify`` from any thread, e.g. a database listener callback"""
+        loop = self._loop
+        if loop is None or loop.is_closed() or not self._topics:
+            return
+        try:
+            loop.call_soon_threadsafe(self.notify, None if keys is None else list(keys))
+        except RuntimeError:
+            pass  # loop shut down in between
+
+    def _broadcast(self, topic: _Topic, message: dict):
+        for subscription in list(topic.subscribers):
+            subscription.offer(message)
+        self.messages.inc(len(topic.subscribers))
+
+    def _publish(self, topic: _Topic, payload: Dict[str, Any]):
+        if topic.payload is None:
+            topic.payload, topic.version = payload, topic.version + 1
+            self._broadcast(topic, topic.snapshot_message())
+            return
+        changed, removed = diff_payload(topic.payload, payload)
+        if not changed and not removed:
+            self.unchanged.inc()
+            return
+        topic.payload, topic.version = payload, topic.version + 1
+        self._broadcast(topic, {"type": "delta", "version": topic.version, "changed": changed, "removed": removed})
+
+    async def _run(self, topic: _Topic):
+        while True:
+            topic.dirty.clear()
+            wait = self.recheck_interval
+            try:
+                payload = await self.compute(topic.key)
+                self.computes.inc()
+                self._publish(topic, payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                detail = getattr(e, "detail", None) or str(e)
+                logger.warning(f"Could not compute {self.name} view for {topic.key}: {detail}")
+                if topic.payload is None:
+                    self._broadcast(topic, {"type": "error", "detail": detail})
+                wait = min(wait, STREAM_RETRY_S)
+
+            try:
+                await asyncio.wait_for(topic.dirty.wait(), wait)
+                await asyncio.sleep(self.debounce)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "topics": len(self._topics),
+            "subscribers": sum(len(topic.subscribers) for topic in self._topics.values()),
+            "computes": self.computes.value,
+            "unchanged": self.unchanged.value,
+            "messages": self.messages.value,
+            "resyncs": self.resyncs.value
+        }
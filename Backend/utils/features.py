@@ -0,0 +1,83 @@
+import threading
+from typing import Any, Mapping, Sequence, Union
+
+import numpy as np
+from pydantic import BaseModel
+
+
+def _sub_estimators(estimator: Any):
+    """Fitted estimators nested in ``estimator``, each with whether it sees the same input columns"""
+    steps = getattr(estimator, "steps", None)
+    if steps is not None:
+        # Only a pipeline's first step sees the raw columns; later ones see transformed data
+        for i, (_, step) in enumerate(steps):
+            if step is not None and step != "passthrough":
+                yield step, i == 0
+        return
+    inner = getattr(estimator, "estimator_", None)
+    if inner is not None:
+        yield inner, True
+    children = getattr(estimator, "estimators_", None)
+    if children is not None:
+        for child in (children.ravel() if isinstance(children, np.ndarray) else children):
+            yield child, True
+
+
+def verify_feature_names(estimator: Any, names: Sequence[str], label: str, check: bool = True):
+    """Check a fitted estimator expects exactly ``names`` in order, then drop its stored names.
+
+    Done once at load time so prediction can pass plain ndarrays; without
+    the stored names sklearn no longer re-validates columns (or warns about
+    missing ones) on every call. Nested estimators (multi-output and ensemble
+    members, pipeline steps) are walked too, since each validates its own input.
+    """
+    fitted_names = getattr(estimator, "feature_names_in_", None)
+    if check:
+        if fitted_names is not None and list(fitted_names) != list(names):
+            raise ValueError(f"{label} was fitted on features {list(fitted_names)}, expected {list(names)}")
+
+        n_features = getattr(estimator, "n_features_in_", None)
+        if n_features is not None and n_features != len(names):
+            raise ValueError(f"{label} expects {n_features} features, got {len(names)}")
+
+    # Pipelines expose their first step's names as a read-only property; that step is walked below
+    if "feature_names_in_" in vars(estimator):
+        del estimator.feature_names_in_
+
+    for child, same_input in _sub_estimators(estimator):
+        verify_feature_names(child, names, label, check=check and same_input)
+
+
+class FeatureVector:
+    """Packs one sample into a reusable (1, n_features) float64 array in a fixed column order.
+
+    Each thread gets its own buffer; the returned array is overwritten by the
+    next ``pack`` on the same thread, so use it before packing again.
+    """
+
+    def __init__(self, names: Sequence[str]):
+        self.names = tuple(names)
+        self._local = threading.local()
+
+    def _buffer(self) -> np.ndarray:
+        row = getattr(self._local, "row", None)
+        if row is None:
+            row = np.empty((1, len(self.names)), dtype=np.float64)
+            self._local.row = row
+        return row
+
+    def pack(self, sample: Union[BaseModel, Mapping[str, Any]]) -> np.ndarray:
+        row = self._buffer()
+        values = row[0]
+        if isinstance(sample, BaseModel):
+            for i, name in enumerate(self.names):
+                values[i] = getattr(sample, name)
+        else:
+            for i, name in enumerate(self.names):
+                try:
+                    values[i] = sample[name]
+                except KeyError:
+                    raise ValueError(f"Missing required feature: {name}")
+                except (TypeError, ValueError):
+                    raise ValueError(f"Feature {name} must be numeric")
+        return row
@@ -0,0 +1,307 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import Counter as TallyCounter
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from utils.metrics import registry
+from utils.timeseries import TimeSeriesStore, valid_name
+
+logger = logging.getLogger(__name__)
+
+# How often pending devices are scored, and the most devices per scoring call
+FLEET_SCORE_INTERVAL_S = float(os.getenv("FLEET_SCORE_INTERVAL_S", "2"))
+FLEET_MAX_BATCH = int(os.getenv("FLEET_MAX_BATCH", "5000"))
+# Devices silent for longer than this are reported as stale
+FLEET_STALE_S = float(os.getenv("FLEET_STALE_S", "3600"))
+# Most devices tracked; readings from further new devices are rejected
+FLEET_MAX_DEVICES = int(os.getenv("FLEET_MAX_DEVICES", "1000"))
+# Comma-separated device ids; when set, only these devices are accepted
+FLEET_DEVICES = os.getenv("FLEET_DEVICES", "")
+# Reading fields kept in history (one set of files each per device); other fields only update the latest state
+FLEET_HISTORY_FIELDS = os.getenv("FLEET_HISTORY_FIELDS", "ph,moisture,salinity,temperature,humidity,airQuality")
+
+RESERVED_FIELDS = ("device_id", "timestamp")
+
+# Scores (device_id, reading) pairs, returning one result per pair
+ScoreBatch = Callable[[List[Tuple[str, Dict[str, Any]]]], Awaitable[List[dict]]]
+
+
+def parse_names(value: str) -> List[str]:
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+class DeviceRejected(ValueError):
+    """The device is not registered, or the fleet is full"""
+
+
+def parse_timestamp(value: Any) -> Optional[float]:
+    """Epoch seconds (or milliseconds) or an ISO 8601 string; None if absent"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError("timestamp must be epoch seconds or an ISO 8601 string")
+    if isinstance(value, (int, float)):
+        return value / 1000.0 if value > 1e11 else float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    raise ValueError("timestamp must be epoch seconds or an ISO 8601 string")
+
+
+def _iso(t: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(t).isoformat() if t else None
+
+
+class DeviceState:
+    __slots__ = ("device_id", "reading", "reading_at", "received_at", "readings", "version",
+                 "soil_health", "scored_at", "scored_version", "error")
+
+    def __init__(self, device_id: str):
+        self.device_id = device_id
+        self.reading: Dict[str, Any] = {}
+        self.reading_at = 0.0
+        self.received_at = 0.0
+        self.readings = 0
+        self.version = 0
+        self.soil_health: Optional[dict] = None
+        self.scored_at = 0.0
+        self.scored_version = 0
+        self.error: Optional[str] = None
+
+    @property
+    def pending(self) -> bool:
+        return self.version != self.scored_version
+
+    def view(self) -> dict:
+        return {
+            "device_id": self.device_id,
+            "reading": self.reading,
+            "reading_at": _iso(self.reading_at),
+            "received_at": _iso(self.received_at),
+            "readings": self.readings,
+            "soil_health": self.soil_health,
+            "scored_at": _iso(self.scored_at),
+            "pending": self.pending,
+            "error": self.error
+        }
+
+
+class SensorFleet:
+    """Latest reading and soil health per device, scored in batches off the request path.
+
+    Ingestion only merges readings into per-device state (and history) and
+    marks the device pending. A background tick gathers every pending
+    device and scores them with one ``score_batch`` call, so reads of
+    device or fleet state never run a model.
+    """
+
+    def __init__(self, score_batch: ScoreBatch, history: Optional[TimeSeriesStore] = None,
+                 interval: float = FLEET_SCORE_INTERVAL_S, max_batch: int = FLEET_MAX_BATCH,
+                 stale_after: float = FLEET_STALE_S, max_devices: int = FLEET_MAX_DEVICES,
+                 allowed_devices: Optional[Iterable[str]] = parse_names(FLEET_DEVICES) or None,
+                 history_fields: Iterable[str] = parse_names(FLEET_HISTORY_FIELDS)):
+        self.score_batch = score_batch
+        self.history = history
+        self.history_fields = frozenset(history_fields)
+        self.max_devices = max_devices
+        # None accepts any device (up to max_devices)
+        self.allowed_devices = set(allowed_devices) if allowed_devices is not None else None
+        self.interval = interval
+        self.max_batch = max(1, max_batch)
+        self.stale_after = stale_after
+
+        self._devices: Dict[str, DeviceState] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.last_tick: Optional[dict] = None
+
+        self.readings_total = registry.counter("fleet_readings_total", "Device readings ingested")
+        self.late_readings = registry.counter("fleet_late_readings_total", "Readings older than the device's latest")
+        self.scored_total = registry.counter("fleet_scored_total", "Device soil health scores computed")
+        self.score_batches = registry.counter("fleet_score_batches_total", "Batched soil health scoring calls")
+        self.score_errors = registry.counter("fleet_score_errors_total", "Failed batched scoring calls")
+        self.rejected_readings = registry.counter("fleet_rejected_readings_total",
+                                                  "Readings from unregistered devices or beyond FLEET_MAX_DEVICES")
+
+    def register(self, device_id: str):
+        """Accept ``device_id`` even when only listed devices are allowed"""
+        with self._lock:
+            if self.allowed_devices is not None:
+                self.allowed_devices.add(device_id)
+
+    def _check_device(self, device_id: str):
+        # Called with the lock held
+        if device_id in self._devices:
+            return
+        if self.allowed_devices is not None and device_id not in self.allowed_devices:
+            raise DeviceRejected(f"Unknown device: {device_id}")
+        if len(self._devices) >= self.max_devices:
+            raise DeviceRejected(f"Device limit reached ({self.max_devices}); {device_id} was not added")
+
+    def check_device(self, device_id: str):
+        """Raise DeviceRejected unless readings from ``device_id`` would be accepted now"""
+        with self._lock:
+            self._check_device(device_id)
+
+    def ingest(self, device_id: str, reading: Mapping[str, Any], t: Optional[float] = None) -> DeviceState:
+        """Merge one reading into the device's state; thread-safe"""
+        if not valid_name(device_id):
+            raise ValueError(f"Invalid device id: {device_id!r}")
+        fields = {key: value for key, value in reading.items() if key not in RESERVED_FIELDS}
+        now = time.time()
+        t = now if t is None else t
+        with self._lock:
+            state = self._devices.get(device_id)
+            if state is None:
+                try:
+                    self._check_device(device_id)
+                except DeviceRejected:
+                    self.rejected_readings.inc()
+                    raise
+                state = self._devices[device_id] = DeviceState(device_id)
+            state.readings += 1
+            state.received_at = now
+            late = t < state.reading_at
+            if not late:
+                state.reading = {**state.reading, **fields}
+                state.reading_at = t
+                state.version += 1
+        self.readings_total.inc()
+        if late:
+            # Already superseded: neither the latest state nor the append-only history can take it
+            self.late_readings.inc()
+        elif self.history is not None:
+            tracked = {key: value for key, value in fields.items() if key in self.history_fields}
+            if tracked:
+                self.history.record(device_id, tracked, t)
+        return state
+
+    def ingest_many(self, readings: Iterable[Tuple[str, Mapping[str, Any], Optional[float]]]) -> int:
+        """Ingest (device_id, reading, timestamp) tuples oldest first, so buffered backlogs aren't dropped as late;
+        returns how many were ingested (readings from rejected devices are skipped)"""
+        ordered = sorted(readings, key=lambda item: item[2] if item[2] is not None else float("inf"))
+        ingested = 0
+        for device_id, reading, t in ordered:
+            try:
+                self.ingest(device_id, reading, t)
+                ingested += 1
+            except DeviceRejected:
+                pass
+        return ingested
+
+    def wake(self):
+        """Score pending devices now instead of at the next tick (event loop only)"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def score_pending(self) -> int:
+        """Score up to ``max_batch`` pending devices with a single ``score_batch`` call"""
+        with self._lock:
+            batch = [(state, state.version, dict(state.reading))
+                     for state in self._devices.values() if state.pending][:self.max_batch]
+        if not batch:
+            return 0
+
+        start = time.perf_counter()
+        try:
+            results = await self.score_batch([(state.device_id, reading) for state, _, reading in batch])
+        except Exception as e:
+            detail = getattr(e, "detail", None) or str(e)
+            self.score_errors.inc()
+            with self._lock:
+                for state, _, _ in batch:
+                    state.error = detail
+            self.last_tick = {"devices": len(batch), "error": detail, "at": _iso(time.time())}
+            logger.warning(f"Fleet scoring of {len(batch)} devices failed: {detail}")
+            return 0
+
+        now = time.time()
+        with self._lock:
+            for (state, version, _), result in zip(batch, results):
+                state.soil_health = result
+                state.scored_at = now
+                # A reading that arrived meanwhile keeps the device pending for the next tick
+                state.scored_version = version
+                state.error = None
+        self.score_batches.inc()
+        self.scored_total.inc(len(batch))
+        self.last_tick = {"devices": len(batch), "seconds": time.perf_counter() - start, "at": _iso(now)}
+        return len(batch)
+
+    async def _run(self):
+        while True:
+            try:
+                while await self.score_pending() == self.max_batch:
+                    pass
+            except Exception as e:
+                logger.error(f"Fleet scoring tick failed: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def device(self, device_id: str) -> Optional[dict]:
+        with self._lock:
+            state = self._devices.get(device_id)
+            return state.view() if state is not None else None
+
+    def devices(self, category: Optional[str] = None, issue: Optional[str] = None,
+                offset: int = 0, limit: int = 100) -> Tuple[int, List[dict]]:
+        """Matching devices (by health category and/or active issue), sorted by id; returns (total, page)"""
+        with self._lock:
+            states = sorted(self._devices.values(), key=lambda state: state.device_id)
+            if category is not None:
+                states = [s for s in states if s.soil_health and s.soil_health["health_category"] == category]
+            if issue is not None:
+                states = [s for s in states if s.soil_health and issue in s.soil_health["active_issues"]]
+            return len(states), [state.view() for state in states[offset:offset + limit]]
+
+    def summary(self) -> dict:
+        now = time.time()
+        with self._lock:
+            states = list(self._devices.values())
+            scored = [state.soil_health for state in states if state.soil_health is not None]
+            summary = {
+                "devices": len(states),
+                "max_devices": self.max_devices,
+                "scored": len(scored),
+                "pending": sum(state.pending for state in states),
+                "errors": sum(state.error is not None for state in states),
+                "stale": sum(now - state.received_at > self.stale_after for state in states),
+                "health_categories": dict(TallyCounter(result["health_category"] for result in scored)),
+                "active_issues": dict(TallyCounter(issue for result in scored for issue in result["active_issues"])),
+                "mean_health_index": sum(r["health_index"] for r in scored) / len(scored) if scored else None
+            }
+        summary.update(
+            readings=self.readings_total.value,
+            late_readings=self.late_readings.value,
+            scored_total=self.scored_total.value,
+            score_batches=self.score_batches.value,
+            score_errors=self.score_errors.value,
+            rejected_readings=self.rejected_readings.value,
+            last_tick=self.last_tick,
+            scoring_running=self._task is not None and not self._task.done()
+        )
+        return summary
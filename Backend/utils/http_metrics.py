@@ -0,0 +1,90 @@
+import time
+from typing import Dict, Tuple
+
+from utils.metrics import Counter, Gauge, Histogram, registry
+
+# Requests that matched no route share one label, so scanners can't grow the series count
+UNMATCHED_ROUTE = "unmatched"
+OTHER_GROUP = "other"
+
+
+def route_group(path: str) -> str:
+    """Leading path segments naming a router, e.g. /api/sensor or /plant; bounded, unlike raw paths"""
+    parts = path.split("/", 4)
+    if len(parts) > 2 and parts[1] == "api":
+        return "/" + parts[1] + "/" + parts[2]
+    return "/" + parts[1] if len(parts) > 1 else "/"
+
+
+class MetricsMiddleware:
+    """Per-route latency histograms, request counts by status and in-flight gauges.
+
+    Plain ASGI rather than BaseHTTPMiddleware, so streamed responses (SSE,
+    NDJSON) pass through unbuffered; their latency runs until the stream ends.
+    Routes are labelled with their template (/api/sensor/devices/{device_id}),
+    which the router leaves in the scope once it has matched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._groups = None
+        self._in_flight: Dict[str, Gauge] = {}
+        self._latency: Dict[Tuple[str, str], Histogram] = {}
+        self._requests: Dict[Tuple[str, str, str], Counter] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        in_flight = self._in_flight_gauge(self._group(scope))
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_flight.dec()
+            route = scope.get("route")
+            template = getattr(route, "path", None) or UNMATCHED_ROUTE
+            method = scope["method"]
+            self._latency_histogram(template, method).observe(elapsed)
+            self._request_counter(template, method, str(status)).inc()
+
+    def _group(self, scope) -> str:
+        if self._groups is None:
+            # Routes are all registered by the first request; the app is in the scope
+            self._groups = frozenset(route_group(route.path) for route in scope["app"].routes)
+        group = route_group(scope["path"])
+        return group if group in self._groups else OTHER_GROUP
+
+    def _in_flight_gauge(self, group: str) -> Gauge:
+        gauge = self._in_flight.get(group)
+        if gauge is None:
+            gauge = self._in_flight[group] = registry.gauge(
+                "http_requests_in_flight", "Requests being served, by router", {"group": group})
+        return gauge
+
+    def _latency_histogram(self, route: str, method: str) -> Histogram:
+        histogram = self._latency.get((route, method))
+        if histogram is None:
+            histogram = self._latency[(route, method)] = registry.timer(
+                "http_request_duration_seconds", "Request latency by route template",
+                {"route": route, "method": method})
+        return histogram
+
+    def _request_counter(self, route: str, method: str, status: str) -> Counter:
+        counter = self._requests.get((route, method, status))
+        if counter is None:
+            counter = self._requests[(route, method, status)] = registry.counter(
+                "http_requests_total", "Requests by route template and status",
+                {"route": route, "method": method, "status": status})
+        return counter
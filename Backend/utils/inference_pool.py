@@ -0,0 +1,87 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Optional
+
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorSaturated(Exception):
+    """Raised when a request cannot be admitted to a saturated executor in time"""
+
+
+class InferenceExecutor:
+    """Dedicated worker pool for blocking model work, with bounded admission.
+
+    ``admit()`` caps how many requests may be in flight at once (running or
+    queued for a worker). Callers beyond that wait up to ``admission_timeout``
+    seconds and then get ``ExecutorSaturated``, so a burst only backs up the
+    routes that use this executor instead of the whole event loop.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 32, admission_timeout: float = 2.0,
+                 initializer: Optional[Callable[[], None]] = None, name: str = "inference"):
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max(self.max_workers, max_pending)
+        self.admission_timeout = admission_timeout
+        self.name = name
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix=name,
+            initializer=initializer
+        )
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._in_flight = 0
+
+        self.rejected = registry.counter(f"{name}_rejected_total",
+                                         "Requests rejected because the executor was saturated")
+        self.admitted = registry.counter(f"{name}_admitted_total", "Requests admitted to the executor")
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.max_pending)
+        return self._slots
+
+    @asynccontextmanager
+    async def admit(self):
+        """Reserve an in-flight slot for the duration of a request"""
+        slots = self._get_slots()
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=self.admission_timeout)
+        except asyncio.TimeoutError:
+            self.rejected.inc()
+            raise ExecutorSaturated(f"{self.name} executor is busy, please retry shortly")
+
+        self.admitted.inc()
+        self._in_flight += 1
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            slots.release()
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking callable on the worker pool without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "admission_timeout_s": self.admission_timeout,
+            "in_flight": self._in_flight,
+            "admitted": self.admitted.value,
+            "rejected": self.rejected.value
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException
+
+from utils.cache import TTLCache, AsyncSingleFlight
+from utils.circuit_breaker import CircuitBreaker
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# AgMarknet proxy; returns a JSON list of price rows
+MARKET_API_URL = os.getenv("MARKET_API_URL", "https://agmarket-api.onrender.com/request")
+
+# Mandi prices change about once a day, so upstream results are reused for
+# MARKET_CACHE_TTL_S, then served stale while refreshing in the background
+# for up to MARKET_CACHE_SWR_S. Older entries are refetched first, but kept
+# as the last known good answer for MARKET_CACHE_MAX_STALE_S in case the
+# upstream is down.
+MARKET_CACHE_TTL_S = float(os.getenv("MARKET_CACHE_TTL_S", "900"))
+MARKET_CACHE_SWR_S = float(os.getenv("MARKET_CACHE_SWR_S", "3600"))
+MARKET_CACHE_MAX_STALE_S = float(os.getenv("MARKET_CACHE_MAX_STALE_S", "604800"))
+
+# Per-call deadline, connect + read; generous because the upstream host cold-starts
+MARKET_TIMEOUT_S = float(os.getenv("MARKET_TIMEOUT_S", "15"))
+
+
+def entry_size(key: Any, entry: tuple) -> int:
+    """Serialized size of the cached rows; the shallow default would count a list of any length the same"""
+    return len(json.dumps(entry[0], default=str)) + 200
+
+
+# Keyed by normalized (commodity, state, market); values are (rows, fetched_at monotonic, fetched_at epoch)
+market_cache = TTLCache(
+    ttl_seconds=MARKET_CACHE_MAX_STALE_S,
+    max_bytes=int(os.getenv("MARKET_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    max_entries=int(os.getenv("MARKET_CACHE_MAX_ENTRIES", "4096")),
+    sizeof=entry_size,
+    name="market_cache"
+)
+market_singleflight = AsyncSingleFlight(name="market")
+
+upstream_calls = registry.counter("market_upstream_calls_total", "Requests sent to the AgMarknet API")
+upstream_errors = registry.counter("market_upstream_errors_total", "Failed AgMarknet requests")
+stale_served = registry.counter("market_cache_stale_served_total", "Stale market responses served")
+refreshes = registry.counter("market_cache_refreshes_total", "Background stale-while-revalidate refreshes")
+fallbacks = registry.counter("market_fallbacks_total", "Last known good responses served because the upstream failed")
+upstream_latency = registry.timer("market_upstream_seconds", "AgMarknet request latency, including failures")
+
+# Skip the upstream (and answer from the last known good response) after repeated failures
+market_breaker = CircuitBreaker(
+    "market",
+    failure_threshold=int(os.getenv("MARKET_BREAKER_FAILURES", "3")),
+    reset_timeout=float(os.getenv("MARKET_BREAKER_RESET_S", "60"))
+)
+
+# Cache states reported to clients
+CACHE_HIT = "HIT"
+CACHE_MISS = "MISS"
+CACHE_STALE = "STALE"
+
+
+def normalize(value: str) -> str:
+    """Collapse whitespace so "  Onion " and "onion" are the same query"""
+    return " ".join(value.split())
+
+
+def cache_key(commodity: str, state: str, market: str) -> Tuple[str, str, str]:
+    return tuple(normalize(value).casefold() for value in (commodity, state, market))
+
+
+class MarketAPI:
+    """AgMarknet price lookups on a shared keep-alive connection pool.
+
+    Identical concurrent lookups share one upstream request, answers are
+    cached per (commodity, state, market) and served stale while a refresh
+    runs, and the last good answer is kept for when the upstream fails.
+    """
+
+    _client: Optional[httpx.AsyncClient] = None
+    _client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def _get_client(cls) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if cls._client is None or cls._client.is_closed or cls._client_loop is not loop:
+            cls._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(MARKET_TIMEOUT_S),
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+            )
+            cls._client_loop = loop
+        return cls._client
+
+    @classmethod
+    async def close(cls):
+        if cls._client is not None and not cls._client.is_closed:
+            await cls._client.aclose()
+        cls._client = None
+
+    @classmethod
+    async def fetch(cls, commodity: str, state: str, market: str) -> Any:
+        """One uncached upstream request; the price rows as returned"""
+        params = {"commodity": normalize(commodity), "state": normalize(state), "market": normalize(market)}
+        response = await cls._get_client().get(MARKET_API_URL, params=params)
+        if 400 <= response.status_code < 500:
+            # The query itself was rejected: pass it on, and don't count it against the upstream
+            raise HTTPException(status_code=response.status_code,
+                                detail=f"Failed to fetch market data: {response.text}")
+        response.raise_for_status()
+        return response.json()
+
+    @classmethod
+    async def _fetch_and_store(cls, key, commodity: str, state: str, market: str) -> tuple:
+        upstream_calls.inc()
+        try:
+            with upstream_latency.timer():
+                data = await asyncio.wait_for(cls.fetch(commodity, state, market), timeout=MARKET_TIMEOUT_S)
+        except HTTPException:
+            market_breaker.record_success()
+            raise
+        except Exception:
+            upstream_errors.inc()
+            market_breaker.record_failure()
+            raise
+        market_breaker.record_success()
+        entry = (data, time.monotonic(), time.time())
+        market_cache.set(key, entry)
+        return entry
+
+    @classmethod
+    async def fetch_fresh(cls, commodity: str, state: str, market: str) -> Any:
+        """Bypass fresh cache entries but store the answer, so scheduled pulls also warm the proxy cache"""
+        if not market_breaker.allow():
+            raise HTTPException(status_code=503, detail="Market data service is unavailable; try again later")
+        key = cache_key(commodity, state, market)
+        entry = await market_singleflight.do(key, lambda: cls._fetch_and_store(key, commodity, state, market))
+        return entry[0]
+
+    @classmethod
+    async def _refresh(cls, key, commodity: str, state: str, market: str):
+        try:
+            await market_singleflight.do(key, lambda: cls._fetch_and_store(key, commodity, state, market))
+        except Exception as e:
+            # Keep serving the stale value
+            logger.error(f"Error refreshing market data for {key}: {str(e) or type(e).__name__}")
+
+    @classmethod
+    def peek(cls, commodity: str, state: str, market: str) -> Optional[Dict[str, Any]]:
+        """Cache metadata of a fresh entry (its ``fetched_at`` versions the content), without an upstream call"""
+        entry = market_cache.peek(cache_key(commodity, state, market))
+        if entry is None or time.monotonic() - entry[1] >= MARKET_CACHE_TTL_S:
+            return None
+        return cls._meta(CACHE_HIT, entry)
+
+    @classmethod
+    async def get_prices(cls, commodity: str, state: str, market: str) -> Tuple[Any, Dict[str, Any]]:
+        """Price rows and cache metadata: ``cache`` (HIT/MISS/STALE), ``age`` seconds,
+        ``fetched_at`` epoch and ``revalidation_failed`` when the upstream could not be reached"""
+        key = cache_key(commodity, state, market)
+        entry = market_cache.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry[1]
+            if age < MARKET_CACHE_TTL_S:
+                return entry[0], cls._meta(CACHE_HIT, entry)
+            if age < MARKET_CACHE_SWR_S:
+                stale_served.inc()
+                if not market_singleflight.in_flight(key) and market_breaker.allow():
+                    refreshes.inc()
+                    asyncio.ensure_future(cls._refresh(key, commodity, state, market))
+                return entry[0], cls._meta(CACHE_STALE, entry)
+            if not market_breaker.allow():
+                fallbacks.inc()
+                stale_served.inc()
+                return entry[0], cls._meta(CACHE_STALE, entry, revalidation_failed=True)
+        elif not market_breaker.allow():
+            raise HTTPException(status_code=503, detail="Market data service is unavailable; try again later")
+
+        try:
+            fresh = await market_singleflight.do(key, lambda: cls._fetch_and_store(key, commodity, state, market))
+            return fresh[0], cls._meta(CACHE_MISS, fresh)
+        except HTTPException:
+            raise
+        except Exception as e:
+            detail = str(e) or type(e).__name__
+            logger.error(f"Error fetching market data for {key}: {detail}")
+            if entry is not None:
+                fallbacks.inc()
+                stale_served.inc()
+                return entry[0], cls._meta(CACHE_STALE, entry, revalidation_failed=True)
+            status = 504 if isinstance(e, (asyncio.TimeoutError, httpx.TimeoutException)) else 502
+            raise HTTPException(status_code=status, detail=f"Error fetching market data: {detail}")
+
+    @staticmethod
+    def _meta(cache: str, entry: tuple, revalidation_failed: bool = False) -> Dict[str, Any]:
+        return {
+            "cache": cache,
+            "age": int(time.monotonic() - entry[1]),
+            "fetched_at": entry[2],
+            "revalidation_failed": revalidation_failed
+        }
+
+
+def get_market_cache_stats() -> Dict[str, Any]:
+    """Cache hit/miss/refresh counters, upstream call volume and breaker state"""
+    return {
+        **market_cache.stats(),
+        "fresh_ttl_seconds": MARKET_CACHE_TTL_S,
+        "stale_while_revalidate_seconds": MARKET_CACHE_SWR_S,
+        "stale_served": stale_served.value,
+        "background_refreshes": refreshes.value,
+        "fallbacks": fallbacks.value,
+        "singleflight_shared": market_singleflight.shared.value,
+        "upstream_calls": upstream_calls.value,
+        "upstream_errors": upstream_errors.value,
+        "circuit_breaker": market_breaker.stats()
+    }
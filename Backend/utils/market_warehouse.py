@@ -0,0 +1,439 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from utils.market_api import MarketAPI, normalize
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# SQLite file holding every ingested price row
+MARKET_DB_PATH = os.getenv("MARKET_DB_PATH", "./data/market.db")
+# "agmarknet" for the live API, "local" for an in-process stand-in (tests, offline development)
+MARKET_SOURCE = os.getenv("MARKET_SOURCE", "agmarknet").lower()
+# JSON list of upstream-shaped rows (plus "State") seeding the local source
+MARKET_LOCAL_SEED = os.getenv("MARKET_LOCAL_SEED", "")
+# JSON list of {"commodity", "state", "market"} to ingest; defaults to the app's picker options
+MARKET_WATCHLIST_FILE = os.getenv("MARKET_WATCHLIST_FILE", "")
+# Each watched combination is pulled again once its last successful pull is this old
+MARKET_INGEST_INTERVAL_S = float(os.getenv("MARKET_INGEST_INTERVAL_S", str(6 * 3600)))
+MARKET_INGEST_CONCURRENCY = int(os.getenv("MARKET_INGEST_CONCURRENCY", "4"))
+# Rows this many days before a combination's newest stored date are re-checked for late corrections
+MARKET_INGEST_OVERLAP_DAYS = int(os.getenv("MARKET_INGEST_OVERLAP_DAYS", "3"))
+
+DEFAULT_COMMODITIES = ("Potato", "Rice", "Wheat", "Onion", "Tomato", "Cotton", "Maize", "Soyabean")
+DEFAULT_MARKETS = ("Pune", "Mumbai", "Nagpur", "Nashik", "Kolhapur", "Ahmednagar", "Solapur", "Amravati")
+
+DATE_FORMATS = ("%d %b %Y", "%d-%b-%Y", "%d %B %Y", "%d-%m-%Y", "%d/%m/%Y", "%Y-%m-%d")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prices (
+    commodity TEXT NOT NULL COLLATE NOCASE,
+    state TEXT NOT NULL COLLATE NOCASE,
+    market TEXT NOT NULL COLLATE NOCASE,
+    variety TEXT NOT NULL DEFAULT '' COLLATE NOCASE,
+    date TEXT NOT NULL,
+    min_price REAL,
+    max_price REAL,
+    modal_price REAL NOT NULL,
+    ingested_at REAL NOT NULL,
+    PRIMARY KEY (commodity, state, market, variety, date)
+);
+CREATE INDEX IF NOT EXISTS prices_commodity_date ON prices (commodity, date);
+CREATE INDEX IF NOT EXISTS prices_commodity_state_date ON prices (commodity, state, date, market, modal_price);
+CREATE TABLE IF NOT EXISTS ingest_watermarks (
+    commodity TEXT NOT NULL COLLATE NOCASE,
+    state TEXT NOT NULL COLLATE NOCASE,
+    market TEXT NOT NULL COLLATE NOCASE,
+    last_date TEXT,
+    last_success REAL,
+    last_attempt REAL,
+    rows INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    PRIMARY KEY (commodity, state, market)
+);
+"""
+
+# Trend bucket -> SQL expression over the ISO date column
+TREND_PERIODS = {
+    "day": "date",
+    "week": "strftime('%Y-W%W', date)",
+    "month": "substr(date, 1, 7)"
+}
+
+Series = Tuple[str, str, str]
+
+
+def parse_date(value: Any) -> Optional[str]:
+    text = normalize(str(value or ""))
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_price(value: Any) -> Optional[float]:
+    try:
+        return float(str(value).replace(",", "").strip())
+    except ValueError:
+        return None
+
+
+def parse_row(row: Dict[str, Any]) -> Optional[tuple]:
+    """(date, market, variety, min, max, modal) of an upstream row, or None if it has no usable date or modal price"""
+    if not isinstance(row, dict):
+        return None
+    day = parse_date(row.get("Date"))
+    modal = parse_price(row.get("Modal Price"))
+    if day is None or modal is None:
+        return None
+    return (day, normalize(str(row.get("Market") or "")), normalize(str(row.get("Variety") or "")),
+            parse_price(row.get("Min Price")), parse_price(row.get("Max Price")), modal)
+
+
+def load_watchlist(path: str = MARKET_WATCHLIST_FILE) -> List[Series]:
+    if path:
+        with open(path) as f:
+            return [(normalize(item["commodity"]), normalize(item["state"]), normalize(item["market"]))
+                    for item in json.load(f)]
+    return [(commodity, "Maharashtra", market) for commodity in DEFAULT_COMMODITIES for market in DEFAULT_MARKETS]
+
+
+class AgmarknetSource:
+    """Live AgMarknet API, through the proxy's client so pulls also refresh its cache"""
+    name = "agmarknet"
+
+    async def fetch(self, commodity: str, state: str, market: str) -> List[Dict[str, Any]]:
+        return await MarketAPI.fetch_fresh(commodity, state, market)
+
+
+class LocalMarketSource:
+    """In-process stand-in for AgMarknet: answers from a list of rows carrying a "State" field"""
+    name = "local"
+
+    def __init__(self, rows: Optional[Iterable[Dict[str, Any]]] = None):
+        self.rows: List[Dict[str, Any]] = list(rows or [])
+        self.calls = 0
+
+    @classmethod
+    def from_file(cls, path: str) -> "LocalMarketSource":
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def add(self, rows: Iterable[Dict[str, Any]]):
+        self.rows.extend(rows)
+
+    async def fetch(self, commodity: str, state: str, market: str) -> List[Dict[str, Any]]:
+        self.calls += 1
+        wanted = tuple(normalize(value).casefold() for value in (commodity, state, market))
+        return [
+            {key: value for key, value in row.items() if key != "State"}
+            for row in self.rows
+            if tuple(normalize(str(row.get(field, ""))).casefold()
+                     for field in ("Commodity", "State", "Market")) == wanted
+        ]
+
+
+def create_source(name: str = MARKET_SOURCE):
+    if name == "local":
+        return LocalMarketSource.from_file(MARKET_LOCAL_SEED) if MARKET_LOCAL_SEED else LocalMarketSource()
+    if name == "agmarknet":
+        return AgmarknetSource()
+    raise ValueError(f"Unknown market source: {name}")
+
+
+class MarketWarehouse:
+    """Indexed SQLite store of daily mandi prices per (commodity, state, market, variety).
+
+    Writes go through one connection under a lock; reads use a connection
+    per thread, which WAL mode lets run alongside a write. Names compare
+    case-insensitively, and each watched combination keeps a watermark (its
+    newest stored date) so repeated pulls only touch recent rows.
+    """
+
+    def __init__(self, path: str = MARKET_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._writer = self._connect()
+        self._writer.executescript(SCHEMA)
+
+        self.rows_stored = registry.counter("market_warehouse_rows_stored_total", "Price rows inserted or changed")
+        self.rows_skipped = registry.counter("market_warehouse_rows_skipped_total",
+                                             "Upstream rows older than the watermark or unparseable")
+        self.queries = registry.counter("market_warehouse_queries_total", "Warehouse queries answered")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _query(self, sql: str, params: Iterable[Any] = ()) -> List[Dict[str, Any]]:
+        self.queries.inc()
+        return [dict(row) for row in self._reader().execute(sql, tuple(params))]
+
+    def store(self, commodity: str, state: str, market: str, rows: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """Upsert one pull's rows at or after the watermark (minus the overlap) and advance it"""
+        commodity, state, market = normalize(commodity), normalize(state), normalize(market)
+        parsed = [parse_row(row) for row in rows]
+        valid = [row for row in parsed if row is not None]
+        now = time.time()
+        with self._write_lock, self._writer:
+            found = self._writer.execute(
+                "SELECT last_date FROM ingest_watermarks WHERE commodity = ? AND state = ? AND market = ?",
+                (commodity, state, market)
+            ).fetchone()
+            watermark = found["last_date"] if found else None
+            if watermark:
+                cutoff = (date.fromisoformat(watermark) - timedelta(days=MARKET_INGEST_OVERLAP_DAYS)).isoformat()
+                valid = [row for row in valid if row[0] >= cutoff]
+            before = self._writer.total_changes
+            self._writer.executemany(
+                """
+                INSERT INTO prices (commodity, state, market, variety, date, min_price, max_price, modal_price, ingested_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (commodity, state, market, variety, date) DO UPDATE SET
+                    min_price = excluded.min_price, max_price = excluded.max_price,
+                    modal_price = excluded.modal_price, ingested_at = excluded.ingested_at
+                WHERE prices.min_price IS NOT excluded.min_price OR prices.max_price IS NOT excluded.max_price
+                    OR prices.modal_price IS NOT excluded.modal_price
+                """,
+                # Rows name their own market; the watched name is the fallback
+                [(commodity, state, row_market or market, variety, day, low, high, modal, now)
+                 for day, row_market, variety, low, high, modal in valid]
+            )
+            stored = self._writer.total_changes - before
+            newest = max([row[0] for row in valid] + ([watermark] if watermark else []), default=None)
+            self._writer.execute(
+                """
+                INSERT INTO ingest_watermarks (commodity, state, market, last_date, last_success, last_attempt, rows, error)
+                VALUES (?, ?, ?, ?, ?, ?, ?, NULL)
+                ON CONFLICT (commodity, state, market) DO UPDATE SET
+                    last_date = excluded.last_date, last_success = excluded.last_success,
+                    last_attempt = excluded.last_attempt, rows = ingest_watermarks.rows + excluded.rows, error = NULL
+                """,
+                (commodity, state, market, newest, now, now, stored)
+            )
+        skipped = len(parsed) - stored
+        self.rows_stored.inc(stored)
+        self.rows_skipped.inc(max(0, len(parsed) - len(valid)))
+        return {"received": len(parsed), "stored": stored, "unchanged_or_skipped": skipped, "last_date": newest}
+
+    def record_failure(self, commodity: str, state: str, market: str, error: str):
+        now = time.time()
+        with self._write_lock, self._writer:
+            self._writer.execute(
+                """
+                INSERT INTO ingest_watermarks (commodity, state, market, last_attempt, error) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (commodity, state, market) DO UPDATE SET
+                    last_attempt = excluded.last_attempt, error = excluded.error
+                """,
+                (normalize(commodity), normalize(state), normalize(market), now, error)
+            )
+
+    def last_success(self) -> Dict[Series, float]:
+        rows = self._query("SELECT commodity, state, market, last_success FROM ingest_watermarks "
+                           "WHERE last_success IS NOT NULL")
+        return {(row["commodity"].casefold(), row["state"].casefold(), row["market"].casefold()): row["last_success"]
+                for row in rows}
+
+    @staticmethod
+    def _filters(commodity: str, state: Optional[str], market: Optional[str],
+                 start: Optional[date], end: Optional[date]) -> Tuple[str, list]:
+        clauses, params = ["commodity = ?"], [normalize(commodity)]
+        for column, value in (("state", state), ("market", market)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(normalize(value))
+        if start is not None:
+            clauses.append("date >= ?")
+            params.append(start.isoformat())
+        if end is not None:
+            clauses.append("date <= ?")
+            params.append(end.isoformat())
+        return " AND ".join(clauses), params
+
+    def prices(self, commodity: str, state: Optional[str] = None, market: Optional[str] = None,
+               start: Optional[date] = None, end: Optional[date] = None, limit: int = 500) -> Dict[str, Any]:
+        """Price rows (newest first) and the min/max/average over the whole range"""
+        where, params = self._filters(commodity, state, market, start, end)
+        summary = self._query(
+            f"SELECT COUNT(*) AS rows, MIN(min_price) AS min_price, MAX(max_price) AS max_price, "
+            f"AVG(modal_price) AS avg_modal_price, MIN(date) AS first_date, MAX(date) AS last_date, "
+            f"COUNT(DISTINCT market) AS markets FROM prices WHERE {where}", params
+        )[0]
+        rows = self._query(
+            f"SELECT commodity, state, market, variety, date, min_price, max_price, modal_price "
+            f"FROM prices WHERE {where} ORDER BY date DESC, market LIMIT ?", params + [limit]
+        )
+        return {"summary": summary, "rows": rows}
+
+    def trend(self, commodity: str, state: Optional[str] = None, market: Optional[str] = None,
+              start: Optional[date] = None, end: Optional[date] = None, interval: str = "day") -> List[Dict[str, Any]]:
+        """Modal price per day, week or month, oldest first"""
+        if interval not in TREND_PERIODS:
+            raise ValueError(f"interval must be one of {', '.join(TREND_PERIODS)}")
+        where, params = self._filters(commodity, state, market, start, end)
+        period = TREND_PERIODS[interval]
+        return self._query(
+            f"SELECT {period} AS period, AVG(modal_price) AS avg_modal_price, MIN(min_price) AS min_price, "
+            f"MAX(max_price) AS max_price, COUNT(DISTINCT market) AS markets, COUNT(*) AS samples "
+            f"FROM prices WHERE {where} GROUP BY period ORDER BY period", params
+        )
+
+    def best_markets(self, commodity: str, state: str, days: int = 7, limit: int = 10) -> Dict[str, Any]:
+        """Markets in a state ranked by average modal price over the ``days`` up to the newest data"""
+        where, params = self._filters(commodity, state, None, None, None)
+        newest = self._query(f"SELECT MAX(date) AS last_date FROM prices WHERE {where}", params)[0]["last_date"]
+        if newest is None:
+            return {"window": None, "markets": []}
+        start = (date.fromisoformat(newest) - timedelta(days=max(1, days) - 1)).isoformat()
+        markets = self._query(
+            f"""
+            SELECT market, AVG(modal_price) AS avg_modal_price, MAX(modal_price) AS max_modal_price,
+                   MAX(date) AS latest_date, COUNT(*) AS samples,
+                   (SELECT p.modal_price FROM prices AS p
+                    WHERE p.commodity = prices.commodity AND p.state = prices.state AND p.market = prices.market
+                    ORDER BY p.date DESC LIMIT 1) AS latest_modal_price
+            FROM prices WHERE {where} AND date >= ?
+            GROUP BY market ORDER BY avg_modal_price DESC LIMIT ?
+            """,
+            params + [start, limit]
+        )
+        for rank, row in enumerate(markets, 1):
+            row["rank"] = rank
+        return {"window": {"start": start, "end": newest}, "markets": markets}
+
+    def stats(self) -> Dict[str, Any]:
+        totals = self._query("SELECT COUNT(*) AS rows, MIN(date) AS first_date, MAX(date) AS last_date FROM prices")[0]
+        series = self._query(
+            "SELECT COUNT(*) AS watched, SUM(error IS NOT NULL) AS failing, MIN(last_success) AS oldest_success "
+            "FROM ingest_watermarks"
+        )[0]
+        return {
+            "path": self.path,
+            "bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            **totals,
+            "series": series["watched"],
+            "failing_series": series["failing"] or 0,
+            "oldest_success": series["oldest_success"],
+            "rows_stored": self.rows_stored.value,
+            "rows_skipped": self.rows_skipped.value,
+            "queries": self.queries.value
+        }
+
+    def close(self):
+        with self._write_lock:
+            self._writer.close()
+
+
+class MarketIngestor:
+    """Pulls every watched (commodity, state, market) from ``source`` into the warehouse on a schedule.
+
+    A combination is only pulled once its last successful pull is older
+    than ``interval``, so restarts and manual runs don't refetch fresh data.
+    """
+
+    def __init__(self, warehouse: MarketWarehouse, source, watchlist: List[Series],
+                 interval: float = MARKET_INGEST_INTERVAL_S, concurrency: int = MARKET_INGEST_CONCURRENCY):
+        self.warehouse = warehouse
+        self.source = source
+        self.watchlist = watchlist
+        self.interval = interval
+        self.concurrency = max(1, concurrency)
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self.last_run: Optional[dict] = None
+
+        self.pulls = registry.counter("market_ingest_pulls_total", "Upstream pulls made by the ingestion job")
+        self.failures = registry.counter("market_ingest_failures_total", "Failed ingestion pulls")
+
+    async def ingest(self, commodity: str, state: str, market: str) -> Dict[str, Any]:
+        self.pulls.inc()
+        try:
+            rows = await self.source.fetch(commodity, state, market)
+        except Exception as e:
+            detail = getattr(e, "detail", None) or str(e) or type(e).__name__
+            self.failures.inc()
+            await run_in_threadpool(self.warehouse.record_failure, commodity, state, market, detail)
+            return {"series": [commodity, state, market], "error": detail}
+        result = await run_in_threadpool(self.warehouse.store, commodity, state, market, rows or [])
+        return {"series": [commodity, state, market], **result}
+
+    async def run_once(self, force: bool = False) -> Dict[str, Any]:
+        """Pull every due combination (all of them with ``force``); one run at a time"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            started = time.time()
+            last_success = await run_in_threadpool(self.warehouse.last_success)
+            due = [series for series in self.watchlist
+                   if force or started - last_success.get(tuple(v.casefold() for v in series), 0) >= self.interval]
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def pull(series: Series):
+                async with semaphore:
+                    return await self.ingest(*series)
+
+            results = await asyncio.gather(*(pull(series) for series in due))
+            self.last_run = {
+                "at": datetime.fromtimestamp(started).isoformat(),
+                "seconds": time.time() - started,
+                "watched": len(self.watchlist),
+                "pulled": len(due),
+                "rows_stored": sum(result.get("stored", 0) for result in results),
+                "failed": [result for result in results if "error" in result]
+            }
+            return self.last_run
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Market ingestion run failed: {str(e)}")
+            await asyncio.sleep(max(60.0, min(self.interval, 3600.0)))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "source": self.source.name,
+            "watched": len(self.watchlist),
+            "interval_s": self.interval,
+            "running": self._task is not None and not self._task.done(),
+            "pulls": self.pulls.value,
+            "failures": self.failures.value,
+            "last_run": self.last_run
+        }
@@ -0,0 +1,233 @@
+import bisect
+import functools
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Dict, Any, List, Optional, Sequence
+
+# Set to 0 to turn off latency timers, per-route request metrics and /metrics; plain counters are always kept
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() not in ("0", "false", "no", "off")
+
+# Seconds; spans cache hits (sub-millisecond) to slow upstream calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+Labels = Optional[Dict[str, str]]
+
+_NO_TIMER = nullcontext()
+
+
+def metric_key(name: str, labels: Labels = None) -> str:
+    """Registry key, which is also the Prometheus series name: name{label="value",...}"""
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    """Monotonically increasing counter"""
+
+    def __init__(self, name: str, description: str = "", labels: Labels = None):
+        self.name = name
+        self.description = description
+        self.labels = dict(labels or {})
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"type": "counter", "value": self._value}
+
+
+class Gauge:
+    """Value that goes up and down, e.g. requests in flight"""
+
+    def __init__(self, name: str, description: str = "", labels: Labels = None):
+        self.name = name
+        self.description = description
+        self.labels = dict(labels or {})
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value: float):
+        self._value = value
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"type": "gauge", "value": self._value}
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: "Histogram"):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Histogram:
+    """Cumulative bucketed histogram with count and sum"""
+
+    def __init__(self, name: str, buckets: Sequence[float], description: str = "", labels: Labels = None):
+        self.name = name
+        self.description = description
+        self.labels = dict(labels or {})
+        self.buckets: List[float] = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def timer(self):
+        """Context manager observing its block's duration in seconds; a shared no-op when metrics are off"""
+        return _Timer(self) if METRICS_ENABLED else _NO_TIMER
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+
+        cumulative = 0
+        buckets = {}
+        for upper, bucket_count in zip(self.buckets + [float("inf")], counts):
+            cumulative += bucket_count
+            buckets["+Inf" if upper == float("inf") else f"{upper:g}"] = cumulative
+
+        return {
+            "type": "histogram",
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else 0.0,
+            "buckets": buckets
+        }
+
+
+def timed(histogram: Histogram):
+    """Decorator observing each call's duration; returns the function untouched when metrics are off"""
+    def decorate(fn):
+        if not METRICS_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class MetricsRegistry:
+    """Process-wide collection of named metrics, optionally labelled"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, description: str = "", labels: Labels = None) -> Counter:
+        return self._get_or_create(metric_key(name, labels), lambda: Counter(name, description, labels))
+
+    def gauge(self, name: str, description: str = "", labels: Labels = None) -> Gauge:
+        return self._get_or_create(metric_key(name, labels), lambda: Gauge(name, description, labels))
+
+    def histogram(self, name: str, buckets: Sequence[float], description: str = "",
+                  labels: Labels = None) -> Histogram:
+        return self._get_or_create(metric_key(name, labels), lambda: Histogram(name, buckets, description, labels))
+
+    def timer(self, name: str, description: str = "", labels: Labels = None) -> Histogram:
+        """Latency histogram in seconds; use its ``timer()`` or the ``timed`` decorator"""
+        return self.histogram(name, LATENCY_BUCKETS, description, labels)
+
+    def _get_or_create(self, key: str, factory):
+        metric = self._metrics.get(key)
+        if metric is not None:
+            return metric
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = factory()
+                self._metrics[key] = metric
+            return metric
+
+    def snapshot(self, prefix: Optional[str] = None) -> Dict[str, Any]:
+        """Return a JSON-serializable view of all metrics, optionally filtered by name prefix"""
+        with self._lock:
+            metrics = list(self._metrics.items())
+        return {
+            name: metric.snapshot()
+            for name, metric in metrics
+            if prefix is None or name.startswith(prefix)
+        }
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        families: Dict[str, List[Any]] = {}
+        for metric in metrics:
+            families.setdefault(metric.name, []).append(metric)
+
+        lines = []
+        for name, members in families.items():
+            kind = members[0].snapshot()["type"]
+            description = members[0].description.replace("\\", "\\\\").replace("\n", "\\n")
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for metric in members:
+                snapshot = metric.snapshot()
+                if kind != "histogram":
+                    lines.append(f"{metric_key(name, metric.labels)} {_format_value(snapshot['value'])}")
+                    continue
+                for upper, count in snapshot["buckets"].items():
+                    lines.append(f"{metric_key(name + '_bucket', {**metric.labels, 'le': upper})} {count}")
+                lines.append(f"{metric_key(name + '_sum', metric.labels)} {_format_value(snapshot['sum'])}")
+                lines.append(f"{metric_key(name + '_count', metric.labels)} {snapshot['count']}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared registry for the whole application
+registry = MetricsRegistry()
@@ -0,0 +1,151 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+STATE_PENDING = "pending"
+STATE_LOADING = "loading"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+# Minimum delay before a failed component is retried on demand
+RETRY_INTERVAL_S = float(os.getenv("MODEL_RETRY_INTERVAL_S", "30"))
+
+
+class _Component:
+    def __init__(self, name: str, loader: Callable[[], None], warmup: Optional[Callable[[], None]]):
+        self.name = name
+        self.loader = loader
+        self.warmup = warmup
+        self.state = STATE_PENDING
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self.attempts = 0
+        self.last_attempt = 0.0
+
+
+class ModelRegistry:
+    """Tracks models and other heavy dependencies that load in the background.
+
+    Routers register a loader (and optional warm-up) at import time instead
+    of loading eagerly. ``start_background_loading`` loads everything in
+    parallel after the server is up, and ``ensure_ready`` lets each router
+    answer 503 for its own component until it is usable.
+    """
+
+    def __init__(self):
+        self._components: Dict[str, _Component] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.warmup_enabled = os.getenv("MODEL_WARMUP", "1").lower() not in ("0", "false", "no")
+        self.started_at = time.monotonic()
+
+    def register(self, name: str, loader: Callable[[], None], warmup: Optional[Callable[[], None]] = None):
+        with self._lock:
+            self._components[name] = _Component(name, loader, warmup)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max(1, len(self._components)),
+                    thread_name_prefix="model-loader"
+                )
+            return self._executor
+
+    def _claim(self, component: _Component, retry: bool) -> bool:
+        """Move a component to loading if it is eligible; returns False if someone else has it"""
+        with self._lock:
+            if component.state in (STATE_LOADING, STATE_READY):
+                return False
+            if component.state == STATE_FAILED and not retry:
+                return False
+            component.state = STATE_LOADING
+            component.attempts += 1
+            component.last_attempt = time.monotonic()
+            return True
+
+    def _load(self, component: _Component):
+        start = time.perf_counter()
+        try:
+            component.loader()
+            component.load_seconds = time.perf_counter() - start
+            if self.warmup_enabled and component.warmup is not None:
+                warmup_start = time.perf_counter()
+                component.warmup()
+                component.warmup_seconds = time.perf_counter() - warmup_start
+        except Exception as e:
+            component.error = str(e)
+            component.state = STATE_FAILED
+            logger.error(f"Failed to load {component.name} after {time.perf_counter() - start:.2f}s: {str(e)}")
+            return
+
+        component.error = None
+        component.state = STATE_READY
+        warmup_note = f", warm-up {component.warmup_seconds:.2f}s" if component.warmup_seconds is not None else ""
+        logger.info(f"Loaded {component.name} in {component.load_seconds:.2f}s{warmup_note}")
+
+    def start_background_loading(self):
+        """Load every pending component in parallel without blocking the caller"""
+        executor = self._get_executor()
+        for component in list(self._components.values()):
+            if self._claim(component, retry=False):
+                executor.submit(self._load, component)
+
+    def load_now(self, name: str):
+        """Load a component synchronously (for scripts and tools); raises if it fails"""
+        component = self._components[name]
+        if self._claim(component, retry=True):
+            self._load(component)
+        while component.state == STATE_LOADING:
+            time.sleep(0.05)
+        if component.state != STATE_READY:
+            raise RuntimeError(f"{name} failed to load: {component.error}")
+
+    def is_ready(self, name: str) -> bool:
+        component = self._components.get(name)
+        return component is not None and component.state == STATE_READY
+
+    def ensure_ready(self, name: str, detail: str):
+        """Raise 503 unless the component is ready, kicking off a (re)load if needed"""
+        component = self._components[name]
+        if component.state == STATE_READY:
+            return True
+
+        retry = component.state == STATE_FAILED and time.monotonic() - component.last_attempt >= RETRY_INTERVAL_S
+        if component.state == STATE_PENDING or retry:
+            if self._claim(component, retry=True):
+                self._get_executor().submit(self._load, component)
+
+        message = f"{detail} (state: {component.state}"
+        if component.error:
+            message += f", error: {component.error}"
+        raise HTTPException(status_code=503, detail=message + ")", headers={"Retry-After": "5"})
+
+    def report(self) -> dict:
+        components = {
+            name: {
+                "state": component.state,
+                "load_seconds": component.load_seconds,
+                "warmup_seconds": component.warmup_seconds,
+                "attempts": component.attempts,
+                "error": component.error
+            }
+            for name, component in self._components.items()
+        }
+        return {
+            "ready": all(component.state == STATE_READY for component in self._components.values()),
+            "uptime_seconds": time.monotonic() - self.started_at,
+            "components": components
+        }
+
+
+# Shared registry for all routers
+model_registry = ModelRegistry()
@@ -0,0 +1,137 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+from typing import Iterable, Optional
+
+import torch
+from torchvision import models
+
+logger = logging.getLogger(__name__)
+
+# Selectable CPU inference backends for the plant disease model
+BACKEND_EAGER = "eager"
+BACKEND_TORCHSCRIPT = "torchscript"
+BACKEND_INT8 = "int8"
+BACKENDS = (BACKEND_EAGER, BACKEND_TORCHSCRIPT, BACKEND_INT8)
+
+QUANTIZATION_ENGINE = os.getenv("PLANT_QUANTIZATION_ENGINE", "x86")
+
+
+def file_digest(path: str) -> str:
+    """Content hash of a weights file, used as the model version"""
+    digest = hashlib.blake2b(digest_size=8)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def variant_path(weights_path: str, backend: str) -> str:
+    """Location of a prebuilt variant next to the fp32 weights, e.g. best_tuned_model.int8.pt"""
+    root, _ = os.path.splitext(weights_path)
+    return f"{root}.{backend}.pt"
+
+
+def _metadata_path(path: str) -> str:
+    return f"{path}.json"
+
+
+def build_eager_model(weights_path: str, num_classes: int, device: torch.device) -> torch.nn.Module:
+    """EfficientNet-B0 with the plant disease head, fp32, eval mode, channels_last"""
+    net = models.efficientnet_b0(weights=None)
+    net.classifier[1] = torch.nn.Linear(net.classifier[1].in_features, num_classes)
+    net.load_state_dict(torch.load(weights_path, map_location=device))
+    net = net.to(device).to(memory_format=torch.channels_last)
+    net.eval()
+    return net
+
+
+def example_batch(batch_size: int = 1, input_size: int = 224) -> torch.Tensor:
+    return torch.zeros(batch_size, 3, input_size, input_size).contiguous(memory_format=torch.channels_last)
+
+
+def script_model(net: torch.nn.Module, input_size: int = 224) -> torch.jit.ScriptModule:
+    """Trace and freeze a model into a TorchScript graph with constants folded"""
+    with torch.inference_mode():
+        traced = torch.jit.trace(net, example_batch(2, input_size))
+    return torch.jit.freeze(traced.eval())
+
+
+def quantize_model(net: torch.nn.Module, calibration_batches: Iterable[torch.Tensor],
+                   input_size: int = 224) -> torch.jit.ScriptModule:
+    """Post-training static int8 quantization (FX graph mode), calibrated on sample batches"""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    torch.backends.quantized.engine = QUANTIZATION_ENGINE
+    float_model = copy.deepcopy(net).to("cpu").eval()
+    prepared = prepare_fx(float_model, get_default_qconfig_mapping(QUANTIZATION_ENGINE),
+                          (example_batch(1, input_size),))
+    calibrated = 0
+    with torch.inference_mode():
+        for batch in calibration_batches:
+            prepared(batch.contiguous(memory_format=torch.channels_last))
+            calibrated += batch.shape[0]
+    if calibrated == 0:
+        raise ValueError("int8 quantization needs at least one calibration batch")
+    return script_model(convert_fx(prepared), input_size)
+
+
+def save_variant(module: torch.jit.ScriptModule, weights_path: str, backend: str, **metadata) -> str:
+    """Save a variant along with the digest of the fp32 weights it was built from"""
+    path = variant_path(weights_path, backend)
+    torch.jit.save(module, path)
+    with open(_metadata_path(path), "w") as f:
+        json.dump({"backend": backend, "source_digest": file_digest(weights_path), **metadata}, f, indent=2)
+    return path
+
+
+def load_variant(weights_path: str, backend: str, device: torch.device,
+                 source_digest: Optional[str] = None) -> Optional[torch.jit.ScriptModule]:
+    """Load a prebuilt variant, or None if it is missing or was built from other weights"""
+    path = variant_path(weights_path, backend)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(_metadata_path(path)) as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        metadata = {}
+    if source_digest is not None and metadata.get("source_digest") != source_digest:
+        logger.warning(f"Ignoring stale {backend} variant {path}: built from different weights")
+        return None
+    if backend == BACKEND_INT8:
+        torch.backends.quantized.engine = QUANTIZATION_ENGINE
+    return torch.jit.load(path, map_location=device).eval()
+
+
+def load_plant_model(backend: str, weights_path: str, num_classes: int, device: torch.device,
+                     source_digest: Optional[str] = None):
+    """Load the requested backend, returning (model, backend actually used).
+
+    TorchScript can be built on the fly from the fp32 weights; int8 needs a
+    calibrated variant from tools/build_plant_variants.py. When a variant
+    cannot be used the fp32 eager model is served instead.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown plant model backend '{backend}', expected one of {', '.join(BACKENDS)}")
+
+    if backend == BACKEND_EAGER:
+        return build_eager_model(weights_path, num_classes, device), BACKEND_EAGER
+
+    if backend == BACKEND_INT8 and device.type != "cpu":
+        logger.warning("int8 plant model backend is CPU-only, falling back to eager")
+        return build_eager_model(weights_path, num_classes, device), BACKEND_EAGER
+
+    variant = load_variant(weights_path, backend, device, source_digest)
+    if variant is not None:
+        return variant, backend
+
+    if backend == BACKEND_TORCHSCRIPT:
+        return script_model(build_eager_model(weights_path, num_classes, device)), BACKEND_TORCHSCRIPT
+
+    logger.warning(f"No usable int8 variant at {variant_path(weights_path, backend)}, falling back to eager. "
+                   f"Build one with tools/build_plant_variants.py")
+    return build_eager_model(weights_path, num_classes, device), BACKEND_EAGER
@@ -0,0 +1,397 @@
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Realtime Database node mirrored in memory
+SENSOR_SNAPSHOT_PATH = os.getenv("SENSOR_SNAPSHOT_PATH", "wirelessDevice")
+# "firebase" for the Realtime Database, "local" for an in-process stand-in (tests, offline development)
+SENSOR_BACKEND = os.getenv("SENSOR_BACKEND", "firebase").lower()
+# JSON file seeding the local backend
+SENSOR_LOCAL_SEED = os.getenv("SENSOR_LOCAL_SEED", "")
+# Reconnect backoff bounds after the listener drops
+SENSOR_RECONNECT_MIN_S = float(os.getenv("SENSOR_RECONNECT_MIN_S", "1"))
+SENSOR_RECONNECT_MAX_S = float(os.getenv("SENSOR_RECONNECT_MAX_S", "60"))
+# While disconnected, the last snapshot is still served for this long before reads go to the backend
+SENSOR_SNAPSHOT_MAX_STALE_S = float(os.getenv("SENSOR_SNAPSHOT_MAX_STALE_S", "120"))
+# How often the supervisor checks that the listener is alive
+SENSOR_LISTENER_CHECK_S = float(os.getenv("SENSOR_LISTENER_CHECK_S", "1"))
+
+# Realtime Database round trips made outside the listener (direct reads and writes)
+firebase_latency = {
+    op: registry.timer("firebase_request_seconds", "Realtime Database request latency", {"op": op})
+    for op in ("get", "update")
+}
+firebase_errors = {
+    op: registry.counter("firebase_errors_total", "Failed Realtime Database requests", {"op": op})
+    for op in ("get", "update")
+}
+
+
+def split_path(path: str) -> List[str]:
+    return [key for key in path.split("/") if key]
+
+
+def set_path(node: Any, keys: List[str], value: Any) -> Any:
+    """Copy-on-write set of ``value`` at ``keys`` below ``node``, with Realtime Database semantics.
+
+    Only the dicts along the path are copied, so earlier snapshots handed
+    to readers never change. None deletes, and a dict left empty disappears.
+    """
+    if not keys:
+        return value if value != {} else None
+    base = dict(node) if isinstance(node, dict) else {}
+    child = set_path(base.get(keys[0]), keys[1:], value)
+    if child is None:
+        base.pop(keys[0], None)
+    else:
+        base[keys[0]] = child
+    return base or None
+
+
+class SnapshotEvent:
+    """Change event in the shape of ``firebase_admin.db.Event``"""
+    __slots__ = ("event_type", "path", "data")
+
+    def __init__(self, event_type: str, path: str, data: Any):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+class SnapshotBackend:
+    """Source of the mirrored node: one-off reads, writes and a change stream.
+
+    ``listen`` must deliver a "put" of the full node at path "/" first
+    (and again after any internal reconnect), then "put"/"patch" events
+    relative to the node, and return a handle with ``alive`` and ``close()``.
+    """
+    name = "base"
+
+    def connect(self):
+        """Blocking one-time setup; raises if the backend is unusable"""
+
+    def ensure_ready(self):
+        """Raise an HTTPException if a request cannot use the backend right now"""
+
+    def get(self, path: str) -> Any:
+        raise NotImplementedError
+
+    def update(self, path: str, values: Dict[str, Any]):
+        raise NotImplementedError
+
+    def listen(self, path: str, callback: Callable[[SnapshotEvent], None]):
+        raise NotImplementedError
+
+
+class _FirebaseListener:
+    def __init__(self, registration):
+        self._registration = registration
+
+    @property
+    def alive(self) -> bool:
+        # The SDK reconnects dropped streams itself; its thread only ends on errors it can't handle
+        return self._registration._thread.is_alive()
+
+    def close(self):
+        self._registration.close()
+
+
+class FirebaseBackend(SnapshotBackend):
+    """Firebase Realtime Database, initialized through the model registry component ``component``"""
+    name = "firebase"
+
+    def __init__(self, component: str = "firebase"):
+        self.component = component
+
+    def connect(self):
+        from utils.model_registry import model_registry
+        model_registry.load_now(self.component)
+
+    def ensure_ready(self):
+        from utils.model_registry import model_registry
+        model_registry.ensure_ready(self.component, detail="Firebase connection not initialized yet")
+
+    def get(self, path: str) -> Any:
+        from firebase_admin import db
+        try:
+            with firebase_latency["get"].timer():
+                return db.reference(path).get()
+        except Exception:
+            firebase_errors["get"].inc()
+            raise
+
+    def update(self, path: str, values: Dict[str, Any]):
+        from firebase_admin import db
+        try:
+            with firebase_latency["update"].timer():
+                db.reference(path).update(values)
+        except Exception:
+            firebase_errors["update"].inc()
+            raise
+
+    def listen(self, path: str, callback: Callable[[SnapshotEvent], None]):
+        from firebase_admin import db
+        return _FirebaseListener(db.reference(path).listen(callback))
+
+
+class _LocalListener:
+    def __init__(self, backend: "LocalBackend", path: str, callback: Callable[[SnapshotEvent], None]):
+        self.backend = backend
+        self.path = path
+        self.callback = callback
+        self.alive = True
+
+    def close(self):
+        self.alive = False
+        with self.backend._lock:
+            if self in self.backend._listeners:
+                self.backend._listeners.remove(self)
+
+
+class LocalBackend(SnapshotBackend):
+    """In-process stand-in for the Realtime Database; events are delivered synchronously"""
+    name = "local"
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None):
+        self._data = copy.deepcopy(data) or None
+        self._listeners: List[_LocalListener] = []
+        self._lock = threading.RLock()
+        # Round-trips a real database would have seen
+        self.updates = 0
+
+    @classmethod
+    def from_file(cls, path: str) -> "LocalBackend":
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def get(self, path: str) -> Any:
+        node = self._data
+        for key in split_path(path):
+            node = node.get(key) if isinstance(node, dict) else None
+        return copy.deepcopy(node)
+
+    def _emit(self, keys: List[str], event_type: str, data: Any):
+        for listener in list(self._listeners):
+            root = split_path(listener.path)
+            if keys[:len(root)] == root:
+                listener.callback(SnapshotEvent(event_type, "/" + "/".join(keys[len(root):]), data))
+            elif root[:len(keys)] == keys:
+                # Write above the listened node: resend the node in full
+                listener.callback(SnapshotEvent("put", "/", self.get(listener.path)))
+
+    def set(self, path: str, value: Any):
+        keys = split_path(path)
+        with self._lock:
+            self._data = set_path(self._data, keys, copy.deepcopy(value))
+            self._emit(keys, "put", copy.deepcopy(value))
+
+    def update(self, path: str, values: Dict[str, Any]):
+        keys = split_path(path)
+        with self._lock:
+            self.updates += 1
+            for child, value in values.items():
+                self._data = set_path(self._data, keys + split_path(child), copy.deepcopy(value))
+            self._emit(keys, "patch", copy.deepcopy(values))
+
+    def listen(self, path: str, callback: Callable[[SnapshotEvent], None]) -> _LocalListener:
+        listener = _LocalListener(self, path, callback)
+        with self._lock:
+            self._listeners.append(listener)
+            callback(SnapshotEvent("put", "/", self.get(path)))
+        return listener
+
+    def disconnect_all(self):
+        """Drop every listener, as a network failure would"""
+        with self._lock:
+            for listener in list(self._listeners):
+                listener.close()
+
+
+def create_backend(name: str = SENSOR_BACKEND) -> SnapshotBackend:
+    if name == "local":
+        return LocalBackend.from_file(SENSOR_LOCAL_SEED) if SENSOR_LOCAL_SEED else LocalBackend()
+    if name == "firebase":
+        return FirebaseBackend()
+    raise ValueError(f"Unknown sensor backend: {name}")
+
+
+class SensorSnapshot:
+    """In-memory mirror of one database node, kept current by a background listener.
+
+    A supervisor thread holds a change-stream listener on ``path`` and
+    applies every event to a local copy, reconnecting with backoff when the
+    stream dies. Requests read the copy without a network round-trip; only
+    before the first sync, or after being disconnected for longer than
+    ``max_stale``, do reads go to the backend directly.
+    """
+
+    def __init__(self, backend: SnapshotBackend, path: str = SENSOR_SNAPSHOT_PATH,
+                 max_stale: float = SENSOR_SNAPSHOT_MAX_STALE_S):
+        self.backend = backend
+        self.path = path
+        self.max_stale = max_stale
+
+        self._data: Any = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._listener = None
+        self._generation = 0
+
+        self.revision = 0
+        self.synced = False
+        self.connected = False
+        self.reconnects = 0
+        self.last_error: Optional[str] = None
+        self.changed_at: Optional[datetime] = None
+        self._last_event = 0.0
+        self._disconnected_since: Optional[float] = None
+        self._change_listeners: List[Callable[[int], None]] = []
+
+        self.events = registry.counter("sensor_snapshot_events_total", "Change events applied to the sensor snapshot")
+        self.local_reads = registry.counter("sensor_snapshot_local_reads_total", "Sensor reads served from memory")
+        self.direct_reads = registry.counter("sensor_snapshot_direct_reads_total", "Sensor reads sent to the backend")
+
+    def _on_event(self, generation: int, event):
+        try:
+            keys = split_path(event.path)
+            with self._lock:
+                if generation != self._generation:
+                    return
+                if event.event_type == "put":
+                    self._data = set_path(self._data, keys, event.data)
+                    if not keys:
+                        self.synced = True
+                        self._disconnected_since = None
+                elif event.event_type == "patch":
+                    for child, value in (event.data or {}).items():
+                        self._data = set_path(self._data, keys + split_path(child), value)
+                else:
+                    return
+                self.revision += 1
+                revision = self.revision
+                self.changed_at = datetime.now()
+                self._last_event = time.monotonic()
+            self.events.inc()
+            for callback in self._change_listeners:
+                callback(revision)
+        except Exception as e:
+            # An exception here would end the SDK's listener thread
+            logger.error(f"Could not apply sensor snapshot event {getattr(event, 'path', '?')}: {str(e)}")
+
+    def add_change_listener(self, callback: Callable[[int], None]):
+        """Call ``callback(revision)`` after every applied change, on the listener's thread"""
+        self._change_listeners.append(callback)
+
+    def _connect(self):
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        self.backend.connect()
+        self._listener = self.backend.listen(self.path, lambda event: self._on_event(generation, event))
+        self.connected = True
+        self.last_error = None
+        logger.info(f"Listening for changes on {self.backend.name}:{self.path}")
+
+    def _disconnect(self):
+        listener, self._listener = self._listener, None
+        if self._disconnected_since is None:
+            self._disconnected_since = time.monotonic()
+        self.connected = False
+        if listener is not None:
+            try:
+                listener.close()
+            except Exception as e:
+                logger.warning(f"Error closing sensor listener: {str(e)}")
+
+    def _run(self):
+        delay = SENSOR_RECONNECT_MIN_S
+        while not self._stop.is_set():
+            try:
+                self._connect()
+                while not self._stop.is_set() and self._listener.alive:
+                    if self.synced:
+                        delay = SENSOR_RECONNECT_MIN_S
+                    self._stop.wait(SENSOR_LISTENER_CHECK_S)
+                if not self._stop.is_set():
+                    self.last_error = "Listener stopped"
+                    logger.warning(f"Sensor listener on {self.path} stopped; reconnecting in {delay:.1f}s")
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"Sensor listener on {self.path} failed: {str(e)}; retrying in {delay:.1f}s")
+            self._disconnect()
+            if self._stop.is_set():
+                break
+            with self._lock:
+                self.synced = False
+            self.reconnects += 1
+            self._stop.wait(delay)
+            delay = min(delay * 2, SENSOR_RECONNECT_MAX_S)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sensor-listener", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the supervisor and close the listener (blocking)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def staleness(self) -> Optional[float]:
+        """Seconds the snapshot may have been missing changes; 0 while connected and synced"""
+        if self.connected and self.synced:
+            return 0.0
+        if self._disconnected_since is None or self.revision == 0:
+            return None
+        return time.monotonic() - self._disconnected_since
+
+    def is_fresh(self) -> bool:
+        staleness = self.staleness()
+        return staleness is not None and staleness <= self.max_stale
+
+    def get(self) -> Any:
+        """The mirrored node; a fresh top-level dict per call, nested values must be treated as read-only"""
+        data = self._data
+        return dict(data) if isinstance(data, dict) else data
+
+    async def read(self) -> Any:
+        """Serve from memory when fresh, otherwise read the backend directly"""
+        if self.is_fresh():
+            self.local_reads.inc()
+            return self.get()
+        self.backend.ensure_ready()
+        self.direct_reads.inc()
+        return await run_in_threadpool(self.backend.get, self.path)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "path": self.path,
+            "connected": self.connected,
+            "synced": self.synced,
+            "fresh": self.is_fresh(),
+            "staleness_s": self.staleness(),
+            "revision": self.revision,
+            "changed_at": self.changed_at.isoformat() if self.changed_at else None,
+            "last_event_age_s": time.monotonic() - self._last_event if self._last_event else None,
+            "reconnects": self.reconnects,
+            "last_error": self.last_error,
+            "events": self.events.value,
+            "local_reads": self.local_reads.value,
+            "direct_reads": self.direct_reads.value
+        }
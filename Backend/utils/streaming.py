@@ -0,0 +1,36 @@
+import json
+from typing import Any, AsyncIterable, Iterable, Union
+
+from fastapi.responses import StreamingResponse
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+SSE_MEDIA_TYPE = "text/event-stream"
+
+
+def ndjson_line(obj: Any) -> bytes:
+    """Serialize one object as a newline-terminated JSON line"""
+    return (json.dumps(obj, default=str) + "\n").encode("utf-8")
+
+
+def ndjson_response(lines: Union[Iterable[bytes], AsyncIterable[bytes]]) -> StreamingResponse:
+    """Stream already-serialized NDJSON lines to the client as they are produced"""
+    return StreamingResponse(
+        lines,
+        media_type=NDJSON_MEDIA_TYPE,
+        headers={"X-Content-Type-Options": "nosniff", "Cache-Control": "no-cache"}
+    )
+
+
+def sse_event(event: str, data: Any, event_id: Any = None) -> bytes:
+    """Serialize one Server-Sent Event with a JSON payload"""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode("utf-8")
+
+
+def sse_response(events: Union[Iterable[bytes], AsyncIterable[bytes]]) -> StreamingResponse:
+    """Stream already-serialized Server-Sent Events; X-Accel-Buffering stops proxies from holding them back"""
+    return StreamingResponse(
+        events,
+        media_type=SSE_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
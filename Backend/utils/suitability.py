@@ -0,0 +1,259 @@
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SUITABILITY_TILE_SIZE = int(os.getenv("SUITABILITY_TILE_SIZE", "512"))
+SUITABILITY_WORKERS = int(os.getenv("SUITABILITY_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+# Pixels per predict_proba call inside a tile, bounding worker memory
+SUITABILITY_PREDICT_CHUNK = int(os.getenv("SUITABILITY_PREDICT_CHUNK", "16384"))
+
+CROP_INDEX_FILE = "crop_index.npy"
+CONFIDENCE_FILE = "confidence.npy"
+TILES_DONE_FILE = "tiles_done.npy"
+MANIFEST_FILE = "manifest.json"
+SUMMARY_FILE = "summary.json"
+NODATA_INDEX = -1
+
+Tile = Tuple[int, int, int, int, int, int]  # (tile_row, tile_col, row0, row1, col0, col1)
+
+
+class SuitabilityError(Exception):
+    pass
+
+
+def input_paths(input_dir: str, features: Sequence[str]) -> List[str]:
+    return [os.path.join(input_dir, f"{feature}.npy") for feature in features]
+
+
+def check_inputs(input_dir: str, features: Sequence[str]) -> Tuple[int, int]:
+    """Validate the per-feature grids and return their common (rows, cols) shape"""
+    shape = None
+    for feature, path in zip(features, input_paths(input_dir, features)):
+        if not os.path.exists(path):
+            raise SuitabilityError(f"Missing input grid for {feature}: {path}")
+        grid = np.load(path, mmap_mode="r")
+        if grid.ndim != 2:
+            raise SuitabilityError(f"{feature}.npy must be 2-D, got shape {grid.shape}")
+        if not np.issubdtype(grid.dtype, np.number):
+            raise SuitabilityError(f"{feature}.npy must be numeric, got {grid.dtype}")
+        if shape is not None and grid.shape != shape:
+            raise SuitabilityError(f"{feature}.npy has shape {grid.shape}, expected {shape}")
+        shape = grid.shape
+    return shape
+
+
+def tile_grid(shape: Tuple[int, int], tile_size: int) -> List[Tile]:
+    rows, cols = shape
+    return [
+        (tile_row, tile_col, row0, min(row0 + tile_size, rows), col0, min(col0 + tile_size, cols))
+        for tile_row, row0 in enumerate(range(0, rows, tile_size))
+        for tile_col, col0 in enumerate(range(0, cols, tile_size))
+    ]
+
+
+def _write_json(path: str, data: dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _model_fingerprint(model_path: str) -> List[int]:
+    stat = os.stat(model_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+# Per-process state for pool workers
+_worker: Dict[str, object] = {}
+
+
+def _init_worker(model_path: str, features: Sequence[str], input_dir: str, output_dir: str):
+    import joblib
+    from utils.features import verify_feature_names
+
+    model = joblib.load(model_path)
+    verify_feature_names(model, features, "Crop recommendation model")
+    _worker.update(
+        model=model,
+        inputs=[np.load(path, mmap_mode="r") for path in input_paths(input_dir, features)],
+        crop_index=np.load(os.path.join(output_dir, CROP_INDEX_FILE), mmap_mode="r+"),
+        confidence=np.load(os.path.join(output_dir, CONFIDENCE_FILE), mmap_mode="r+")
+    )
+
+
+def _score_tile(tile: Tile) -> Tuple[int, int, int]:
+    """Score one tile into the output memmaps; returns (tile_row, tile_col, valid pixels)"""
+    tile_row, tile_col, row0, row1, col0, col1 = tile
+    model = _worker["model"]
+    features = np.stack(
+        [np.asarray(grid[row0:row1, col0:col1], dtype=np.float64) for grid in _worker["inputs"]], axis=-1
+    ).reshape(-1, len(_worker["inputs"]))
+
+    index = np.full(len(features), NODATA_INDEX, dtype=np.int16)
+    confidence = np.full(len(features), np.nan, dtype=np.float32)
+    valid = np.flatnonzero(np.isfinite(features).all(axis=1))
+    for start in range(0, len(valid), SUITABILITY_PREDICT_CHUNK):
+        rows = valid[start:start + SUITABILITY_PREDICT_CHUNK]
+        probabilities = model.predict_proba(features[rows])
+        best = probabilities.argmax(axis=1)
+        index[rows] = best
+        confidence[rows] = probabilities[np.arange(len(rows)), best]
+
+    shape = (row1 - row0, col1 - col0)
+    _worker["crop_index"][row0:row1, col0:col1] = index.reshape(shape)
+    _worker["confidence"][row0:row1, col0:col1] = confidence.reshape(shape)
+    _worker["crop_index"].flush()
+    _worker["confidence"].flush()
+    return tile_row, tile_col, len(valid)
+
+
+def _prepare_outputs(output_dir: str, manifest: dict, tiles_shape: Tuple[int, int], resume: bool) -> np.memmap:
+    """Create outputs, or reopen them when resuming a job with identical parameters; returns tiles_done"""
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    done_path = os.path.join(output_dir, TILES_DONE_FILE)
+
+    if resume and os.path.exists(manifest_path) and os.path.exists(done_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+        if previous != manifest:
+            raise SuitabilityError(
+                "Output directory holds a job with different parameters; use a new output directory "
+                "or disable resume to start over"
+            )
+        return np.load(done_path, mmap_mode="r+")
+
+    shape = tuple(manifest["shape"])
+    np.lib.format.open_memmap(os.path.join(output_dir, CROP_INDEX_FILE), mode="w+", dtype=np.int16, shape=shape).flush()
+    np.lib.format.open_memmap(os.path.join(output_dir, CONFIDENCE_FILE), mode="w+", dtype=np.float32, shape=shape).flush()
+    tiles_done = np.lib.format.open_memmap(done_path, mode="w+", dtype=np.uint8, shape=tiles_shape)
+    tiles_done.flush()
+    summary_path = os.path.join(output_dir, SUMMARY_FILE)
+    if os.path.exists(summary_path):
+        os.remove(summary_path)
+    _write_json(manifest_path, manifest)
+    return tiles_done
+
+
+def summarize(output_dir: str, classes: Sequence[str], block_rows: int = 1024) -> dict:
+    """Per-crop pixel counts and confidence, read back from the outputs in row blocks"""
+    crop_index = np.load(os.path.join(output_dir, CROP_INDEX_FILE), mmap_mode="r")
+    confidence = np.load(os.path.join(output_dir, CONFIDENCE_FILE), mmap_mode="r")
+    counts = np.zeros(len(classes), dtype=np.int64)
+    confidence_sums = np.zeros(len(classes), dtype=np.float64)
+    nodata = 0
+    for row0 in range(0, crop_index.shape[0], block_rows):
+        index = np.asarray(crop_index[row0:row0 + block_rows]).ravel()
+        conf = np.asarray(confidence[row0:row0 + block_rows], dtype=np.float64).ravel()
+        valid = index != NODATA_INDEX
+        nodata += int((~valid).sum())
+        counts += np.bincount(index[valid], minlength=len(classes))
+        confidence_sums += np.bincount(index[valid], weights=conf[valid], minlength=len(classes))
+
+    valid_pixels = int(counts.sum())
+    crops = {
+        crop: {
+            "pixels": int(count),
+            "share": count / valid_pixels if valid_pixels else 0.0,
+            "mean_confidence": confidence_sums[i] / count if count else None
+        }
+        for i, (crop, count) in enumerate(zip(classes, counts))
+        if count
+    }
+    return {
+        "shape": list(crop_index.shape),
+        "classes": list(classes),
+        "valid_pixels": valid_pixels,
+        "nodata_pixels": nodata,
+        "mean_confidence": confidence_sums.sum() / valid_pixels if valid_pixels else None,
+        "crops": dict(sorted(crops.items(), key=lambda item: -item[1]["pixels"]))
+    }
+
+
+def run_suitability_job(input_dir: str, output_dir: str, model_path: str, features: Sequence[str],
+                        classes: Sequence[str], tile_size: int = SUITABILITY_TILE_SIZE,
+                        workers: int = SUITABILITY_WORKERS, resume: bool = True,
+                        progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """Map top-1 crop and confidence for every pixel of a raster, tile by tile.
+
+    ``input_dir`` holds one 2-D grid per feature (``N.npy``, ``P.npy``, ...),
+    opened as memory maps so the raster never has to fit in RAM; a pixel is
+    nodata if any input is NaN or infinite. Tiles are scored in a process
+    pool that writes straight into memory-mapped outputs in ``output_dir``:
+
+        crop_index.npy   int16 index into ``classes``, -1 for nodata
+        confidence.npy   float32 top-1 probability, NaN for nodata
+        tiles_done.npy   uint8 per tile, set once its outputs are flushed
+        manifest.json    job parameters; a rerun with the same ones resumes
+        summary.json     per-crop pixel counts and confidence, written last
+    """
+    shape = check_inputs(input_dir, features)
+    tiles = tile_grid(shape, tile_size)
+    tiles_shape = (tiles[-1][0] + 1, tiles[-1][1] + 1)
+    manifest = {
+        "input_dir": os.path.abspath(input_dir),
+        "features": list(features),
+        "shape": list(shape),
+        "tile_size": tile_size,
+        "model_fingerprint": _model_fingerprint(model_path),
+        "classes": list(classes)
+    }
+    tiles_done = _prepare_outputs(output_dir, manifest, tiles_shape, resume)
+    pending = [tile for tile in tiles if not tiles_done[tile[0], tile[1]]]
+
+    state = {
+        "tiles_total": len(tiles),
+        "tiles_done": len(tiles) - len(pending),
+        "tiles_resumed": len(tiles) - len(pending),
+        "pixels_scored": 0,
+        "elapsed_s": 0.0
+    }
+    if progress is not None:
+        progress(dict(state))
+
+    start = time.perf_counter()
+    if pending:
+        # spawn: workers must not inherit the server's threads and locks
+        context = multiprocessing.get_context("spawn")
+        pool = ProcessPoolExecutor(max_workers=max(1, min(workers, len(pending))), mp_context=context,
+                                   initializer=_init_worker,
+                                   initargs=(model_path, list(features), input_dir, output_dir))
+        try:
+            futures = [pool.submit(_score_tile, tile) for tile in pending]
+            for future in as_completed(futures):
+                tile_row, tile_col, valid_pixels = future.result()
+                tiles_done[tile_row, tile_col] = 1
+                tiles_done.flush()
+                state["tiles_done"] += 1
+                state["pixels_scored"] += valid_pixels
+                state["elapsed_s"] = time.perf_counter() - start
+                if progress is not None:
+                    progress(dict(state))
+        except BaseException:
+            # Don't wait for in-flight tiles: they are not marked done and are redone on resume
+            pool.shutdown(wait=False, cancel_futures=True)
+            for process in list((pool._processes or {}).values()):
+                process.terminate()
+            raise
+        pool.shutdown()
+
+    summary = summarize(output_dir, classes)
+    summary.update(
+        tile_size=tile_size,
+        tiles=len(tiles),
+        tiles_resumed=state["tiles_resumed"],
+        elapsed_s=time.perf_counter() - start,
+        completed_at=datetime.utcnow().isoformat()
+    )
+    _write_json(os.path.join(output_dir, SUMMARY_FILE), summary)
+    logger.info(f"Suitability map for {input_dir} complete: {len(tiles)} tiles, {summary['valid_pixels']} pixels")
+    return summary
@@ -0,0 +1,161 @@
+import itertools
+import json
+import os
+from tempfile import SpooledTemporaryFile
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Sequence
+
+import numpy as np
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from utils.streaming import ndjson_line
+
+# pandas is only needed for bulk uploads; import it lazily to keep it out of cold start
+if TYPE_CHECKING:
+    import pandas as pd
+
+CSV_CONTENT_TYPES = ("text/csv", "application/csv", "application/vnd.ms-excel")
+
+# CSV bodies are spooled to a temporary file past this size, so memory stays flat however large the upload
+TABULAR_SPOOL_MAX_MEMORY = int(os.getenv("TABULAR_SPOOL_MAX_MEMORY", str(1024 * 1024)))
+# JSON arrays are parsed whole, so they are for small batches; larger uploads get 413 and should be sent as CSV
+TABULAR_JSON_MAX_BYTES = int(os.getenv("TABULAR_JSON_MAX_BYTES", str(8 * 1024 * 1024)))
+
+
+def parse_json_rows(body: bytes) -> list:
+    rows = json.loads(body)
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise HTTPException(status_code=400, detail="JSON body must be an array of sample objects")
+    return rows
+
+
+def iter_json_chunks(rows: list, columns: Sequence[str], chunk_size: int) -> Iterator["pd.DataFrame"]:
+    import pandas as pd
+
+    for start in range(0, len(rows), chunk_size):
+        yield pd.DataFrame.from_records(rows[start:start + chunk_size], columns=list(columns))
+
+
+def iter_csv_chunks(csv_file, columns: Sequence[str], chunk_size: int) -> Iterator["pd.DataFrame"]:
+    import pandas as pd
+
+    header = pd.read_csv(csv_file, nrows=0).columns
+    missing = [col for col in columns if col not in header]
+    if missing:
+        raise ValueError(f"Missing required feature columns: {', '.join(missing)}")
+    csv_file.seek(0)
+    yield from pd.read_csv(csv_file, usecols=list(columns), chunksize=chunk_size)
+
+
+def iter_spooled_csv_chunks(spool: SpooledTemporaryFile, columns: Sequence[str],
+                            chunk_size: int) -> Iterator["pd.DataFrame"]:
+    """CSV chunks from a spooled body, removing the temporary file once read (or abandoned)"""
+    try:
+        yield from iter_csv_chunks(spool, columns, chunk_size)
+    finally:
+        spool.close()
+
+
+async def spool_body(request: Request) -> SpooledTemporaryFile:
+    """Copy the request body into memory, or a temporary file once it outgrows TABULAR_SPOOL_MAX_MEMORY"""
+    upload = UploadFile(SpooledTemporaryFile(max_size=TABULAR_SPOOL_MAX_MEMORY))
+    try:
+        async for chunk in request.stream():
+            # Writes go through the threadpool once the spool has rolled over to disk
+            await upload.write(chunk)
+        await upload.seek(0)
+    except BaseException:
+        await upload.close()
+        raise
+    return upload.file
+
+
+async def read_json_body(request: Request, max_bytes: int = TABULAR_JSON_MAX_BYTES) -> bytes:
+    too_large = HTTPException(
+        status_code=413,
+        detail=f"JSON bodies are limited to {max_bytes} bytes; send large batches as CSV"
+    )
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > max_bytes:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            raise too_large
+    return bytes(body)
+
+
+async def read_tabular_chunks(request: Request, columns: Sequence[str], chunk_size: int) -> Iterable["pd.DataFrame"]:
+    """Parse a JSON array, a CSV body or a multipart CSV upload ("file" field) into DataFrame chunks.
+
+    CSV bodies are spooled (to disk past TABULAR_SPOOL_MAX_MEMORY) and
+    read a chunk at a time. JSON arrays are parsed whole, so they are
+    meant for small batches and capped at TABULAR_JSON_MAX_BYTES (413).
+    The CSV header and first chunk are read up front so malformed uploads
+    are rejected with 400/415 before a streaming response starts; that
+    parsing, like the JSON decode, runs in the threadpool.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type == "multipart/form-data":
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or not hasattr(upload, "file"):
+            raise HTTPException(status_code=400, detail="Multipart upload must include a CSV file field named 'file'")
+        chunks = iter_csv_chunks(upload.file, columns, chunk_size)
+    elif content_type in CSV_CONTENT_TYPES:
+        chunks = iter_spooled_csv_chunks(await spool_body(request), columns, chunk_size)
+    elif content_type in ("application/json", ""):
+        rows = await run_in_threadpool(parse_json_rows, await read_json_body(request))
+        chunks = iter_json_chunks(rows, columns, chunk_size)
+    else:
+        raise HTTPException(status_code=415, detail="Send a JSON array, text/csv, or a multipart CSV upload")
+
+    first = await run_in_threadpool(next, chunks, None)
+    return itertools.chain([first], chunks) if first is not None else []
+
+
+def stream_scored_rows(chunks: Iterable["pd.DataFrame"], columns: Sequence[str],
+                       score: Callable[[np.ndarray], List[dict]]) -> Iterator[bytes]:
+    """Score chunk by chunk so memory stays flat; bad rows get an error line instead of failing the batch.
+
+    ``score`` receives the valid rows of a chunk as a float64 array in
+    ``columns`` order and returns one result dict per row. Each chunk's
+    lines are yielded as one block: a sync generator is advanced in the
+    threadpool once per item, which would dominate at one item per row.
+    """
+    import pandas as pd
+
+    index = 0
+    chunks = iter(chunks)
+    while True:
+        try:
+            chunk = next(chunks, None)
+        except Exception as e:
+            yield ndjson_line({"index": index, "status": "error", "error": f"Could not read remaining samples: {str(e)}"})
+            return
+        if chunk is None:
+            return
+
+        features = chunk[list(columns)].apply(pd.to_numeric, errors="coerce")
+        invalid = features.isna()
+        valid = ~invalid.any(axis=1).to_numpy()
+
+        try:
+            scored = iter(score(features.to_numpy(dtype=np.float64)[valid]) if valid.any() else [])
+            error = None
+        except Exception as e:
+            scored, error = None, f"Error during prediction: {str(e)}"
+
+        lines = []
+        for row_valid, row_invalid in zip(valid, invalid.to_numpy()):
+            if error is not None:
+                line = {"index": index, "status": "error", "error": error}
+            elif row_valid:
+                line = {"index": index, "status": "success", "data": next(scored)}
+            else:
+                bad = [col for col, flag in zip(columns, row_invalid) if flag]
+                line = {"index": index, "status": "error", "error": f"Missing or non-numeric values: {', '.join(bad)}"}
+            lines.append(ndjson_line(line))
+            index += 1
+        yield b"".join(lines)
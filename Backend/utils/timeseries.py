@@ -0,0 +1,284 @@
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple, TypeVar
+
+import numpy as np
+
+# Readings kept per device and metric before the oldest are overwritten (one a minute for a year)
+SENSOR_HISTORY_CAPACITY = int(os.getenv("SENSOR_HISTORY_CAPACITY", "525600"))
+# An unchanged value is recorded again only after this long, so bursts of unrelated writes don't fill the ring
+SENSOR_HISTORY_MIN_INTERVAL_S = float(os.getenv("SENSOR_HISTORY_MIN_INTERVAL_S", "60"))
+# Upper bound on buckets returned by one query
+SENSOR_HISTORY_MAX_POINTS = int(os.getenv("SENSOR_HISTORY_MAX_POINTS", "5000"))
+# Series kept open (three memory maps, so three file descriptors each); the least recently used are closed
+SENSOR_HISTORY_MAX_OPEN = int(os.getenv("SENSOR_HISTORY_MAX_OPEN", "128"))
+
+NAME_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def valid_name(name: str) -> bool:
+    return bool(NAME_PATTERN.match(name)) and not name.startswith(".")
+
+
+def check_name(name: str, kind: str) -> str:
+    if not valid_name(name):
+        raise ValueError(f"Invalid {kind} name: {name!r}")
+    return name
+
+
+class SeriesClosed(Exception):
+    """The series was evicted from its store while in use; open it again"""
+
+
+T = TypeVar("T")
+
+
+class Series:
+    """Ring buffer of (timestamp, value) for one metric, in memory-mapped column files.
+
+    ``<metric>.t.npy`` holds float64 epoch seconds, ``<metric>.v.npy`` float32
+    values and ``<metric>.head.npy`` the next write slot and the number of
+    readings ever written. Timestamps never decrease, so each contiguous
+    part of the ring is sorted and ranges are found by binary search.
+    """
+
+    def __init__(self, directory: str, metric: str, capacity: int = SENSOR_HISTORY_CAPACITY):
+        self.metric = metric
+        base = os.path.join(directory, metric)
+        paths = [f"{base}.t.npy", f"{base}.v.npy", f"{base}.head.npy"]
+        if all(os.path.exists(path) for path in paths):
+            self.t = np.load(paths[0], mmap_mode="r+")
+            self.v = np.load(paths[1], mmap_mode="r+")
+            self.head = np.load(paths[2], mmap_mode="r+")
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self.t = np.lib.format.open_memmap(paths[0], mode="w+", dtype=np.float64, shape=(capacity,))
+            self.v = np.lib.format.open_memmap(paths[1], mode="w+", dtype=np.float32, shape=(capacity,))
+            self.head = np.lib.format.open_memmap(paths[2], mode="w+", dtype=np.int64, shape=(2,))
+        self.capacity = len(self.t)
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def _check_open(self):
+        if self.closed:
+            raise SeriesClosed(self.metric)
+
+    @property
+    def count(self) -> int:
+        with self.lock:
+            self._check_open()
+            return int(min(self.head[1], self.capacity))
+
+    def _last(self) -> Optional[Tuple[float, float]]:
+        if not self.head[1]:
+            return None
+        slot = (int(self.head[0]) - 1) % self.capacity
+        return float(self.t[slot]), float(self.v[slot])
+
+    def append(self, value: float, t: float, min_interval: float = 0.0) -> bool:
+        with self.lock:
+            self._check_open()
+            last = self._last()
+            if last is not None:
+                # Clock steps backwards would break the sort order the queries rely on
+                t = max(t, last[0])
+                if np.float32(value) == last[1] and t - last[0] < min_interval:
+                    return False
+            slot = int(self.head[0])
+            self.t[slot] = t
+            self.v[slot] = value
+            # Head last: a reader never sees a slot before its data is written
+            self.head[0] = (slot + 1) % self.capacity
+            self.head[1] += 1
+            return True
+
+    def _segments(self) -> List[slice]:
+        """Parts of the ring in time order"""
+        if self.head[1] < self.capacity:
+            return [slice(0, int(self.head[1]))]
+        position = int(self.head[0])
+        return [slice(position, self.capacity), slice(0, position)]
+
+    def range(self, start: float, end: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Copies of the readings with start <= t < end"""
+        times, values = [], []
+        with self.lock:
+            self._check_open()
+            for segment in self._segments():
+                t = self.t[segment]
+                lo, hi = np.searchsorted(t, [start, end], side="left")
+                times.append(np.array(t[lo:hi]))
+                values.append(np.array(self.v[segment][lo:hi]))
+        return np.concatenate(times), np.concatenate(values)
+
+    def bounds(self) -> Tuple[Optional[float], Optional[float]]:
+        with self.lock:
+            self._check_open()
+            segments = [s for s in self._segments() if s.stop > s.start]
+            if not segments:
+                return None, None
+            return float(self.t[segments[0].start]), float(self.t[segments[-1].stop - 1])
+
+    def flush(self):
+        with self.lock:
+            if not self.closed:
+                for array in (self.t, self.v, self.head):
+                    array.flush()
+
+    def close(self):
+        """Flush and drop the memory maps; their file descriptors close with the last reference"""
+        with self.lock:
+            if self.closed:
+                return
+            for array in (self.t, self.v, self.head):
+                array.flush()
+            self.closed = True
+            self.t = self.v = self.head = None
+
+
+def downsample(t: np.ndarray, v: np.ndarray, start: float, resolution: float) -> Dict[str, list]:
+    """min/max/avg/count per ``resolution``-second bucket (aligned to ``start``); empty buckets are left out"""
+    if not len(t):
+        return {"t": [], "min": [], "max": [], "avg": [], "count": []}
+    bucket = ((t - start) // resolution).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    counts = np.diff(np.r_[starts, len(t)])
+    values = v.astype(np.float64)
+    return {
+        "t": (start + bucket[starts] * resolution).tolist(),
+        "min": np.round(np.minimum.reduceat(values, starts), 4).tolist(),
+        "max": np.round(np.maximum.reduceat(values, starts), 4).tolist(),
+        "avg": np.round(np.add.reduceat(values, starts) / counts, 4).tolist(),
+        "count": counts.tolist()
+    }
+
+
+class TimeSeriesStore:
+    """Append-only history per device and metric under ``root/<device>/``.
+
+    At most ``max_open`` series are held open, least recently used first
+    out; an evicted series is flushed and closed, and reopened from its
+    files on the next access.
+    """
+
+    def __init__(self, root: str, capacity: int = SENSOR_HISTORY_CAPACITY,
+                 min_interval: float = SENSOR_HISTORY_MIN_INTERVAL_S, max_open: int = SENSOR_HISTORY_MAX_OPEN):
+        self.root = root
+        self.capacity = capacity
+        self.min_interval = min_interval
+        self.max_open = max(1, max_open)
+        self._series: "OrderedDict[Tuple[str, str], Series]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.evicted = 0
+
+    def series(self, device: str, metric: str, create: bool = False) -> Optional[Series]:
+        key = (check_name(device, "device"), check_name(metric, "metric"))
+        directory = os.path.join(self.root, device)
+        with self._lock:
+            series = self._series.get(key)
+            if series is not None:
+                self._series.move_to_end(key)
+                return series
+            if not create and not os.path.exists(os.path.join(directory, f"{metric}.head.npy")):
+                return None
+            series = self._series[key] = Series(directory, metric, self.capacity)
+            self.opened += 1
+            while len(self._series) > self.max_open:
+                # Closed under the store lock, so its files are never open twice
+                self._series.popitem(last=False)[1].close()
+                self.evicted += 1
+        return series
+
+    def _with_series(self, device: str, metric: str, create: bool, use: Callable[[Series], T]) -> Optional[T]:
+        """``use(series)``, reopening the series if it is evicted in the meantime"""
+        while True:
+            series = self.series(device, metric, create)
+            if series is None:
+                return None
+            try:
+                return use(series)
+            except SeriesClosed:
+                continue
+
+    def record(self, device: str, values: Mapping[str, Any], t: Optional[float] = None) -> int:
+        """Append every numeric field of a reading; returns how many were stored"""
+        t = time.time() if t is None else t
+        stored = 0
+        for metric, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                continue
+            if not valid_name(metric):
+                continue
+            stored += self._with_series(
+                device, metric, True, lambda series: series.append(float(value), t, self.min_interval)
+            )
+        return stored
+
+    def devices(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def metrics(self, device: str) -> List[dict]:
+        directory = os.path.join(self.root, check_name(device, "device"))
+        if not os.path.isdir(directory):
+            return []
+        result = []
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".head.npy"):
+                metric = filename[:-len(".head.npy")]
+                summary = self._with_series(device, metric, False, lambda series: (series.count, series.bounds()))
+                if summary is not None:
+                    count, (first, last) = summary
+                    result.append({"metric": metric, "readings": count, "first": first, "last": last})
+        return result
+
+    def query(self, device: str, metric: str, start: float, end: float, resolution: float) -> Optional[dict]:
+        """Downsampled series for [start, end), or None if the metric was never recorded.
+
+        ``start`` is rounded down to a multiple of ``resolution`` so bucket
+        boundaries don't shift between queries.
+        """
+        if resolution <= 0:
+            raise ValueError("resolution must be positive")
+        start = math.floor(start / resolution) * resolution
+        if end <= start:
+            raise ValueError("end must be after start")
+        if (end - start) / resolution > SENSOR_HISTORY_MAX_POINTS:
+            raise ValueError(f"More than {SENSOR_HISTORY_MAX_POINTS} buckets requested; use a coarser resolution")
+        readings = self._with_series(device, metric, False, lambda series: series.range(start, end))
+        if readings is None:
+            return None
+        t, v = readings
+        return {
+            "device": device,
+            "metric": metric,
+            "start": start,
+            "end": end,
+            "resolution_s": resolution,
+            "readings": len(t),
+            **downsample(t, v, start, resolution)
+        }
+
+    def flush(self):
+        with self._lock:
+            open_series = list(self._series.values())
+        for series in open_series:
+            series.flush()
+
+    def close(self):
+        """Flush and close every open series; later accesses reopen them"""
+        with self._lock:
+            open_series = list(self._series.values())
+            self._series.clear()
+        for series in open_series:
+            series.close()
+
+    def stats(self) -> dict:
+        return {"open_series": len(self._series), "max_open": self.max_open,
+                "opened": self.opened, "evicted": self.evicted}
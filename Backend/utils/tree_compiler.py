@@ -0,0 +1,339 @@
+import logging
+import os
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+from sklearn.ensemble import (
+    ExtraTreesClassifier, ExtraTreesRegressor, RandomForestClassifier, RandomForestRegressor
+)
+from sklearn.multioutput import MultiOutputClassifier
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeClassifier, DecisionTreeRegressor
+
+logger = logging.getLogger(__name__)
+
+BACKEND_COMPILED = "compiled"
+BACKEND_SKLEARN = "sklearn"
+BACKENDS = (BACKEND_COMPILED, BACKEND_SKLEARN)
+
+# compiled: evaluate supported estimators with the flat-array engine; sklearn: use them as loaded
+TABULAR_MODEL_BACKEND = os.getenv("TABULAR_MODEL_BACKEND", BACKEND_COMPILED).lower()
+# Random samples used for the load-time parity check against sklearn
+TABULAR_PARITY_SAMPLES = int(os.getenv("TABULAR_PARITY_SAMPLES", "512"))
+# Larger inputs go to sklearn, whose compiled per-row loop wins once call overhead is amortized
+TABULAR_COMPILED_MAX_ROWS = int(os.getenv("TABULAR_COMPILED_MAX_ROWS", "256"))
+
+# Parity samples also scored one row at a time
+PARITY_SINGLE_ROWS = 64
+
+FOREST_CLASSIFIERS = (RandomForestClassifier, ExtraTreesClassifier)
+FOREST_REGRESSORS = (RandomForestRegressor, ExtraTreesRegressor)
+
+
+class UnsupportedEstimator(Exception):
+    pass
+
+
+def _as_float64(X: Any, n_features: int) -> np.ndarray:
+    X = np.asarray(X, dtype=np.float64)
+    if X.ndim != 2 or X.shape[1] != n_features:
+        raise ValueError(f"Expected input of shape (n_samples, {n_features}), got {X.shape}")
+    if not np.isfinite(X).all():
+        raise ValueError("Input contains NaN or infinity")
+    return X
+
+
+class TreeTable:
+    """Nodes of many fitted trees flattened into shared arrays.
+
+    Child indices are global and leaves point to themselves, so every tree
+    can be advanced one level at a time for all samples with a few array
+    gathers, dropping (tree, sample) pairs as they reach a leaf.
+    """
+
+    def __init__(self, trees: Sequence[Any], n_features: int):
+        self.n_features = n_features
+        sizes = [tree.node_count for tree in trees]
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+        self.node_offsets = offsets
+        self.roots = offsets.copy()
+        self.depth = max(tree.max_depth for tree in trees)
+
+        features, thresholds, lefts, rights = [], [], [], []
+        for tree, offset in zip(trees, offsets):
+            leaf = tree.children_left < 0
+            own = np.arange(tree.node_count, dtype=np.intp) + offset
+            features.append(np.where(leaf, 0, tree.feature).astype(np.intp))
+            thresholds.append(np.where(leaf, np.inf, tree.threshold))
+            lefts.append(np.where(leaf, own, tree.children_left + offset).astype(np.intp))
+            rights.append(np.where(leaf, own, tree.children_right + offset).astype(np.intp))
+        self.feature = np.concatenate(features)
+        self.threshold = np.concatenate(thresholds)
+        # children[2 * node] is the left child, children[2 * node + 1] the right one
+        self.children = np.stack([np.concatenate(lefts), np.concatenate(rights)], axis=1).ravel()
+        self.is_internal = self.children[0::2] != np.arange(len(self.feature))
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """Global leaf index for every tree, shaped (n_trees, n_samples)"""
+        n_samples = X.shape[0]
+        # sklearn evaluates trees on float32 inputs against float64 thresholds
+        values = np.ascontiguousarray(X, dtype=np.float32).ravel()
+        leaves = np.repeat(self.roots, n_samples)
+
+        # Walk only the (tree, sample) pairs that have not reached a leaf yet
+        position = np.arange(leaves.size, dtype=np.intp)
+        nodes = leaves.copy()
+        row_base = np.tile(np.arange(n_samples, dtype=np.intp) * self.n_features, len(self.roots))
+        for _ in range(self.depth):
+            go_right = values.take(row_base + self.feature.take(nodes)) > self.threshold.take(nodes)
+            nodes = self.children.take(2 * nodes + go_right)
+            internal = self.is_internal.take(nodes)
+            if not internal.all():
+                leaves[position[~internal]] = nodes[~internal]
+                position, nodes, row_base = position[internal], nodes[internal], row_base[internal]
+                if not position.size:
+                    break
+        return leaves.reshape(len(self.roots), n_samples)
+
+
+def _sum_in_tree_order(values: np.ndarray) -> np.ndarray:
+    """Sum over the leading (tree) axis one tree at a time, as sklearn's forests accumulate.
+
+    ``ndarray.sum`` switches to pairwise summation whenever the summed axis
+    is contiguous (e.g. a single sample), which can change the last bits;
+    ``cumsum`` always accumulates sequentially.
+    """
+    return np.cumsum(values, axis=0)[-1]
+
+
+def _normalized_leaf_values(tree: Any) -> np.ndarray:
+    """Per-node class probabilities, normalized the way DecisionTreeClassifier.predict_proba does"""
+    proba = tree.value[:, 0, :].copy()
+    normalizer = proba.sum(axis=1)[:, np.newaxis]
+    normalizer[normalizer == 0.0] = 1.0
+    proba /= normalizer
+    return proba
+
+
+def _forest_trees(estimator: Any) -> List[Any]:
+    if isinstance(estimator, (DecisionTreeClassifier, DecisionTreeRegressor)):
+        return [estimator.tree_]
+    return [tree.tree_ for tree in estimator.estimators_]
+
+
+def _check_single_output(estimator: Any):
+    if getattr(estimator, "n_outputs_", 1) != 1:
+        raise UnsupportedEstimator(f"{type(estimator).__name__} with {estimator.n_outputs_} outputs")
+
+
+class CompiledForestClassifier:
+    """predict / predict_proba for one or more tree-ensemble classifiers sharing one traversal.
+
+    With several outputs (a MultiOutputClassifier) all their trees are
+    walked together and ``predict_proba`` returns one array per output,
+    matching sklearn's return types.
+    """
+
+    backend = BACKEND_COMPILED
+
+    def __init__(self, source: Any, estimators: Sequence[Any], n_features: int, multi_output: bool):
+        self.source = source
+        self.multi_output = multi_output
+        trees, self._groups = [], []
+        for estimator in estimators:
+            if not isinstance(estimator, FOREST_CLASSIFIERS + (DecisionTreeClassifier,)):
+                raise UnsupportedEstimator(type(estimator).__name__)
+            _check_single_output(estimator)
+            group_trees = _forest_trees(estimator)
+            start = len(trees)
+            trees.extend(group_trees)
+            self._groups.append((
+                slice(start, len(trees)),
+                np.concatenate([_normalized_leaf_values(tree) for tree in group_trees]),
+                estimator.classes_
+            ))
+        self.table = TreeTable(trees, n_features)
+        self.n_features_in_ = n_features
+        self.classes_ = [classes for _, _, classes in self._groups] if multi_output else self._groups[0][2]
+
+    def _probabilities(self, X: Any) -> List[np.ndarray]:
+        nodes = self.table.apply(X)
+        outputs = []
+        for trees, values, _ in self._groups:
+            leaves = nodes[trees] - self.table.node_offsets[trees.start]
+            proba = _sum_in_tree_order(values.take(leaves, axis=0))
+            proba /= trees.stop - trees.start
+            outputs.append(proba)
+        return outputs
+
+    def predict_proba(self, X: Any):
+        X = _as_float64(X, self.n_features_in_)
+        if len(X) > TABULAR_COMPILED_MAX_ROWS:
+            return self.source.predict_proba(X)
+        outputs = self._probabilities(X)
+        return outputs if self.multi_output else outputs[0]
+
+    def predict(self, X: Any) -> np.ndarray:
+        X = _as_float64(X, self.n_features_in_)
+        if len(X) > TABULAR_COMPILED_MAX_ROWS:
+            return self.source.predict(X)
+        labels = [
+            classes.take(np.argmax(proba, axis=1), axis=0)
+            for proba, (_, _, classes) in zip(self._probabilities(X), self._groups)
+        ]
+        return np.asarray(labels).T if self.multi_output else labels[0]
+
+
+class CompiledForestRegressor:
+    backend = BACKEND_COMPILED
+
+    def __init__(self, estimator: Any, n_features: int):
+        _check_single_output(estimator)
+        self.source = estimator
+        trees = _forest_trees(estimator)
+        self.table = TreeTable(trees, n_features)
+        self.values = np.concatenate([tree.value[:, 0, 0] for tree in trees])
+        self.n_features_in_ = n_features
+
+    def predict(self, X: Any) -> np.ndarray:
+        X = _as_float64(X, self.n_features_in_)
+        if len(X) > TABULAR_COMPILED_MAX_ROWS:
+            return self.source.predict(X)
+        nodes = self.table.apply(X)
+        prediction = _sum_in_tree_order(self.values.take(nodes))
+        prediction /= nodes.shape[0]
+        return prediction
+
+
+class CompiledStandardScaler:
+    backend = BACKEND_COMPILED
+
+    def __init__(self, scaler: StandardScaler):
+        self.n_features_in_ = scaler.n_features_in_
+        self.mean_ = scaler.mean_ if scaler.with_mean else None
+        self.scale_ = scaler.scale_ if scaler.with_std else None
+
+    def transform(self, X: Any) -> np.ndarray:
+        X = np.array(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected input of shape (n_samples, {self.n_features_in_}), got {X.shape}")
+        if self.mean_ is not None:
+            X -= self.mean_
+        if self.scale_ is not None:
+            X /= self.scale_
+        return X
+
+
+def build_compiled(estimator: Any):
+    """Compile a fitted estimator, raising UnsupportedEstimator for anything else"""
+    n_features = getattr(estimator, "n_features_in_", None)
+    if isinstance(estimator, StandardScaler):
+        return CompiledStandardScaler(estimator)
+    if n_features is None:
+        raise UnsupportedEstimator(type(estimator).__name__)
+    if isinstance(estimator, FOREST_CLASSIFIERS + (DecisionTreeClassifier,)):
+        return CompiledForestClassifier(estimator, [estimator], n_features, multi_output=False)
+    if isinstance(estimator, FOREST_REGRESSORS + (DecisionTreeRegressor,)):
+        return CompiledForestRegressor(estimator, n_features)
+    if isinstance(estimator, MultiOutputClassifier):
+        return CompiledForestClassifier(estimator, estimator.estimators_, n_features, multi_output=True)
+    raise UnsupportedEstimator(type(estimator).__name__)
+
+
+def parity_samples(estimator: Any, n_samples: int, seed: int = 0) -> np.ndarray:
+    """Inputs that exercise the split thresholds: half exactly on a threshold, half spread around them"""
+    n_features = estimator.n_features_in_
+    rng = np.random.default_rng(seed)
+    if isinstance(estimator, StandardScaler):
+        mean = estimator.mean_ if estimator.with_mean else np.zeros(n_features)
+        scale = estimator.scale_ if estimator.with_std else np.ones(n_features)
+        return rng.normal(mean, 2 * scale, size=(n_samples, n_features))
+
+    forests = estimator.estimators_ if isinstance(estimator, MultiOutputClassifier) else [estimator]
+    thresholds = [[] for _ in range(n_features)]
+    for forest in forests:
+        for tree in _forest_trees(forest):
+            split = tree.children_left >= 0
+            for feature, threshold in zip(tree.feature[split], tree.threshold[split]):
+                thresholds[feature].append(threshold)
+
+    X = np.zeros((n_samples, n_features))
+    for feature, values in enumerate(thresholds):
+        if not values:
+            X[:, feature] = rng.normal(size=n_samples)
+            continue
+        values = np.asarray(values)
+        low, high = values.min(), values.max()
+        margin = max(high - low, 1.0) * 0.1
+        spread = rng.uniform(low - margin, high + margin, size=n_samples)
+        exact = rng.choice(values, size=n_samples)
+        X[:, feature] = np.where(rng.random(n_samples) < 0.5, exact, spread)
+    return X
+
+
+def check_parity(estimator: Any, compiled: Any, X: np.ndarray) -> Optional[str]:
+    """Return a description of the first mismatch with sklearn, or None if outputs agree"""
+    if isinstance(estimator, StandardScaler):
+        if not np.allclose(compiled.transform(X), estimator.transform(X), rtol=1e-12, atol=1e-12):
+            return "transform differs"
+        return None
+
+    def in_blocks(method: str):
+        # Stay within TABULAR_COMPILED_MAX_ROWS so the compiled path itself is what gets checked, and
+        # score the first rows one at a time too: single-row requests are the common case
+        step = max(1, TABULAR_COMPILED_MAX_ROWS)
+        single = min(PARITY_SINGLE_ROWS, len(X))
+        starts = list(range(single)) + list(range(single, len(X), step))
+        ends = starts[1:] + [len(X)]
+        blocks = [getattr(compiled, method)(X[start:end]) for start, end in zip(starts, ends)]
+        if method == "predict_proba" and compiled.multi_output:
+            return [np.concatenate(outputs) for outputs in zip(*blocks)]
+        return np.concatenate(blocks)
+
+    expected, actual = estimator.predict(X), in_blocks("predict")
+    if isinstance(compiled, CompiledForestRegressor):
+        if not np.allclose(actual, expected, rtol=1e-9, atol=1e-9):
+            return f"predict differs by up to {np.abs(actual - expected).max():.3g}"
+        return None
+
+    if not np.array_equal(np.asarray(actual), np.asarray(expected)):
+        return f"predict differs on {int((np.asarray(actual) != np.asarray(expected)).any(axis=-1).sum())} samples"
+    expected_proba, actual_proba = estimator.predict_proba(X), in_blocks("predict_proba")
+    if not compiled.multi_output:
+        expected_proba, actual_proba = [expected_proba], [actual_proba]
+    for output, (want, got) in enumerate(zip(expected_proba, actual_proba)):
+        if not np.allclose(got, want, rtol=1e-9, atol=1e-12):
+            return f"predict_proba differs for output {output} by up to {np.abs(got - want).max():.3g}"
+    return None
+
+
+def compile_model(estimator: Any, label: str, backend: str = TABULAR_MODEL_BACKEND,
+                  extra_samples: Optional[np.ndarray] = None) -> Any:
+    """Return a compiled drop-in replacement for ``estimator``, or the estimator itself.
+
+    Falls back to the sklearn estimator when compilation is disabled, the
+    estimator type is unsupported, or the compiled model disagrees with
+    sklearn on the parity samples.
+    """
+    if backend != BACKEND_COMPILED:
+        return estimator
+    try:
+        compiled = build_compiled(estimator)
+    except UnsupportedEstimator as e:
+        logger.info(f"{label}: {str(e)} is not supported by the tree compiler, using sklearn")
+        return estimator
+
+    X = parity_samples(estimator, TABULAR_PARITY_SAMPLES)
+    if extra_samples is not None:
+        X = np.vstack([X, np.asarray(extra_samples, dtype=np.float64)])
+    mismatch = check_parity(estimator, compiled, X)
+    if mismatch is not None:
+        logger.warning(f"{label}: compiled model failed parity check ({mismatch}), using sklearn")
+        return estimator
+
+    logger.info(f"{label}: using compiled model (parity checked on {len(X)} samples)")
+    return compiled
+
+
+def model_backend(model: Any) -> str:
+    return getattr(model, "backend", BACKEND_SKLEARN)
@@ -1,8 +1,16 @@
 import requests
+import httpx
+import asyncio
 import os
+import threading
+import time
 from dotenv import load_dotenv
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable
+
+from utils.cache import TTLCache, SingleFlight, AsyncSingleFlight
+from utils.circuit_breaker import CircuitBreaker
+from utils.metrics import registry
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,6 +29,40 @@ if not API_KEY or API_KEY == "your_openweathermap_api_key_here":
 DEFAULT_LAT = float(os.getenv("DEFAULT_LAT", "18.5204"))
 DEFAULT_LON = float(os.getenv("DEFAULT_LON", "73.8567"))  # Pune, Maharashtra coordinates
 
+# Weather changes on a ~10 minute scale, so upstream results are reused for
+# WEATHER_CACHE_TTL_S and served stale (while refreshing in the background)
+# for up to WEATHER_CACHE_MAX_STALE_S
+WEATHER_CACHE_TTL_S = float(os.getenv("WEATHER_CACHE_TTL_S", "600"))
+WEATHER_CACHE_MAX_STALE_S = float(os.getenv("WEATHER_CACHE_MAX_STALE_S", "3600"))
+
+# Shared by every WeatherAPI instance, keyed by (kind, lat, lon)
+weather_cache = TTLCache(
+    ttl_seconds=WEATHER_CACHE_MAX_STALE_S,
+    max_entries=int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", "1024")),
+    name="weather_cache"
+)
+weather_singleflight = SingleFlight(name="weather")
+
+upstream_calls = registry.counter("weather_upstream_calls_total", "Requests sent to OpenWeatherMap")
+upstream_errors = registry.counter("weather_upstream_errors_total", "Failed OpenWeatherMap requests")
+stale_served = registry.counter("weather_cache_stale_served_total", "Stale cache entries served while refreshing")
+refreshes = registry.counter("weather_cache_refreshes_total", "Background stale-while-revalidate refreshes")
+# Upstream latency per kind ("weather" or "air_quality"), cache misses and refreshes only
+upstream_latency = {
+    kind: registry.timer("weather_upstream_seconds", "OpenWeatherMap request latency", {"kind": kind})
+    for kind in ("weather", "air_quality")
+}
+
+# Skip the upstream entirely (and use fallbacks) after repeated failures
+weather_breaker = CircuitBreaker(
+    "weather",
+    failure_threshold=int(os.getenv("WEATHER_BREAKER_FAILURES", "3")),
+    reset_timeout=float(os.getenv("WEATHER_BREAKER_RESET_S", "30"))
+)
+
+# Per-call deadline for upstream requests, connect + read
+WEATHER_TIMEOUT_S = float(os.getenv("WEATHER_TIMEOUT_S", "5"))
+
 class WeatherAPI:
     """Utility class for interacting with OpenWeatherMap API"""
     
@@ -33,64 +75,115 @@ class WeatherAPI:
         if not self.api_key:
             logger.warning("OpenWeatherMap API key not found. Weather data will use fallback values.")
     
+    def _cache_key(self, kind: str):
+        return kind, round(self.lat, 4), round(self.lon, 4)
+    
+    def _cached(self, kind: str, fetch: Callable[[], Dict[str, Any]],
+                fallback: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """Serve from cache, refreshing stale entries in the background and
+        collapsing concurrent misses into a single upstream request"""
+        key = self._cache_key(kind)
+        entry = weather_cache.get(key)
+        if entry is not None:
+            data, fetched_at = entry
+            if time.monotonic() - fetched_at < WEATHER_CACHE_TTL_S:
+                return dict(data)
+            stale_served.inc()
+            if not weather_singleflight.in_flight(key) and weather_breaker.allow():
+                self._refresh_in_background(key, fetch)
+            return dict(data)
+        
+        if not weather_breaker.allow():
+            return fallback()
+        try:
+            return dict(weather_singleflight.do(key, lambda: self._fetch_and_store(key, fetch)))
+        except Exception as e:
+            logger.error(f"Error fetching {kind} data: {str(e)}")
+            return fallback()
+    
+    def _fetch_and_store(self, key, fetch: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        upstream_calls.inc()
+        try:
+            with upstream_latency[key[0]].timer():
+                data = fetch()
+        except Exception:
+            upstream_errors.inc()
+            weather_breaker.record_failure()
+            raise
+        weather_breaker.record_success()
+        weather_cache.set(key, (data, time.monotonic()))
+        return data
+    
+    def _refresh_in_background(self, key, fetch: Callable[[], Dict[str, Any]]):
+        refreshes.inc()
+        
+        def refresh():
+            try:
+                weather_singleflight.do(key, lambda: self._fetch_and_store(key, fetch))
+            except Exception as e:
+                # Keep serving the stale value until it ages out
+                logger.error(f"Error refreshing {key[0]} data: {str(e)}")
+        
+        threading.Thread(target=refresh, name="weather-refresh", daemon=True).start()
+    
     def get_current_weather(self) -> Dict[str, Any]:
         """Get current weather data for the specified location"""
         if not self.api_key:
             return self._get_fallback_weather()
-            
-        try:
-            url = f"https://api.openweathermap.org/data/2.5/weather?lat={self.lat}&lon={self.lon}&appid={self.api_key}&units=metric"
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Extract relevant weather information
-            weather_data = {
-                "temperature": data["main"]["temp"],
-                "humidity": data["main"]["humidity"],
-                "pressure": data["main"]["pressure"],
-                "wind_speed": data["wind"]["speed"],
-                "weather_condition": data["weather"][0]["main"],
-                "weather_description": data["weather"][0]["description"],
-                "rainfall_mm": self._get_rainfall(data),
-                "timestamp": data["dt"]
-            }
-            
-            logger.info(f"Weather data retrieved successfully for {self.lat}, {self.lon}")
-            return weather_data
-            
-        except Exception as e:
-            logger.error(f"Error fetching weather data: {str(e)}")
-            return self._get_fallback_weather()
+        return self._cached("weather", self._fetch_current_weather, self._get_fallback_weather)
+    
+    def _fetch_current_weather(self) -> Dict[str, Any]:
+        response = requests.get(self._weather_url(), timeout=10)
+        response.raise_for_status()
+        return self._parse_weather(response.json())
+    
+    def _weather_url(self) -> str:
+        return f"https://api.openweathermap.org/data/2.5/weather?lat={self.lat}&lon={self.lon}&appid={self.api_key}&units=metric"
+    
+    def _parse_weather(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        # Extract relevant weather information
+        weather_data = {
+            "temperature": data["main"]["temp"],
+            "humidity": data["main"]["humidity"],
+            "pressure": data["main"]["pressure"],
+            "wind_speed": data["wind"]["speed"],
+            "weather_condition": data["weather"][0]["main"],
+            "weather_description": data["weather"][0]["description"],
+            "rainfall_mm": self._get_rainfall(data),
+            "timestamp": data["dt"]
+        }
+        
+        logger.info(f"Weather data retrieved successfully for {self.lat}, {self.lon}")
+        return weather_data
     
     def get_air_quality(self) -> Dict[str, Any]:
         """Get current air quality data for the specified location"""
         if not self.api_key:
             return self._get_fallback_air_quality()
-            
-        try:
-            url = f"https://api.openweathermap.org/data/2.5/air_pollution?lat={self.lat}&lon={self.lon}&appid={self.api_key}"
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Extract air quality information
-            air_data = {
-                "aqi": data["list"][0]["main"]["aqi"],  # AQI index (1-5)
-                "co": data["list"][0]["components"]["co"],
-                "no2": data["list"][0]["components"]["no2"],
-                "o3": data["list"][0]["components"]["o3"],
-                "pm2_5": data["list"][0]["components"]["pm2_5"],
-                "pm10": data["list"][0]["components"]["pm10"],
-                "timestamp": data["list"][0]["dt"]
-            }
-            
-            logger.info(f"Air quality data retrieved successfully for {self.lat}, {self.lon}")
-            return air_data
-            
-        except Exception as e:
-            logger.error(f"Error fetching air quality data: {str(e)}")
-            return self._get_fallback_air_quality()
+        return self._cached("air_quality", self._fetch_air_quality, self._get_fallback_air_quality)
+    
+    def _fetch_air_quality(self) -> Dict[str, Any]:
+        response = requests.get(self._air_quality_url(), timeout=10)
+        response.raise_for_status()
+        return self._parse_air_quality(response.json())
+    
+    def _air_quality_url(self) -> str:
+        return f"https://api.openweathermap.org/data/2.5/air_pollution?lat={self.lat}&lon={self.lon}&appid={self.api_key}"
+    
+    def _parse_air_quality(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        # Extract air quality information
+        air_data = {
+            "aqi": data["list"][0]["main"]["aqi"],  # AQI index (1-5)
+            "co": data["list"][0]["components"]["co"],
+            "no2": data["list"][0]["components"]["no2"],
+            "o3": data["list"][0]["components"]["o3"],
+            "pm2_5": data["list"][0]["components"]["pm2_5"],
+            "pm10": data["list"][0]["components"]["pm10"],
+            "timestamp": data["list"][0]["dt"]
+        }
+        
+        logger.info(f"Air quality data retrieved successfully for {self.lat}, {self.lon}")
+        return air_data
     
     def get_weather_and_air_data(self) -> Dict[str, Any]:
         """Get combined weather and air quality data"""
@@ -140,8 +233,131 @@ class WeatherAPI:
             "timestamp": 0
         }
 
+class AsyncWeatherAPI(WeatherAPI):
+    """asyncio-native WeatherAPI on a shared keep-alive connection pool.
+    
+    Shares the response cache and circuit breaker with the sync client, so
+    both see the same upstream state. Weather and air quality are fetched
+    concurrently and every upstream call has a hard deadline.
+    """
+    
+    _client: Optional[httpx.AsyncClient] = None
+    _client_loop: Optional[asyncio.AbstractEventLoop] = None
+    _singleflight = AsyncSingleFlight(name="weather_async")
+    
+    @classmethod
+    def _get_client(cls) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if cls._client is None or cls._client.is_closed or cls._client_loop is not loop:
+            cls._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(WEATHER_TIMEOUT_S),
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+            )
+            cls._client_loop = loop
+        return cls._client
+    
+    @classmethod
+    async def close(cls):
+        if cls._client is not None and not cls._client.is_closed:
+            await cls._client.aclose()
+        cls._client = None
+    
+    async def _cached(self, kind: str, fetch, fallback: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        key = self._cache_key(kind)
+        entry = weather_cache.get(key)
+        if entry is not None:
+            data, fetched_at = entry
+            if time.monotonic() - fetched_at < WEATHER_CACHE_TTL_S:
+                return dict(data)
+            stale_served.inc()
+            if not self._singleflight.in_flight(key) and weather_breaker.allow():
+                refreshes.inc()
+                asyncio.ensure_future(self._refresh(key, fetch))
+            return dict(data)
+        
+        if not weather_breaker.allow():
+            return fallback()
+        try:
+            return dict(await self._singleflight.do(key, lambda: self._fetch_and_store(key, fetch)))
+        except Exception as e:
+            logger.error(f"Error fetching {kind} data: {str(e) or type(e).__name__}")
+            return fallback()
+    
+    async def _fetch_and_store(self, key, fetch) -> Dict[str, Any]:
+        upstream_calls.inc()
+        try:
+            with upstream_latency[key[0]].timer():
+                data = await asyncio.wait_for(fetch(), timeout=WEATHER_TIMEOUT_S)
+        except Exception:
+            upstream_errors.inc()
+            weather_breaker.record_failure()
+            raise
+        weather_breaker.record_success()
+        weather_cache.set(key, (data, time.monotonic()))
+        return data
+    
+    async def _refresh(self, key, fetch):
+        try:
+            await self._singleflight.do(key, lambda: self._fetch_and_store(key, fetch))
+        except Exception as e:
+            # Keep serving the stale value until it ages out
+            logger.error(f"Error refreshing {key[0]} data: {str(e) or type(e).__name__}")
+    
+    async def _get_json(self, url: str) -> Dict[str, Any]:
+        response = await self._get_client().get(url)
+        response.raise_for_status()
+        return response.json()
+    
+    async def _fetch_current_weather_async(self) -> Dict[str, Any]:
+        return self._parse_weather(await self._get_json(self._weather_url()))
+    
+    async def _fetch_air_quality_async(self) -> Dict[str, Any]:
+        return self._parse_air_quality(await self._get_json(self._air_quality_url()))
+    
+    async def get_current_weather(self) -> Dict[str, Any]:
+        """Get current weather data for the specified location"""
+        if not self.api_key:
+            return self._get_fallback_weather()
+        return await self._cached("weather", self._fetch_current_weather_async, self._get_fallback_weather)
+    
+    async def get_air_quality(self) -> Dict[str, Any]:
+        """Get current air quality data for the specified location"""
+        if not self.api_key:
+            return self._get_fallback_air_quality()
+        return await self._cached("air_quality", self._fetch_air_quality_async, self._get_fallback_air_quality)
+    
+    async def refresh_weather_and_air_data(self):
+        """Fetch both endpoints from upstream, bypassing fresh cache entries.
+        
+        Returns (weather, air_quality); either is None if its fetch failed
+        or the circuit breaker is open.
+        """
+        if not self.api_key:
+            return None, None
+        
+        async def refresh(kind, fetch):
+            key = self._cache_key(kind)
+            if not self._singleflight.in_flight(key) and not weather_breaker.allow():
+                return None
+            try:
+                return dict(await self._singleflight.do(key, lambda: self._fetch_and_store(key, fetch)))
+            except Exception as e:
+                logger.error(f"Error refreshing {kind} data: {str(e) or type(e).__name__}")
+                return None
+        
+        return await asyncio.gather(
+            refresh("weather", self._fetch_current_weather_async),
+            refresh("air_quality", self._fetch_air_quality_async)
+        )
+    
+    async def get_weather_and_air_data(self) -> Dict[str, Any]:
+        """Get combined weather and air quality data, fetched concurrently"""
+        weather_data, air_data = await asyncio.gather(self.get_current_weather(), self.get_air_quality())
+        return {**weather_data, **air_data}
+
 # Create a singleton instance for easy import
 weather_api = WeatherAPI()
+async_weather_api = AsyncWeatherAPI()
 
 def get_weather_data() -> Dict[str, Any]:
     """Convenience function to get weather data"""
@@ -154,3 +370,28 @@ def get_air_quality_data() -> Dict[str, Any]:
 def get_combined_data() -> Dict[str, Any]:
     """Convenience function to get combined weather and air quality data"""
     return weather_api.get_weather_and_air_data()
+
+async def get_weather_data_async() -> Dict[str, Any]:
+    """Async convenience function to get weather data"""
+    return await async_weather_api.get_current_weather()
+
+async def get_air_quality_data_async() -> Dict[str, Any]:
+    """Async convenience function to get air quality data"""
+    return await async_weather_api.get_air_quality()
+
+async def get_combined_data_async() -> Dict[str, Any]:
+    """Async convenience function to get combined weather and air quality data"""
+    return await async_weather_api.get_weather_and_air_data()
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Cache hit/miss/refresh counters, upstream call volume and breaker state"""
+    return {
+        **weather_cache.stats(),
+        "fresh_ttl_seconds": WEATHER_CACHE_TTL_S,
+        "stale_served": stale_served.value,
+        "background_refreshes": refreshes.value,
+        "singleflight_shared": weather_singleflight.shared.value + AsyncWeatherAPI._singleflight.shared.value,
+        "upstream_calls": upstream_calls.value,
+        "upstream_errors": upstream_errors.value,
+        "circuit_breaker": weather_breaker.stats()
+    }
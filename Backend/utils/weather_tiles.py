@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from utils.metrics import registry
+from utils.weather_api import AsyncWeatherAPI, DEFAULT_LAT, DEFAULT_LON
+
+logger = logging.getLogger(__name__)
+
+# Farms are snapped to square grid tiles of this size (degrees, ~11 km at 0.1)
+WEATHER_TILE_DEG = float(os.getenv("WEATHER_TILE_DEG", "0.1"))
+# How often every active tile is refreshed from upstream
+WEATHER_REFRESH_INTERVAL_S = float(os.getenv("WEATHER_REFRESH_INTERVAL_S", "600"))
+# Upstream budget for background refreshes
+WEATHER_REFRESH_CONCURRENCY = int(os.getenv("WEATHER_REFRESH_CONCURRENCY", "4"))
+WEATHER_REFRESH_TILES_PER_S = float(os.getenv("WEATHER_REFRESH_TILES_PER_S", "0.5"))
+# Tiles nobody has read for this long stop being refreshed
+WEATHER_TILE_IDLE_S = float(os.getenv("WEATHER_TILE_IDLE_S", str(24 * 3600)))
+# Most tiles kept at once; the least recently read one is dropped to make room
+WEATHER_MAX_TILES = int(os.getenv("WEATHER_MAX_TILES", "1000"))
+
+TileKey = Tuple[int, int]
+
+
+class RateLimiter:
+    """Token bucket limiting how often an async operation may start"""
+
+    def __init__(self, rate_per_s: float, burst: int = 1):
+        self.rate = rate_per_s
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class WeatherTile:
+    __slots__ = ("key", "lat", "lon", "weather", "air_quality", "updated_at", "last_access")
+
+    def __init__(self, key: TileKey, lat: float, lon: float):
+        self.key = key
+        self.lat = lat
+        self.lon = lon
+        self.weather: Optional[Dict[str, Any]] = None
+        self.air_quality: Optional[Dict[str, Any]] = None
+        self.updated_at = 0.0
+        self.last_access = time.monotonic()
+
+    def combined(self) -> Dict[str, Any]:
+        return {**self.weather, **self.air_quality}
+
+
+class WeatherTileService:
+    """In-memory table of weather per grid tile, kept fresh in the background.
+
+    Readers snap their coordinates to a tile and read its last known data
+    without an upstream call. Only the first read of a new tile waits for
+    upstream; afterwards a background refresher updates every active tile
+    concurrently, under a concurrency cap. First fetches and refreshes share
+    one rate limit, and the table holds at most ``max_tiles`` tiles, so
+    sweeping coordinates can neither outrun the upstream budget nor grow
+    memory without bound.
+    """
+
+    def __init__(self, tile_deg: float = WEATHER_TILE_DEG, refresh_interval: float = WEATHER_REFRESH_INTERVAL_S,
+                 concurrency: int = WEATHER_REFRESH_CONCURRENCY, tiles_per_s: float = WEATHER_REFRESH_TILES_PER_S,
+                 idle_timeout: float = WEATHER_TILE_IDLE_S, max_tiles: int = WEATHER_MAX_TILES):
+        self.tile_deg = tile_deg
+        self.refresh_interval = refresh_interval
+        self.idle_timeout = idle_timeout
+        self.max_tiles = max(1, max_tiles)
+        self.concurrency = max(1, concurrency)
+        self.rate_limiter = RateLimiter(tiles_per_s, burst=self.concurrency)
+
+        # Least recently read first
+        self._tiles: "OrderedDict[TileKey, WeatherTile]" = OrderedDict()
+        self._refreshing: Dict[TileKey, asyncio.Task] = {}
+        self._refresher: Optional[asyncio.Task] = None
+
+        self.tile_refreshes = registry.counter("weather_tile_refreshes_total", "Tile refreshes from upstream")
+        self.tile_reads = registry.counter("weather_tile_reads_total", "Weather reads served from the tile table")
+        self.tile_evictions = registry.counter("weather_tile_evictions_total", "Tiles dropped to stay under the tile cap")
+
+    def tile_key(self, lat: float, lon: float) -> TileKey:
+        return math.floor(lat / self.tile_deg), math.floor(lon / self.tile_deg)
+
+    def tile_center(self, key: TileKey) -> Tuple[float, float]:
+        return (
+            round((key[0] + 0.5) * self.tile_deg, 4),
+            round((key[1] + 0.5) * self.tile_deg, 4)
+        )
+
+    def _touch(self, tile: WeatherTile):
+        tile.last_access = time.monotonic()
+        self._tiles.move_to_end(tile.key)
+
+    def _get_or_create(self, lat: float, lon: float) -> WeatherTile:
+        key = self.tile_key(lat, lon)
+        tile = self._tiles.get(key)
+        if tile is None:
+            while len(self._tiles) >= self.max_tiles:
+                evicted, _ = self._tiles.popitem(last=False)
+                # An in-flight fetch finishes on the dropped tile; a new tile for the key starts its own
+                self._refreshing.pop(evicted, None)
+                self.tile_evictions.inc()
+            tile = WeatherTile(key, *self.tile_center(key))
+            self._tiles[key] = tile
+        self._touch(tile)
+        return tile
+
+    def _is_stale(self, tile: WeatherTile, now: float) -> bool:
+        return now - tile.updated_at > self.refresh_interval
+
+    async def _fetch_tile(self, tile: WeatherTile):
+        await self.rate_limiter.acquire()
+        await self._refresh_tile(tile)
+
+    async def _refresh_tile(self, tile: WeatherTile):
+        api = AsyncWeatherAPI(lat=tile.lat, lon=tile.lon)
+        weather, air_quality = await api.refresh_weather_and_air_data()
+        self.tile_refreshes.inc()
+        # Keep the previous values for anything that failed to refresh
+        if weather is not None:
+            tile.weather = weather
+        if air_quality is not None:
+            tile.air_quality = air_quality
+        if tile.weather is None:
+            tile.weather = await api.get_current_weather()
+        if tile.air_quality is None:
+            tile.air_quality = await api.get_air_quality()
+        tile.updated_at = time.monotonic()
+
+    def _schedule_refresh(self, tile: WeatherTile) -> asyncio.Task:
+        task = self._refreshing.get(tile.key)
+        if task is None or task.done():
+            task = asyncio.ensure_future(self._fetch_tile(tile))
+            self._refreshing[tile.key] = task
+            task.add_done_callback(lambda done, key=tile.key: self._forget_refresh(key, done))
+        return task
+
+    def _forget_refresh(self, key: TileKey, task: asyncio.Task):
+        if self._refreshing.get(key) is task:
+            del self._refreshing[key]
+
+    def version(self, lat: Optional[float] = None, lon: Optional[float] = None) -> Optional[float]:
+        """When the location's tile data last changed, or None if a read would have to fetch or refresh it"""
+        tile = self._tiles.get(self.tile_key(DEFAULT_LAT if lat is None else lat, DEFAULT_LON if lon is None else lon))
+        if tile is None or tile.weather is None or tile.air_quality is None:
+            return None
+        if self._is_stale(tile, time.monotonic()):
+            return None
+        self._touch(tile)
+        return tile.updated_at
+
+    async def get_tile(self, lat: Optional[float] = None, lon: Optional[float] = None) -> WeatherTile:
+        """Tile for a location, waiting for upstream only if it has never been fetched
+
+        A tile older than the refresh interval is served as is while a refresh
+        is scheduled, whether or not the background refresher is keeping up.
+        """
+        tile = self._get_or_create(DEFAULT_LAT if lat is None else lat, DEFAULT_LON if lon is None else lon)
+        self.tile_reads.inc()
+        if tile.weather is None or tile.air_quality is None:
+            await asyncio.shield(self._schedule_refresh(tile))
+        elif self._is_stale(tile, time.monotonic()):
+            self._schedule_refresh(tile)
+        return tile
+
+    async def get_weather(self, lat: Optional[float] = None, lon: Optional[float] = None) -> Dict[str, Any]:
+        return dict((await self.get_tile(lat, lon)).weather)
+
+    async def get_air_quality(self, lat: Optional[float] = None, lon: Optional[float] = None) -> Dict[str, Any]:
+        return dict((await self.get_tile(lat, lon)).air_quality)
+
+    async def get_combined(self, lat: Optional[float] = None, lon: Optional[float] = None) -> Dict[str, Any]:
+        return (await self.get_tile(lat, lon)).combined()
+
+    async def refresh_all(self):
+        """Refresh every active tile concurrently, dropping tiles that went idle"""
+        now = time.monotonic()
+        for key, tile in list(self._tiles.items()):
+            if now - tile.last_access > self.idle_timeout:
+                del self._tiles[key]
+                self._refreshing.pop(key, None)
+
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def refresh(tile: WeatherTile):
+            async with slots:
+                # Skip tiles evicted, or refreshed by a reader, while waiting their turn
+                if self._tiles.get(tile.key) is not tile:
+                    return
+                if time.monotonic() - tile.updated_at < self.refresh_interval / 2:
+                    return
+                try:
+                    await self._schedule_refresh(tile)
+                except Exception as e:
+                    logger.error(f"Error refreshing weather tile {tile.key}: {str(e)}")
+
+        await asyncio.gather(*[refresh(tile) for tile in list(self._tiles.values())])
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                await self.refresh_all()
+            except Exception as e:
+                logger.error(f"Weather tile refresh failed: {str(e)}")
+            await asyncio.sleep(max(1.0, self.refresh_interval - (time.monotonic() - started)))
+
+    def start(self):
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "tile_deg": self.tile_deg,
+            "refresh_interval_s": self.refresh_interval,
+            "active_tiles": len(self._tiles),
+            "max_tiles": self.max_tiles,
+            "tile_evictions": self.tile_evictions.value,
+            # Tiles the refresher can keep fresh per interval at the configured rate
+            "refresh_capacity_tiles": int(self.rate_limiter.rate * self.refresh_interval)
+            if self.rate_limiter.rate > 0 else None,
+            "refresh_backlog": sum(1 for tile in self._tiles.values() if self._is_stale(tile, now)),
+            "refreshing": len(self._refreshing),
+            "refresher_running": self._refresher is not None and not self._refresher.done(),
+            "tile_reads": self.tile_reads.value,
+            "tile_refreshes": self.tile_refreshes.value,
+            "oldest_tile_age_s": max((now - tile.updated_at for tile in self._tiles.values() if tile.updated_at),
+                                     default=None)
+        }
+
+
+# Shared tile table for all location-aware callers
+weather_tiles = WeatherTileService()
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from utils.metrics import registry
+from utils.sensor_snapshot import SnapshotBackend, set_path, split_path
+
+logger = logging.getLogger(__name__)
+
+# A batch is written once no new write arrived for this long...
+SENSOR_WRITE_DEBOUNCE_S = float(os.getenv("SENSOR_WRITE_DEBOUNCE_S", "0.05"))
+# ...or at the latest this long after its first write, however busy the slider
+SENSOR_WRITE_FLUSH_INTERVAL_S = float(os.getenv("SENSOR_WRITE_FLUSH_INTERVAL_S", "0.25"))
+
+
+class _Batch:
+    def __init__(self):
+        self.values: Dict[str, Any] = {}
+        # One (future, paths written by that caller) per write
+        self.acks: List[Tuple[asyncio.Future, List[str]]] = []
+        self.writes = 0
+        self.opened = time.monotonic()
+
+    def merge(self, path: str, value: Any) -> str:
+        """Add a write at ``path``, keeping the multi-path update free of overlapping paths.
+
+        A write to a path already covered by a pending ancestor is folded
+        into that ancestor's value; a write to an ancestor replaces the
+        pending writes below it. Later writes to the same path win. Returns
+        the normalized path.
+        """
+        keys = split_path(path)
+        for pending in list(self.values):
+            pending_keys = split_path(pending)
+            if keys[:len(pending_keys)] == pending_keys:
+                self.values[pending] = set_path(self.values[pending], keys[len(pending_keys):], value)
+                return "/".join(keys)
+            if pending_keys[:len(keys)] == keys:
+                del self.values[pending]
+        self.values["/".join(keys)] = value
+        return "/".join(keys)
+
+
+class WriteBatcher:
+    """Coalesces writes below ``root`` into one multi-path ``backend.update`` per flush.
+
+    ``write`` returns immediately with a future that resolves once the
+    batch holding the write was stored (or raises the backend's error); it
+    reports only the caller's own paths, not those of others in the batch. Batches
+    are written one at a time and in order, so a later value never gets
+    overwritten by an earlier one.
+    """
+
+    def __init__(self, backend: SnapshotBackend, root: str = "/", debounce: float = SENSOR_WRITE_DEBOUNCE_S,
+                 flush_interval: float = SENSOR_WRITE_FLUSH_INTERVAL_S):
+        self.backend = backend
+        self.root = "/" + "/".join(split_path(root))
+        self.debounce = debounce
+        self.flush_interval = max(debounce, flush_interval)
+        self._batch: Optional[_Batch] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self.last_flush: Optional[dict] = None
+
+        self.writes = registry.counter("sensor_writes_total", "Writes accepted by the write batcher")
+        self.coalesced = registry.counter("sensor_writes_coalesced_total", "Writes merged into an update with others")
+        self.flushes = registry.counter("sensor_write_flushes_total", "Multi-path updates sent to the backend")
+        self.failures = registry.counter("sensor_write_failures_total", "Multi-path updates the backend rejected")
+
+    def write(self, path: str, values: Dict[str, Any]) -> asyncio.Future:
+        """Queue ``values`` as children of ``path`` (relative to ``root``); must run on the event loop"""
+        if not values:
+            raise ValueError("Nothing to write")
+        if self._batch is None:
+            self._batch = _Batch()
+        batch = self._batch
+        paths = [batch.merge(f"{path}/{child}", value) for child, value in values.items()]
+        ack = asyncio.get_running_loop().create_future()
+        batch.acks.append((ack, paths))
+        batch.writes += 1
+        self.writes.inc()
+        self._ensure_running()
+        self._wakeup.set()
+        return ack
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # Wait for the writes to go quiet, but never past the flush interval
+            while self._batch is not None:
+                self._wakeup.clear()
+                remaining = self.flush_interval - (time.monotonic() - self._batch.opened)
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), min(self.debounce, remaining))
+                except asyncio.TimeoutError:
+                    break
+            self._wakeup.clear()
+            # Shielded so stopping mid-write doesn't orphan the batch's acks
+            await asyncio.shield(self.flush())
+
+    async def flush(self):
+        """Write the pending batch now"""
+        async with self._flush_lock:
+            batch, self._batch = self._batch, None
+            if batch is None:
+                return
+            start = time.perf_counter()
+            try:
+                await run_in_threadpool(self.backend.update, self.root, batch.values)
+            except Exception as e:
+                self.failures.inc()
+                logger.warning(f"Sensor write of {len(batch.values)} paths failed: {str(e)}")
+                for ack, _ in batch.acks:
+                    if not ack.done():
+                        ack.set_exception(e)
+                return
+
+            self.flushes.inc()
+            if batch.writes > 1:
+                self.coalesced.inc(batch.writes)
+            self.last_flush = {
+                "writes": batch.writes,
+                "paths": len(batch.values),
+                "seconds": time.perf_counter() - start
+            }
+            stored_at = time.time()
+            for ack, paths in batch.acks:
+                if not ack.done():
+                    ack.set_result({"writes_in_batch": batch.writes, "paths": sorted(paths), "at": stored_at})
+
+    async def close(self):
+        """Write whatever is pending and stop"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending_writes": self._batch.writes if self._batch is not None else 0,
+            "writes": self.writes.value,
+            "coalesced": self.coalesced.value,
+            "flushes": self.flushes.value,
+            "failures": self.failures.value,
+            "last_flush": self.last_flush
+        }